@@ -0,0 +1,106 @@
+"""
+Writing query results as Apache Parquet or Arrow IPC stream
+
+Used by `mara_db.shell.copy_to_stdout_command` for `formats.ParquetFormat` and `formats.ArrowFormat`:
+
+    echo 'SELECT ...' | MARA_DB_ARROW_EXPORT_DB='{...}' python -m mara_db.arrow_export --pipe-format '{...}' --batch-rows 100000
+
+The serialized database is read from the environment so that passwords do not show up in the process list.
+"""
+
+import argparse
+import os
+import sys
+import typing
+
+from mara_db import dbs, formats
+
+
+def export_query(db: typing.Union[str, dbs.DB], query: str, pipe_format: formats.Format,
+                 output: typing.BinaryIO = None, batch_rows: int = 100000) -> int:
+    """
+    Runs a query and writes the result to `output` in a columnar format.
+
+    Rows are fetched in batches (see `dbs.iter_record_batches`) and each batch is written as a Parquet
+    row group or an Arrow IPC record batch before the next one is fetched, so that only one batch is held
+    in memory. Column types come from the cursor description where the database driver provides them,
+    otherwise from the values of the first batch (columns that are NULL there become strings).
+
+    Args:
+        db: The database in which to run the query (either an alias or a `dbs.DB` object)
+        query: The query to run
+        pipe_format: `formats.ParquetFormat` or `formats.ArrowFormat`
+        output: Where to write the result, defaults to stdout
+        batch_rows: The number of rows per row group / record batch
+
+    Returns:
+        The number of exported rows
+    """
+    import pyarrow
+
+    if not isinstance(pipe_format, (formats.ParquetFormat, formats.ArrowFormat)):
+        raise ValueError(f'Unsupported pipe_format for Arrow export: {pipe_format}')
+    if output is None:
+        output = sys.stdout.buffer
+
+    writer, schema = None, None
+    row_count = 0
+    try:
+        for batch in dbs.iter_record_batches(db, query, batch_rows=batch_rows):
+            if writer is None:
+                # the writers need a fixed schema, columns without a type are written as strings
+                schema = pyarrow.schema([field.with_type(pyarrow.string()) if field.type == pyarrow.null() else field
+                                         for field in batch.schema])
+                writer = _writer(output, schema, pipe_format)
+            table = pyarrow.Table.from_batches([batch])
+            if table.schema != schema:
+                try:
+                    table = table.cast(schema)
+                except (pyarrow.ArrowInvalid, pyarrow.ArrowNotImplementedError) as e:
+                    raise ValueError(f'Column types changed between batches, from {schema} to {table.schema}') from e
+            if isinstance(pipe_format, formats.ParquetFormat):
+                writer.write_table(table, row_group_size=batch_rows)
+            else:
+                writer.write_table(table, max_chunksize=batch_rows)
+            row_count += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    output.flush()
+    return row_count
+
+
+def _writer(output: typing.BinaryIO, schema: 'pyarrow.Schema', pipe_format: formats.Format) -> object:
+    if isinstance(pipe_format, formats.ParquetFormat):
+        import pyarrow.parquet
+        return pyarrow.parquet.ParquetWriter(output, schema)
+    else:
+        import pyarrow.ipc
+        return pyarrow.ipc.new_stream(output, schema)
+
+
+def main():
+    from .bigquery_export import _deserialize
+    from .sql_lexer import first_statement
+
+    parser = argparse.ArgumentParser(description='Runs a query from stdin and writes the result as Parquet or Arrow to stdout')
+    parser.add_argument('--pipe-format', required=True, help='A serialized `mara_db.formats.Format`')
+    parser.add_argument('--batch-rows', type=int, default=100000, help='The number of rows per row group / batch')
+    args = parser.parse_args()
+    if not os.environ.get('MARA_DB_ARROW_EXPORT_DB'):
+        parser.error('The environment variable MARA_DB_ARROW_EXPORT_DB with a serialized `mara_db.dbs.DB` is required')
+
+    try:
+        export_query(db=_deserialize(os.environ['MARA_DB_ARROW_EXPORT_DB'], dbs, dbs.DB),
+                     query=first_statement(sys.stdin.read()),
+                     pipe_format=_deserialize(args.pipe_format, formats, formats.ParquetFormat),
+                     output=open(sys.stdout.fileno(), 'wb', closefd=False),
+                     batch_rows=args.batch_rows)
+    except BrokenPipeError:
+        # the next stage of the pipeline stopped reading, it reports the error
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
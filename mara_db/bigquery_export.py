@@ -0,0 +1,150 @@
+"""
+Exporting query results from BigQuery with parallel streams of the BigQuery Storage Read API
+
+Used by `mara_db.shell.copy_to_stdout_command` when `storage_read_streams` is set for a `dbs.BigQueryDB`:
+
+    echo 'SELECT ...' | python -m mara_db.bigquery_export --db '{...}' --pipe-format '{...}' --streams 4
+"""
+
+import argparse
+import concurrent.futures
+import csv
+import io
+import json
+import sys
+import threading
+import typing
+
+from mara_db import dbs, formats
+
+
+def export_query(db: typing.Union[str, dbs.BigQueryDB], query: str, pipe_format: formats.Format = None,
+                 stream_count: int = 4, output: typing.BinaryIO = None,
+                 client: 'google.cloud.bigquery.client.Client' = None,
+                 read_client: 'google.cloud.bigquery_storage.BigQueryReadClient' = None) -> int:
+    """
+    Runs a query in BigQuery and writes the result to `output`, reading the result table with
+    parallel streams of the Storage Read API in Arrow format.
+
+    Rows are written in the order in which they arrive from the streams, an `ORDER BY` of the query
+    is only kept with `stream_count=1`.
+
+    Args:
+        db: The database in which to run the query (either an alias or a `dbs.BigQueryDB` object)
+        query: The query to run
+        pipe_format: The output format, `formats.CsvFormat`, `formats.JsonlFormat` or `formats.NativeFormat` (CSV)
+        stream_count: The maximum number of streams that are read at the same time
+        output: Where to write the result, defaults to stdout
+        client: The BigQuery client to use for running the query, defaults to `bigquery.bigquery_client(db)`
+        read_client: The Storage Read API client, defaults to a client with the credentials of `db`
+
+    Returns:
+        The number of exported rows
+    """
+    if isinstance(db, str):
+        db = dbs.db(db)
+    if pipe_format is None:
+        pipe_format = formats.NativeFormat()
+    if not isinstance(pipe_format, (formats.CsvFormat, formats.JsonlFormat, formats.NativeFormat)):
+        raise ValueError(f'Unsupported pipe_format for BigQuery storage export: {pipe_format}')
+    if output is None:
+        output = sys.stdout.buffer
+
+    if client is None:
+        from .bigquery import bigquery_client
+        client = bigquery_client(db)
+    if read_client is None:
+        from google.cloud import bigquery_storage
+        from .bigquery import bigquery_credentials
+        read_client = bigquery_storage.BigQueryReadClient(credentials=bigquery_credentials(db))
+
+    query_job = client.query(query)
+    result = query_job.result()
+    columns = [field.name for field in result.schema]
+    table = query_job.destination
+
+    session = _create_read_session(read_client, table, stream_count)
+
+    if isinstance(pipe_format, formats.CsvFormat) and pipe_format.header:
+        output.write(_format_rows([columns], pipe_format))
+
+    lock = threading.Lock()
+    row_counts = []
+
+    def read_stream(stream_name: str):
+        row_count = 0
+        for page in read_client.read_rows(stream_name).rows(session).pages:
+            batch = page.to_arrow()
+            data = _format_rows(zip(*[column.to_pylist() for column in batch.columns]), pipe_format,
+                                columns=columns)
+            with lock:
+                output.write(data)
+            row_count += batch.num_rows
+        row_counts.append(row_count)
+
+    streams = [stream.name for stream in session.streams]
+    if streams:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(streams),
+                                                   thread_name_prefix='mara-db-bigquery-export') as executor:
+            for future in [executor.submit(read_stream, stream) for stream in streams]:
+                future.result()
+    output.flush()
+    return sum(row_counts)
+
+
+def _create_read_session(read_client: object, table: object, stream_count: int) -> object:
+    """Creates a Storage Read API session for an Arrow export of a table"""
+    from google.cloud.bigquery_storage import types
+
+    table_path = f'projects/{table.project}/datasets/{table.dataset_id}/tables/{table.table_id}'
+    return read_client.create_read_session(
+        parent=f'projects/{table.project}',
+        read_session=types.ReadSession(table=table_path, data_format=types.DataFormat.ARROW),
+        max_stream_count=stream_count)
+
+
+def _format_rows(rows: typing.Iterable[typing.Sequence], pipe_format: formats.Format,
+                 columns: typing.List[str] = None) -> bytes:
+    """Serializes rows in a pipe format"""
+    buffer = io.StringIO()
+    if isinstance(pipe_format, formats.JsonlFormat):
+        for row in rows:
+            buffer.write(json.dumps(dict(zip(columns, row)), default=str, ensure_ascii=False))
+            buffer.write('\n')
+    else:
+        csv_format = pipe_format if isinstance(pipe_format, formats.CsvFormat) else formats.CsvFormat()
+        writer = csv.writer(buffer, delimiter=csv_format.delimiter_char, quotechar=csv_format.quote_char or '"',
+                            lineterminator='\n')
+        null_value = csv_format.null_value_string or ''
+        for row in rows:
+            writer.writerow([null_value if value is None else value for value in row])
+    return buffer.getvalue().encode()
+
+
+def _serialize(obj: object) -> str:
+    """Serializes a `dbs.DB` or `formats.Format` object for the command line"""
+    return json.dumps({'class': obj.__class__.__name__, 'attributes': vars(obj)}, default=str)
+
+
+def _deserialize(serialized: str, module: object, default_class: type) -> object:
+    data = json.loads(serialized)
+    obj = object.__new__(getattr(module, data['class'], default_class))
+    obj.__dict__.update(data['attributes'])
+    return obj
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs a query from stdin in BigQuery and writes the result to stdout')
+    parser.add_argument('--db', required=True, help='A serialized `mara_db.dbs.BigQueryDB`')
+    parser.add_argument('--pipe-format', help='A serialized `mara_db.formats.Format`')
+    parser.add_argument('--streams', type=int, default=4, help='The maximum number of parallel read streams')
+    args = parser.parse_args()
+
+    export_query(db=_deserialize(args.db, dbs, dbs.BigQueryDB),
+                 query=sys.stdin.read(),
+                 pipe_format=_deserialize(args.pipe_format, formats, formats.NativeFormat) if args.pipe_format else None,
+                 stream_count=args.streams)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,11 +4,27 @@ import typing
 from mara_db import dbs
 
 
-def databases() -> typing.Dict[str, dbs.DB]:
-    """The list of database connections to use, by alias"""
+def databases() -> typing.Dict[str, typing.Union[dbs.DB, typing.Callable[[], dbs.DB]]]:
+    """
+    The list of database connections to use, by alias
+
+    Instead of a `dbs.DB` object, a function without arguments returning one can be given (e.g. when
+    credentials need to be read first). It is called only when the alias is used.
+
+    Example:
+        return {'dwh': lambda: dbs.PostgreSQLDB(host='localhost', database='dwh', password=read_secret('dwh'))}
+    """
     return {}
 
 
+def database_cache_ttl() -> typing.Optional[float]:
+    """
+    Seconds after which a resolved database configuration is resolved again, e.g. to pick up rotated credentials.
+    None means that configurations are cached until `mara_db.dbs.invalidate` is called.
+    """
+    return None
+
+
 def default_timezone() -> str:
     """
     The default timezone to be used for database connections
@@ -24,6 +40,113 @@ def default_echo_queries() -> bool:
     return True
 
 
+def connection_pooling() -> bool:
+    """
+    If connections opened with `mara_db.dbs.connect` and `mara_db.dbs.cursor_context` shall be taken from a
+    connection pool per database instead of opening (and closing) a new connection each time
+    """
+    return False
+
+
+def connection_pool_min_size() -> int:
+    """The number of connections per database that are kept open even when they are idle"""
+    return 0
+
+
+def connection_pool_max_size() -> int:
+    """The maximum number of connections per database that can be in use at the same time"""
+    return 10
+
+
+def connection_pool_max_idle_time() -> float:
+    """Seconds after which an idle pooled connection is closed"""
+    return 300
+
+
+def connection_pool_checkout_timeout() -> float:
+    """Seconds to wait for a free connection when all connections of a pool are in use"""
+    return 30
+
+
+def connection_pool_pre_ping() -> bool:
+    """If pooled connections shall be checked for liveness (with a `SELECT 1`) before they are handed out"""
+    return True
+
+
+def sqlalchemy_pool_size() -> int:
+    """The number of connections kept open in the pool of a SQLAlchemy engine (see `mara_db.sqlalchemy_engine.engine`)"""
+    return 5
+
+
+def sqlalchemy_max_overflow() -> int:
+    """The number of connections that a SQLAlchemy engine may open in addition to `sqlalchemy_pool_size`"""
+    return 10
+
+
+def sqlalchemy_pool_recycle() -> int:
+    """Seconds after which a connection of a SQLAlchemy engine is replaced by a new one. -1 means never"""
+    return -1
+
+
+def sqlalchemy_pool_pre_ping() -> bool:
+    """If connections of a SQLAlchemy engine shall be tested for liveness when they are taken from the pool"""
+    return True
+
+
+def query_cache_max_bytes() -> int:
+    """The maximum size (of the pickled results) that `mara_db.query_cache` keeps in memory"""
+    return 64 * 1024 * 1024
+
+
+def query_cache_ttl() -> float:
+    """Seconds after which a result cached by `mara_db.query_cache.fetchall` expires"""
+    return 300
+
+
+def query_cache_file_name() -> typing.Optional[str]:
+    """A SQLite file to which query results evicted from memory are spilled. None means no disk cache"""
+    return None
+
+
+def copy_metering() -> bool:
+    """
+    If `mara_db.shell.copy_command` shall insert a stage between source and target that counts bytes and rows
+    and reports the throughput periodically (see `mara_db.metering`)
+    """
+    return False
+
+
+def copy_metering_interval() -> float:
+    """Seconds between two throughput reports of a copy command"""
+    return 60
+
+
+def copy_metering_stats_file() -> typing.Optional[str]:
+    """
+    A file which is overwritten with the throughput statistics (as JSON) of a copy command, `{target_table}`
+    is replaced with the name of the target table. None means that reports are written to stderr.
+    """
+    return None
+
+
+def incremental_state_db() -> typing.Union[str, dbs.DB]:
+    """The database (alias or `dbs.DB` object) in which the watermarks of incremental copies are stored"""
+    return 'mara'
+
+
+def incremental_state_table() -> str:
+    """The table in which the watermarks of incremental copies are stored (created when missing)"""
+    return 'mara_db_copy_watermark'
+
+
+def arrow_export_batch_rows() -> int:
+    """
+    The number of rows per Parquet row group or Arrow IPC batch when `mara_db.shell.copy_to_stdout_command`
+    writes columnar formats (bounds the memory use of the export)
+    """
+    return 100000
+
+
 def schema_ui_foreign_key_column_regex() -> typing.Pattern:
     """A regex that classifies a table column as being used in a foreign constraint (for coloring missing constraints)"""
     return r'.*_fk$'
@@ -0,0 +1,127 @@
+"""Copying query results between databases within the Python process, without shell pipelines"""
+
+import os
+import sys
+import threading
+import time
+import typing
+
+from multimethod import multidispatch
+
+from mara_db import dbs, sql_lexer
+
+# bytes read from / written to the pipe between source and target per call of a `COPY` api
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+@multidispatch
+def copy(source_db: object, target_db: object, target_table: str, query: str, batch_rows: int = 10000) -> int:
+    """
+    Runs a query in `source_db` and writes its result to `target_table` in `target_db`.
+
+    This is the in-process counterpart of `mara_db.shell.copy_command`: rows are streamed from a server side
+    cursor (or the `COPY` api of the source) directly into the bulk loading api of the target
+    (see `dbs.bulk_insert`), without starting any client programs. Errors are raised as Python exceptions and
+    the target table is written in a single transaction. The throughput is reported on stderr.
+
+    Args:
+        source_db: The database in which to run the query (either an alias or a `dbs.DB` object)
+        target_db: The database where to write the query results (alias or db configuration)
+        target_table: The table in which to write the query results. The columns of the query result
+                      must have the same names as the columns of the table.
+        query: The query to run in `source_db`
+        batch_rows: The number of rows fetched from the source / sent to the target per round trip
+
+    Returns:
+        The number of copied rows
+
+    Example:
+        >>> copy('crm', 'dwh', 'crm_data.order', 'SELECT order_id, customer_id FROM orders')
+        120000
+    """
+    return _copy_rows(source_db, target_db, target_table, query, batch_rows)
+
+
+@copy.register(str, str)
+def __(source_db_alias: str, target_db_alias: str, target_table: str, query: str, batch_rows: int = 10000) -> int:
+    return copy(dbs.db(source_db_alias), dbs.db(target_db_alias), target_table, query, batch_rows)
+
+
+@copy.register(dbs.DB, str)
+def __(source_db: dbs.DB, target_db_alias: str, target_table: str, query: str, batch_rows: int = 10000) -> int:
+    return copy(source_db, dbs.db(target_db_alias), target_table, query, batch_rows)
+
+
+@copy.register(str, dbs.DB)
+def __(source_db_alias: str, target_db: dbs.DB, target_table: str, query: str, batch_rows: int = 10000) -> int:
+    return copy(dbs.db(source_db_alias), target_db, target_table, query, batch_rows)
+
+
+@copy.register(dbs.PostgreSQLDB, dbs.PostgreSQLDB)
+def __(source_db: dbs.PostgreSQLDB, target_db: dbs.PostgreSQLDB, target_table: str, query: str,
+       batch_rows: int = 10000) -> int:
+    if isinstance(source_db, dbs.RedshiftDB) or isinstance(target_db, dbs.RedshiftDB):
+        # Redshift supports neither COPY TO STDOUT nor COPY FROM STDIN
+        return _copy_rows(source_db, target_db, target_table, query, batch_rows)
+
+    # `COPY ... TO STDOUT` of the source is piped into `COPY ... FROM STDIN` of the target
+    query = sql_lexer.subquery(query)
+    start_time = time.monotonic()
+
+    # the columns of the target are given by name, as in `_copy_rows`
+    with dbs.cursor_context(source_db) as cursor:
+        cursor.execute(f'SELECT * FROM ({query}) copy_source LIMIT 0')
+        columns = [column[0] for column in cursor.description]
+
+    read_fd, write_fd = os.pipe()
+    source_errors = []
+
+    def copy_to_pipe():
+        try:
+            with open(write_fd, 'wb', buffering=COPY_BUFFER_SIZE) as pipe, dbs.cursor_context(source_db) as cursor:
+                cursor.copy_expert(f'COPY ({query}) TO STDOUT', pipe, size=COPY_BUFFER_SIZE)
+        except BaseException as e:
+            source_errors.append(e)
+
+    source_thread = threading.Thread(target=copy_to_pipe, name='mara-db-copy-source', daemon=True)
+    source_thread.start()
+
+    try:
+        with open(read_fd, 'rb', buffering=COPY_BUFFER_SIZE) as pipe:
+            with dbs.cursor_context(target_db) as cursor:
+                try:
+                    cursor.copy_expert(f'COPY {target_table} ({", ".join(columns)}) FROM STDIN', pipe,
+                                       size=COPY_BUFFER_SIZE)
+                finally:
+                    # makes the source fail with a broken pipe when the target stopped reading
+                    pipe.close()
+                    source_thread.join()
+                if source_errors:
+                    # rolls back the target transaction instead of committing a partial copy
+                    raise source_errors[0]
+                row_count = cursor.rowcount
+    finally:
+        source_thread.join()
+
+    seconds = time.monotonic() - start_time
+    # stdout might be the data stream of a pipeline
+    print(f'{row_count} rows copied into {target_table} in {seconds:.1f} seconds'
+          + (f' ({row_count / seconds:.0f} rows/s)' if seconds else ''), file=sys.stderr)
+    return row_count
+
+
+def _copy_rows(source_db: dbs.DB, target_db: dbs.DB, target_table: str, query: str, batch_rows: int) -> int:
+    """Streams the rows of a query from a server side cursor into `dbs.bulk_insert`"""
+    with dbs.cursor_context(source_db, streaming=True, batch_size=batch_rows) as cursor:
+        cursor.execute(query)
+        # the description of a psycopg2 server side cursor is available only after the first fetch
+        first_batch = cursor.fetchmany(batch_rows)
+        columns = [column[0] for column in cursor.description]
+
+        def rows() -> typing.Iterator[tuple]:
+            batch = first_batch
+            while batch:
+                yield from batch
+                batch = cursor.fetchmany(batch_rows)
+
+        return dbs.bulk_insert(target_db, target_table, rows(), columns, batch_size=batch_rows)
@@ -2,18 +2,86 @@
 
 import contextlib
 import functools
+import inspect
 import pathlib
-from typing import Union
+import sys
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List, Sequence, Union
 
 
-@functools.lru_cache(maxsize=None)
 def db(alias):
-    """Returns a database configuration by alias"""
+    """
+    Returns a database configuration by alias
+
+    Only the requested alias is resolved: when the configuration in `mara_db.config.databases` is a
+    function, it is called on the first lookup of the alias. The result is cached until `invalidate`
+    is called or, when configured, `mara_db.config.database_cache_ttl` seconds have passed.
+    """
+    with _registry_lock:
+        entry = _registry.get(alias)
+        if entry is not None:
+            db, expires_at = entry
+            if expires_at is None or time.monotonic() < expires_at:
+                return db
+
     from . import config
     databases = config.databases()
     if alias not in databases:
         raise KeyError(f'database alias "{alias}" not configured')
-    return databases[alias]
+    db = databases[alias]
+    if callable(db) and not isinstance(db, DB):
+        db = db()
+
+    ttl = config.database_cache_ttl()
+    with _registry_lock:
+        previous_entry = _registry.get(alias)
+        _registry[alias] = (db, time.monotonic() + ttl if ttl is not None else None)
+    from . import pool
+    if previous_entry is not None and pool._cache_key(previous_entry[0]) != pool._cache_key(db):
+        # the configuration changed, e.g. rotated credentials
+        _release(previous_entry[0])
+    return db
+
+
+def aliases() -> List[str]:
+    """Returns the aliases of all configured databases without resolving their configuration"""
+    from . import config
+    return list(config.databases().keys())
+
+
+def invalidate(alias: str = None):
+    """
+    Removes a resolved database configuration from the cache, e.g. after credentials were rotated.
+    Connection pools and SQLAlchemy engines of the previous configuration are disposed.
+
+    Args:
+        alias: The database alias. When not given, all cached configurations are removed.
+    """
+    with _registry_lock:
+        if alias is not None:
+            entries = [_registry.pop(alias)] if alias in _registry else []
+        else:
+            entries = list(_registry.values())
+            _registry.clear()
+    for db, _ in entries:
+        _release(db)
+
+
+# for backwards compatibility, `db` used to be a `functools.lru_cache`
+db.cache_clear = invalidate
+
+_registry = {}  # resolved database configurations and the time when they expire, by alias
+_registry_lock = threading.Lock()
+
+
+def _release(db: 'DB'):
+    """Disposes connection pools and SQLAlchemy engines of a database configuration that is not used anymore"""
+    from . import pool
+    pool.dispose(db)
+    sqlalchemy_engine = sys.modules.get('mara_db.sqlalchemy_engine')
+    if sqlalchemy_engine:
+        sqlalchemy_engine.invalidate(db)
 
 
 class DB:
@@ -60,16 +128,23 @@ class PostgreSQLDB(DB):
 class RedshiftDB(PostgreSQLDB):
     def __init__(self, host: str = None, port: int = None, database: str = None,
                  user: str = None, password: str = None,
-                 aws_access_key_id=None, aws_secret_access_key=None, aws_s3_bucket_name=None):
+                 aws_access_key_id=None, aws_secret_access_key=None, aws_s3_bucket_name=None,
+                 copy_file_count: int = None):
         """
         Connection information for a RedShift database
 
         The aws_* parameters are for copying to Redshift from stdin via an s3 bucket
         (requires the https://pypi.org/project/awscli/) package to be installed)
+
+        Args:
+            copy_file_count: When set, data copied from stdin is split line wise into this many files which are
+                uploaded concurrently and loaded with a manifest, so that all slices of the cluster take part in
+                the load. Should be a multiple of the number of slices. Requires that values do not contain line breaks.
         """
         self.aws_access_key_id = aws_access_key_id
         self.aws_secret_access_key = aws_secret_access_key
         self.aws_s3_bucket_name = aws_s3_bucket_name
+        self.copy_file_count = copy_file_count
         super(RedshiftDB, self).__init__(host, port, database, user, password)
 
 
@@ -77,7 +152,8 @@ class BigQueryDB(DB):
     def __init__(self,
                  service_account_json_file_name: str,
                  location: str = None, project: str = None, dataset: str = None,
-                 gcloud_gcs_bucket_name=None, use_legacy_sql: bool = False):
+                 gcloud_gcs_bucket_name=None, use_legacy_sql: bool = False, storage_read_streams: int = None,
+                 gcs_upload_chunk_size: int = None, gcs_upload_parallelism: int = 4):
         """
         Connection information for a BigQueryDB database
 
@@ -91,6 +167,12 @@ class BigQueryDB(DB):
             dataset: Default dataset to use for requests.
             gcloud_gcs_bucket_name: The Google Cloud Storage bucked used as cache for loading data
             use_legacy_sql: (default: false) If true, use the old BigQuery SQL dialect is used.
+            storage_read_streams: When set, query results are copied to stdout by reading the result table with
+                this many parallel streams of the BigQuery Storage Read API instead of with `bq query`
+                (see `mara_db.bigquery_export`). Requires the `google-cloud-bigquery-storage` and `pyarrow` packages.
+            gcs_upload_chunk_size: When set, CSV and JSON data copied from stdin is uploaded to Google Cloud Storage
+                in objects of at most this many bytes (see `mara_db.gcs_upload`) and loaded with one load job
+            gcs_upload_parallelism: The maximum number of concurrent uploads when `gcs_upload_chunk_size` is set
         """
         self.service_account_json_file_name = service_account_json_file_name
         self.location = location
@@ -98,6 +180,9 @@ class BigQueryDB(DB):
         self.dataset = dataset
         self.gcloud_gcs_bucket_name = gcloud_gcs_bucket_name
         self.use_legacy_sql = use_legacy_sql
+        self.storage_read_streams = storage_read_streams
+        self.gcs_upload_chunk_size = gcs_upload_chunk_size
+        self.gcs_upload_parallelism = gcs_upload_parallelism
 
     @property
     def sqlalchemy_url(self):
@@ -173,7 +258,8 @@ class SqlcmdSQLServerDB(SQLServerDB):
     def __init__(self, host: str = None, instance: str = None, port: int = None, database: str = None,
                  user: str = None, password: str = None, odbc_driver: str = None,
                  protocol: str = None, quoted_identifier: bool = True,
-                 trust_server_certificate: bool = False):
+                 trust_server_certificate: bool = False, bcp_streaming: bool = False, bcp_parallelism: int = 1,
+                 bcp_batch_size: int = None, bcp_packet_size: int = None):
         """
         Connection information for a SQL Server database using the MSSQL Tools e.g. sqlcmd
 
@@ -182,6 +268,13 @@ class SqlcmdSQLServerDB(SQLServerDB):
             protocol: can be tcp (TCP/IP connection), np (named pipe) or lcp (using shared memory).
                       See as well: https://docs.microsoft.com/en-us/sql/ssms/scripting/sqlcmd-connect-to-the-database-engine?view=sql-server-ver15
             trust_server_certificate: Trust the server certificate without validation
+            bcp_streaming: When true, `bcp` loads data copied from stdin through a named pipe while it is received,
+                           instead of from a temporary file with all data
+            bcp_parallelism: When greater than 1, data copied from stdin is split into that many named pipes which
+                             are loaded by concurrent `bcp` processes with a bulk update lock (`-h TABLOCK`).
+                             Implies `bcp_streaming`.
+            bcp_batch_size: The number of rows per transaction of `bcp` (`-b`). Default: all rows in one transaction.
+            bcp_packet_size: The network packet size in bytes of `bcp` (`-a`)
         """
         super().__init__(host=host, port=port, database=database, user=user, password=password, odbc_driver=odbc_driver)
         if protocol:
@@ -197,6 +290,10 @@ class SqlcmdSQLServerDB(SQLServerDB):
         self.quoted_identifier = quoted_identifier
         self.instance = instance
         self.trust_server_certificate = trust_server_certificate
+        self.bcp_streaming = bcp_streaming
+        self.bcp_parallelism = bcp_parallelism
+        self.bcp_batch_size = bcp_batch_size
+        self.bcp_packet_size = bcp_packet_size
 
     @property
     def sqlalchemy_url(self):
@@ -296,7 +393,56 @@ def __(alias: str, **kargs) -> object:
     return connect(db(alias), **kargs)
 
 
+def _instrumented(connect_function):
+    """
+    Decorator for `connect` implementations: emits 'connect' and 'error' events to the listeners
+    registered in `mara_db.instrumentation`
+    """
+    @functools.wraps(connect_function)
+    def wrapper(db, **kargs):
+        from . import instrumentation
+        if not instrumentation.listeners:
+            return connect_function(db, **kargs)
+
+        start_time = time.monotonic()
+        try:
+            connection = connect_function(db, **kargs)
+        except Exception as e:
+            instrumentation.emit(instrumentation.Event('error', instrumentation.alias_of(db),
+                                                       duration=time.monotonic() - start_time, error=e))
+            raise
+        instrumentation.emit(instrumentation.Event('connect', instrumentation.alias_of(db),
+                                                   duration=time.monotonic() - start_time))
+        return connection
+
+    return wrapper
+
+
+def _poolable(connect_function):
+    """
+    Decorator for `connect` implementations: when connection pooling is enabled in `mara_db.config`, the
+    connection is taken from the connection pool of the database. Closing it returns it to the pool.
+
+    Pass `pooled=False` (or `True`) to `connect` to override the configuration.
+    """
+    @functools.wraps(connect_function)
+    def wrapper(db, pooled: bool = None, **kargs):
+        if pooled is None:
+            from . import config
+            pooled = config.connection_pooling()
+        if not pooled or kargs:
+            # connections opened with special arguments are not shared
+            return connect_function(db, **kargs)
+
+        from . import pool
+        return pool.connection_pool(db, functools.partial(connect_function, db)).checkout()
+
+    return wrapper
+
+
 @connect.register(PostgreSQLDB)
+@_instrumented
+@_poolable
 def __(db, **kargs) -> 'psycopg2.extensions.cursor':
     import psycopg2
     return psycopg2.connect(dbname=db.database, user=db.user, password=db.password,
@@ -304,6 +450,7 @@ def __(db, **kargs) -> 'psycopg2.extensions.cursor':
 
 
 @connect.register(BigQueryDB)
+@_instrumented
 def __(db, **kargs) -> object:
     from google.oauth2.service_account import Credentials
     from google.cloud.bigquery.client import Client
@@ -314,6 +461,8 @@ def __(db, **kargs) -> object:
 
 
 @connect.register(MysqlDB)
+@_instrumented
+@_poolable
 def __(db, **kargs) -> 'MySQLdb.cursors.Cursor':
     import MySQLdb.cursors # requires https://github.com/PyMySQL/mysqlclient-python
     return MySQLdb.connect(
@@ -322,6 +471,8 @@ def __(db, **kargs) -> 'MySQLdb.cursors.Cursor':
 
 
 @connect.register(SQLServerDB)
+@_instrumented
+@_poolable
 def __(db, **kargs) -> 'pyodbc.Cursor':
     import pyodbc # requires https://github.com/mkleehammer/pyodbc/wiki/Install
     server = db.host
@@ -332,12 +483,15 @@ def __(db, **kargs) -> 'pyodbc.Cursor':
 
 
 @connect.register(SQLiteDB)
+@_instrumented
 def __(db, **kargs) -> 'sqlite3.Connection':
     import sqlite3
     return sqlite3.connect(database=db.file_name)
 
 
 @connect.register(DatabricksDB)
+@_instrumented
+@_poolable
 def __(db, **kargs) -> object:
     from databricks_dbapi import odbc
     return odbc.connect(
@@ -348,24 +502,542 @@ def __(db, **kargs) -> object:
 
 
 
+@functools.singledispatch
+def streaming_cursor(db: object, connection: object, batch_size: int = 10000) -> object:
+    """
+    Creates a cursor which streams the result of a query from the server in batches instead of loading
+    the whole result into memory on execution.
+
+    The default implementation relies on the driver fetching rows lazily (e.g. pyodbc, sqlite3) and sets
+    the `arraysize` of the cursor to `batch_size`.
+
+    Args:
+        db: The database of the connection (either an alias or a `dbs.DB` object)
+        connection: A connection returned by `connect`
+        batch_size: The number of rows to be fetched per round trip
+    """
+    cursor = connection.cursor()
+    cursor.arraysize = batch_size
+    return cursor
+
+
+@streaming_cursor.register(str)
+def __(alias: str, connection: object, batch_size: int = 10000) -> object:
+    return streaming_cursor(db(alias), connection, batch_size)
+
+
+@streaming_cursor.register(PostgreSQLDB)
+def __(db, connection, batch_size: int = 10000) -> 'psycopg2.extensions.cursor':
+    import uuid
+    # a named cursor is a server side cursor in psycopg2
+    cursor = connection.cursor(name=f'mara_{uuid.uuid4().hex}')
+    cursor.itersize = batch_size
+    cursor.arraysize = batch_size
+    return cursor
+
+
+@streaming_cursor.register(MysqlDB)
+def __(db, connection, batch_size: int = 10000) -> 'MySQLdb.cursors.SSCursor':
+    import MySQLdb.cursors
+    cursor = connection.cursor(MySQLdb.cursors.SSCursor)
+    cursor.arraysize = batch_size
+    return cursor
+
+
 @contextlib.contextmanager
-def cursor_context(db: Union[str, DB]) -> object:
+def cursor_context(db: Union[str, DB], streaming: bool = False, batch_size: int = 10000) -> object:
     """
     A single iteration with a cursor context. When the iteration is
     closed, a commit is executed on the cursor.
 
+    When connection pooling is enabled (see `mara_db.config.connection_pooling`), the
+    connection is taken from and returned to the connection pool of the database.
+
+    Args:
+        db: The database (either an alias or a `dbs.DB` object)
+        streaming: When true, a server side cursor is used (see `streaming_cursor`). Query results
+                   are then not loaded into memory at once but fetched in batches of `batch_size` rows.
+        batch_size: The number of rows fetched per round trip by a streaming cursor
+
     Example usage:
         with db.cursor_context() as c:
             c.execute('UPDATE table SET table.c1 = 1 WHERE table.id = 5')
     """
+    from . import instrumentation
     connection = connect(db)
+    cursor = None
     try:
-        cursor = connection.cursor()
+        cursor = streaming_cursor(db, connection, batch_size) if streaming else connection.cursor()
+        if instrumentation.listeners:
+            cursor = instrumentation.InstrumentedCursor(cursor, instrumentation.alias_of(db))
         yield cursor
         connection.commit()
     except Exception:
         connection.rollback()
         raise
     finally:
-        cursor.close()
+        if cursor is not None:
+            cursor.close()
         connection.close()
+
+
+def iter_row_batches(db: Union[str, DB], query: str, parameters: object = None,
+                     batch_rows: int = 10000) -> Iterator[list]:
+    """
+    Executes a query and yields the result rows in lists of (at most) `batch_rows` rows.
+
+    A streaming cursor is used, so that only one batch is held in memory at a time.
+
+    Args:
+        db: The database in which to run the query (either an alias or a `dbs.DB` object)
+        query: The query to execute
+        parameters: Optional query parameters, in the parameter style of the database driver
+        batch_rows: The maximum number of rows per batch
+
+    Example usage:
+        for rows in dbs.iter_row_batches('dwh', 'SELECT * FROM huge_table'):
+            process(rows)
+    """
+    with cursor_context(db, streaming=True, batch_size=batch_rows) as cursor:
+        if parameters is None:
+            cursor.execute(query)
+        else:
+            cursor.execute(query, parameters)
+        while True:
+            rows = cursor.fetchmany(batch_rows)
+            if not rows:
+                break
+            yield rows
+
+
+@functools.singledispatch
+def bulk_insert(db: object, table: str, rows: Iterable[Sequence], columns: List[str],
+                batch_size: int = 10000) -> int:
+    """
+    Inserts rows from a Python iterable into a table using the fastest bulk loading API of the database driver.
+
+    All rows are inserted in a single transaction. The iterable is consumed in batches of `batch_size`
+    rows, so that only one batch is held in memory at a time. The throughput is reported on stderr.
+
+    Args:
+        db: The database to write to (either an alias or a `dbs.DB` object)
+        table: The (optionally schema qualified) table to insert into
+        rows: An iterable of rows, each row a sequence of values in the order of `columns`
+        columns: The column names
+        batch_size: The number of rows sent to the database per round trip
+
+    Returns:
+        The number of inserted rows
+
+    Example:
+        >>> bulk_insert('dwh', 'public.numbers', ((n, str(n)) for n in range(1000000)), ['n', 'label'])
+        1000000
+    """
+    raise NotImplementedError(f'Please implement bulk_insert for type "{db.__class__.__name__}"')
+
+
+@bulk_insert.register(str)
+def __(alias: str, table: str, rows: Iterable[Sequence], columns: List[str], batch_size: int = 10000) -> int:
+    return bulk_insert(db(alias), table, rows, columns, batch_size)
+
+
+@bulk_insert.register(PostgreSQLDB)
+def __(db: PostgreSQLDB, table: str, rows: Iterable[Sequence], columns: List[str], batch_size: int = 10000) -> int:
+    import psycopg2.extras
+    sql = f'INSERT INTO {table} ({", ".join(columns)}) VALUES %s'
+
+    def insert_batch(cursor, batch):
+        # one multi row INSERT statement per batch
+        psycopg2.extras.execute_values(cursor, sql, batch, page_size=len(batch))
+
+    return _bulk_insert(db, table, rows, batch_size, insert_batch)
+
+
+@bulk_insert.register(MysqlDB)
+def __(db: MysqlDB, table: str, rows: Iterable[Sequence], columns: List[str], batch_size: int = 10000) -> int:
+    # MySQLdb rewrites executemany of an INSERT statement into a multi row INSERT
+    sql = f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join(["%s"] * len(columns))})'
+    return _bulk_insert(db, table, rows, batch_size, lambda cursor, batch: cursor.executemany(sql, batch))
+
+
+@bulk_insert.register(SQLServerDB)
+def __(db: SQLServerDB, table: str, rows: Iterable[Sequence], columns: List[str], batch_size: int = 10000) -> int:
+    sql = f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join(["?"] * len(columns))})'
+
+    def insert_batch(cursor, batch):
+        # sends the whole batch as a parameter array in one round trip
+        cursor.fast_executemany = True
+        cursor.executemany(sql, batch)
+
+    return _bulk_insert(db, table, rows, batch_size, insert_batch)
+
+
+@bulk_insert.register(SQLiteDB)
+def __(db: SQLiteDB, table: str, rows: Iterable[Sequence], columns: List[str], batch_size: int = 10000) -> int:
+    sql = f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join(["?"] * len(columns))})'
+
+    def setup(cursor):
+        # no fsync per write and a bigger page cache, the data is committed once at the end
+        cursor.execute('PRAGMA synchronous = OFF')
+        cursor.execute('PRAGMA temp_store = MEMORY')
+        cursor.execute('PRAGMA cache_size = -65536')
+
+    return _bulk_insert(db, table, rows, batch_size, lambda cursor, batch: cursor.executemany(sql, batch), setup)
+
+
+def _bulk_insert(db: DB, table: str, rows: Iterable[Sequence], batch_size: int,
+                 insert_batch: Callable[[object, list], None], setup: Callable[[object], None] = None) -> int:
+    """Inserts `rows` batch wise in a single transaction and reports the throughput"""
+    import itertools
+    import time
+
+    start_time = time.monotonic()
+    row_count = 0
+    rows = iter(rows)
+    with cursor_context(db) as cursor:
+        if setup:
+            setup(cursor)
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            insert_batch(cursor, batch)
+            row_count += len(batch)
+
+    seconds = time.monotonic() - start_time
+    # stdout might be the data stream of a pipeline
+    print(f'{row_count} rows inserted into {table} in {seconds:.1f} seconds'
+          + (f' ({row_count / seconds:.0f} rows/s)' if seconds else ''), file=sys.stderr)
+    return row_count
+
+
+@functools.singledispatch
+def iter_record_batches(db: object, query: str, batch_rows: int = 100000) -> Iterator['pyarrow.RecordBatch']:
+    """
+    Executes a query and yields the result as Apache Arrow record batches (requires https://pypi.org/project/pyarrow/).
+
+    The default implementation fetches the rows with a streaming cursor (see `streaming_cursor`) and converts
+    each batch column wise into Arrow arrays, with column types derived from the cursor description where
+    the driver provides them. When the query returns no rows, a single empty batch is yielded.
+
+    Args:
+        db: The database in which to run the query (either an alias or a `dbs.DB` object)
+        query: The query to execute
+        batch_rows: The (maximum) number of rows per batch. Native implementations might use other batch sizes.
+    """
+    import pyarrow
+
+    with cursor_context(db, streaming=True, batch_size=batch_rows) as cursor:
+        cursor.execute(query)
+        names, types = None, None
+        batch_count = 0
+        while True:
+            rows = cursor.fetchmany(batch_rows)
+            if names is None:
+                # the description of a psycopg2 server side cursor is available only after the first fetch
+                names = [column[0] for column in cursor.description]
+                types = _arrow_types(db, cursor.description)
+            if not rows:
+                break
+
+            arrays = []
+            for i, values in enumerate(zip(*rows)):
+                try:
+                    array = pyarrow.array(values, type=types[i])
+                except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, TypeError, OverflowError):
+                    # values that do not fit the column type, e.g. in SQLite
+                    array = pyarrow.array(values)
+                if types[i] is None and array.type != pyarrow.null():
+                    types[i] = array.type
+                arrays.append(array)
+            yield pyarrow.RecordBatch.from_arrays(arrays, names=names)
+            batch_count += 1
+
+        if not batch_count:
+            yield pyarrow.RecordBatch.from_arrays(
+                [pyarrow.array([], type=type or pyarrow.null()) for type in types], names=names)
+
+
+@iter_record_batches.register(str)
+def __(alias: str, query: str, batch_rows: int = 100000) -> Iterator['pyarrow.RecordBatch']:
+    return iter_record_batches(db(alias), query, batch_rows)
+
+
+@iter_record_batches.register(BigQueryDB)
+def __(db: BigQueryDB, query: str, batch_rows: int = 100000) -> Iterator['pyarrow.RecordBatch']:
+    from google.cloud.bigquery_storage import BigQueryReadClient
+    from .bigquery import bigquery_client, bigquery_credentials
+
+    # reads the query result with the BigQuery Storage API
+    rows = bigquery_client(db).query(query).result(page_size=batch_rows)
+    yield from rows.to_arrow_iterable(bqstorage_client=BigQueryReadClient(credentials=bigquery_credentials(db)))
+
+
+@iter_record_batches.register(DatabricksDB)
+def __(db: DatabricksDB, query: str, batch_rows: int = 100000) -> Iterator['pyarrow.RecordBatch']:
+    from databricks import sql  # requires https://pypi.org/project/databricks-sql-connector/
+
+    # the databricks sql connector receives results as arrow data
+    with sql.connect(server_hostname=db.host, http_path=db.http_path, access_token=db.access_token) as connection:
+        with connection.cursor(arraysize=batch_rows) as cursor:
+            cursor.execute(query)
+            while True:
+                table = cursor.fetchmany_arrow(batch_rows)
+                if not table.num_rows:
+                    break
+                yield from table.to_batches()
+
+
+@functools.singledispatch
+def fetch_arrow(db: object, query: str) -> 'pyarrow.Table':
+    """
+    Executes a query and returns the result as an Apache Arrow table (requires https://pypi.org/project/pyarrow/).
+
+    Args:
+        db: The database in which to run the query (either an alias or a `dbs.DB` object)
+        query: The query to execute
+
+    Example:
+        >>> fetch_arrow('dwh', 'SELECT * FROM customers').to_pandas()
+    """
+    import pyarrow
+
+    batches = list(iter_record_batches(db, query))
+    # types of columns which only had NULL values in a batch are inferred from the other batches
+    schema = pyarrow.unify_schemas([batch.schema for batch in batches])
+    return pyarrow.concat_tables([pyarrow.Table.from_batches([batch]).cast(schema) for batch in batches])
+
+
+@fetch_arrow.register(str)
+def __(alias: str, query: str) -> 'pyarrow.Table':
+    return fetch_arrow(db(alias), query)
+
+
+@fetch_arrow.register(BigQueryDB)
+def __(db: BigQueryDB, query: str) -> 'pyarrow.Table':
+    from .bigquery import bigquery_client
+
+    return bigquery_client(db).query(query).result().to_arrow(create_bqstorage_client=True)
+
+
+@functools.singledispatch
+def _arrow_types(db: object, description: Sequence) -> List['pyarrow.DataType']:
+    """Maps a cursor description to Arrow types, None where the type shall be inferred from the values"""
+    return [None] * len(description)
+
+
+@_arrow_types.register(PostgreSQLDB)
+def __(db: PostgreSQLDB, description: Sequence) -> List['pyarrow.DataType']:
+    import pyarrow
+
+    # see https://github.com/postgres/postgres/blob/master/src/include/catalog/pg_type.dat
+    types_by_oid = {16: pyarrow.bool_(), 17: pyarrow.binary(), 20: pyarrow.int64(), 21: pyarrow.int16(),
+                    23: pyarrow.int32(), 25: pyarrow.string(), 700: pyarrow.float32(), 701: pyarrow.float64(),
+                    1042: pyarrow.string(), 1043: pyarrow.string(), 1082: pyarrow.date32(),
+                    1083: pyarrow.time64('us'), 1114: pyarrow.timestamp('us'),
+                    1184: pyarrow.timestamp('us', tz='UTC'), 2950: pyarrow.string()}
+    types = []
+    for column in description:
+        if column.type_code == 1700 and column.precision and column.precision <= 38:  # numeric
+            types.append(pyarrow.decimal128(column.precision, column.scale or 0))
+        else:
+            types.append(types_by_oid.get(column.type_code))
+    return types
+
+
+@_arrow_types.register(MysqlDB)
+def __(db: MysqlDB, description: Sequence) -> List['pyarrow.DataType']:
+    import pyarrow
+    from MySQLdb.constants import FIELD_TYPE
+
+    types_by_field_type = {FIELD_TYPE.TINY: pyarrow.int64(), FIELD_TYPE.SHORT: pyarrow.int64(),
+                           FIELD_TYPE.LONG: pyarrow.int64(), FIELD_TYPE.INT24: pyarrow.int64(),
+                           FIELD_TYPE.LONGLONG: pyarrow.int64(), FIELD_TYPE.YEAR: pyarrow.int64(),
+                           FIELD_TYPE.FLOAT: pyarrow.float64(), FIELD_TYPE.DOUBLE: pyarrow.float64(),
+                           FIELD_TYPE.DATE: pyarrow.date32(), FIELD_TYPE.DATETIME: pyarrow.timestamp('us'),
+                           FIELD_TYPE.TIMESTAMP: pyarrow.timestamp('us'), FIELD_TYPE.TIME: pyarrow.duration('us'),
+                           FIELD_TYPE.VARCHAR: pyarrow.string(), FIELD_TYPE.VAR_STRING: pyarrow.string(),
+                           FIELD_TYPE.STRING: pyarrow.string()}
+    return [types_by_field_type.get(column[1]) for column in description]
+
+
+@_arrow_types.register(SQLServerDB)
+def __(db: SQLServerDB, description: Sequence) -> List['pyarrow.DataType']:
+    import datetime
+    import decimal
+    import pyarrow
+
+    # pyodbc describes columns with the python type of their values
+    types_by_python_type = {bool: pyarrow.bool_(), int: pyarrow.int64(), float: pyarrow.float64(),
+                            str: pyarrow.string(), bytes: pyarrow.binary(), bytearray: pyarrow.binary(),
+                            datetime.date: pyarrow.date32(), datetime.datetime: pyarrow.timestamp('us'),
+                            datetime.time: pyarrow.time64('us')}
+    types = []
+    for _, type_code, _, _, precision, scale, _ in description:
+        if type_code is decimal.Decimal and precision and precision <= 38:
+            types.append(pyarrow.decimal128(precision, scale or 0))
+        else:
+            types.append(types_by_python_type.get(type_code))
+    return types
+
+
+@functools.singledispatch
+async def connect_async(db: object, **kargs) -> object:
+    """
+    Creating an asyncio connection to the database. The returned connection object follows the
+    DB-API 2.0 (PIP-249) naming, but its methods are coroutines.
+
+    Requires https://pypi.org/project/asyncpg/ for PostgreSQL, https://pypi.org/project/aiomysql/ for MySQL
+    and https://pypi.org/project/aiosqlite/ for SQLite.
+
+    Args:
+        db: The database for which you want to get the database object (either an alias or a `dbs.DB` object)
+        **kargs: Optional arguments.
+    """
+    raise NotImplementedError(f'Please implement connect_async for type "{db.__class__.__name__}"')
+
+
+@connect_async.register(str)
+async def __(alias: str, **kargs) -> object:
+    return await connect_async(db(alias), **kargs)
+
+
+@connect_async.register(PostgreSQLDB)
+async def __(db, **kargs) -> '_AsyncpgConnection':
+    import asyncpg  # requires https://github.com/MagicStack/asyncpg
+    return _AsyncpgConnection(await asyncpg.connect(host=db.host, port=db.port, user=db.user, password=db.password,
+                                                    database=db.database, ssl=db.sslmode))
+
+
+@connect_async.register(MysqlDB)
+async def __(db, **kargs) -> 'aiomysql.Connection':
+    import aiomysql  # requires https://github.com/aio-libs/aiomysql
+    ssl_context = None
+    if db.ssl:
+        import ssl
+        ssl_context = ssl.create_default_context()
+    return await aiomysql.connect(host=db.host or 'localhost', port=db.port or 3306, user=db.user,
+                                  password=db.password or '', db=db.database, charset=db.charset or '',
+                                  ssl=ssl_context)
+
+
+@connect_async.register(SQLiteDB)
+async def __(db, **kargs) -> 'aiosqlite.Connection':
+    import aiosqlite  # requires https://github.com/omnilib/aiosqlite
+    return await aiosqlite.connect(database=db.file_name)
+
+
+class _AsyncpgConnection:
+    """Wraps an asyncpg connection into the (async) DB-API 2.0 interface used by the other async drivers"""
+
+    def __init__(self, connection: 'asyncpg.Connection'):
+        self.connection = connection
+        self._transaction = None
+
+    def cursor(self) -> '_AsyncpgCursor':
+        return _AsyncpgCursor(self)
+
+    async def _ensure_transaction(self):
+        if self._transaction is None:
+            self._transaction = self.connection.transaction()
+            await self._transaction.start()
+
+    async def commit(self):
+        if self._transaction is not None:
+            transaction, self._transaction = self._transaction, None
+            await transaction.commit()
+
+    async def rollback(self):
+        if self._transaction is not None:
+            transaction, self._transaction = self._transaction, None
+            await transaction.rollback()
+
+    async def close(self):
+        await self.connection.close()
+
+
+class _AsyncpgCursor:
+    """
+    An (async) DB-API 2.0 cursor on top of asyncpg. Rows are fetched with a server side
+    cursor. Note that asyncpg uses the native PostgreSQL parameter style ($1, $2, ...).
+    """
+
+    def __init__(self, connection: _AsyncpgConnection):
+        self.connection = connection
+        self.arraysize = 1000
+        self.description = None
+        self._cursor = None
+
+    async def execute(self, query: str, parameters: tuple = ()):
+        await self.connection._ensure_transaction()
+        statement = await self.connection.connection.prepare(query)
+        attributes = statement.get_attributes()
+        if attributes:
+            self.description = [(attribute.name, attribute.type.oid, None, None, None, None, None)
+                                for attribute in attributes]
+            self._cursor = await statement.cursor(*parameters)
+        else:
+            self.description = None
+            self._cursor = None
+            await statement.fetch(*parameters)
+
+    async def fetchone(self) -> tuple:
+        record = await self._cursor.fetchrow()
+        return tuple(record) if record is not None else None
+
+    async def fetchmany(self, size: int = None) -> list:
+        return [tuple(record) for record in await self._cursor.fetch(size or self.arraysize)]
+
+    async def fetchall(self) -> list:
+        rows = []
+        while True:
+            batch = await self.fetchmany()
+            if not batch:
+                return rows
+            rows.extend(batch)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> tuple:
+        row = await self.fetchone()
+        if row is None:
+            raise StopAsyncIteration
+        return row
+
+    async def close(self):
+        self._cursor = None
+
+
+async def _maybe_await(result):
+    """The async drivers differ in which connection and cursor methods are coroutines"""
+    if inspect.isawaitable(result):
+        return await result
+    return result
+
+
+@contextlib.asynccontextmanager
+async def async_cursor_context(db: Union[str, DB]) -> object:
+    """
+    The asyncio version of `cursor_context`. When the context is
+    closed, a commit is executed on the connection.
+
+    Example usage:
+        async with dbs.async_cursor_context('mara') as cursor:
+            await cursor.execute('SELECT id FROM table')
+            async for row in cursor:
+                print(row)
+    """
+    connection = await connect_async(db)
+    try:
+        cursor = await _maybe_await(connection.cursor())
+        try:
+            yield cursor
+            await _maybe_await(connection.commit())
+        except Exception:
+            await _maybe_await(connection.rollback())
+            raise
+        finally:
+            await _maybe_await(cursor.close())
+    finally:
+        await _maybe_await(connection.close())
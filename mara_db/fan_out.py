@@ -0,0 +1,175 @@
+"""Running queries concurrently against many databases"""
+
+import concurrent.futures
+import threading
+import time
+import typing
+
+from mara_db import dbs
+
+# seconds to wait for a query to end after it has been cancelled, afterwards its thread is abandoned
+CANCEL_GRACE_PERIOD = 5
+
+
+class QueryResult:
+    """The outcome of running a query in one database"""
+
+    def __init__(self, alias: str, columns: typing.List[str] = None, rows: typing.List[tuple] = None,
+                 error: BaseException = None, duration: float = None):
+        """
+        Args:
+            alias: The alias of the database
+            columns: The column names of the result, None for statements that return no rows
+            rows: The result rows
+            error: The exception raised when running the query (a `TimeoutError` when the query timed out)
+            duration: Seconds it took to run the query
+        """
+        self.alias = alias
+        self.columns = columns
+        self.rows = rows
+        self.error = error
+        self.duration = duration
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+    def __repr__(self) -> str:
+        return (f'<QueryResult: alias={self.alias}, '
+                + (f'rows={len(self.rows or [])}' if self.succeeded else f'error={self.error!r}')
+                + (f', duration={self.duration:.3f}' if self.duration is not None else '') + '>')
+
+
+def query_databases(query: typing.Union[str, typing.Dict[str, str]], aliases: typing.List[str] = None,
+                    timeout: typing.Union[float, typing.Dict[str, float]] = None,
+                    max_workers: int = 8) -> typing.Dict[str, QueryResult]:
+    """
+    Runs a query concurrently in many databases with a bounded number of threads.
+
+    A query that runs longer than its timeout is cancelled (when the database driver supports it) and its
+    result gets a `TimeoutError`. Errors in one database do not affect the others.
+
+    Args:
+        query: The query to run in all databases, or a dictionary of queries by database alias
+        aliases: The aliases of the databases to query. Defaults to the keys of `query` when it is a dictionary,
+                 otherwise to all databases configured in `mara_db.config.databases`
+        timeout: Seconds after which a query is cancelled, either for all databases or by alias
+        max_workers: The maximum number of queries running at the same time
+
+    Returns:
+        A `QueryResult` per alias
+
+    Example:
+        >>> results = query_databases('SELECT COUNT(*) FROM pg_stat_activity', timeout=10)
+        >>> {alias: result.rows[0][0] for alias, result in results.items() if result.succeeded}
+        {'dwh': 12, 'crm': 3}
+    """
+    if aliases is None:
+        if isinstance(query, dict):
+            aliases = list(query.keys())
+        else:
+            aliases = dbs.aliases()
+
+    tasks = [_Task(alias=alias,
+                   query=query[alias] if isinstance(query, dict) else query,
+                   timeout=timeout.get(alias) if isinstance(timeout, dict) else timeout)
+             for alias in aliases]
+
+    results = {}
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='mara-db-fan-out')
+    try:
+        futures = {executor.submit(task.run): task for task in tasks}
+        pending = set(futures.keys())
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED,
+                timeout=0.1 if any(task.timeout is not None for task in tasks) else None)
+
+            for future in done:
+                task = futures[future]
+                results[task.alias] = future.result()
+
+            now = time.monotonic()
+            for future in list(pending):
+                task = futures[future]
+                if task.started_at is None or task.timeout is None:
+                    continue
+                if now - task.started_at > task.timeout:
+                    task.cancel()
+                if now - task.started_at > task.timeout + CANCEL_GRACE_PERIOD:
+                    # the driver did not react to the cancellation, do not wait for it any longer
+                    results[task.alias] = QueryResult(task.alias, error=task.timeout_error(),
+                                                      duration=now - task.started_at)
+                    pending.remove(future)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    finally:
+        executor.shutdown(wait=False)
+
+    return {task.alias: results[task.alias] for task in tasks}
+
+
+class _Task:
+    """A query running in one database, which can be cancelled from another thread"""
+
+    def __init__(self, alias: str, query: str, timeout: typing.Optional[float]):
+        self.alias = alias
+        self.query = query
+        self.timeout = timeout
+        self.started_at = None
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._connection = None
+        self._cursor = None
+
+    def run(self) -> QueryResult:
+        self.started_at = time.monotonic()
+        connection, cursor = None, None
+        try:
+            connection = dbs.connect(self.alias)
+            cursor = connection.cursor()
+            with self._lock:
+                if self.cancelled:
+                    raise self.timeout_error()
+                self._connection, self._cursor = connection, cursor
+            cursor.execute(self.query)
+            columns = [column[0] for column in cursor.description] if cursor.description else None
+            rows = cursor.fetchall() if columns else []
+            connection.commit()
+            return QueryResult(self.alias, columns=columns, rows=rows, duration=time.monotonic() - self.started_at)
+        except Exception as e:
+            error = self.timeout_error() if self.cancelled else e
+            if connection is not None:
+                try:
+                    connection.rollback()
+                except Exception:
+                    pass
+            return QueryResult(self.alias, error=error, duration=time.monotonic() - self.started_at)
+        finally:
+            with self._lock:
+                self._connection, self._cursor = None, None
+            if cursor is not None:
+                cursor.close()
+            if connection is not None:
+                connection.close()
+
+    def cancel(self):
+        """Cancels the running query, using the first cancel method provided by the driver"""
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            for obj, method in [(self._connection, 'cancel'),  # psycopg2
+                                (self._cursor, 'cancel'),  # pyodbc
+                                (self._connection, 'interrupt')]:  # sqlite3
+                if obj is not None and hasattr(obj, method):
+                    try:
+                        getattr(obj, method)()
+                        return
+                    except Exception:
+                        pass
+
+    def timeout_error(self) -> TimeoutError:
+        return TimeoutError(f'Query in database "{self.alias}" did not finish within {self.timeout} seconds')
@@ -0,0 +1,394 @@
+"""
+Streaming conversion between pipe formats
+
+Used by `mara_db.shell.copy_command` when the format that the source writes is not one that the target can read:
+
+    ... | python -m mara_db.format_conversion --source-format '{...}' --target-format '{...}' | ...
+
+Text formats are parsed and written block wise with the vectorized readers, writers and compute functions
+of Apache Arrow (requires https://pypi.org/project/pyarrow/), so that only one block of rows is in memory at a
+time. Avro is read and written with https://pypi.org/project/fastavro/.
+
+Conventions:
+- `formats.NativeFormat` is tab separated text without quotes and without header, with the backslash escapes
+  of MySQL batch output and PostgreSQL text `COPY` (\\t, \\n, \\r, \\\\, \\0). `\\N` and `NULL` are read as NULL,
+  NULL is written as `\\N`.
+- `formats.CsvFormat` without header gets the column names f0, f1, ...
+- All columns of text input are read as strings, unless a schema is passed to `convert`. Inferring types
+  from the first block would fail on different values in later blocks and change values like zip codes.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import typing
+
+from mara_db import formats
+
+# bytes of text input that are parsed into one batch
+BLOCK_SIZE = 16 * 1024 * 1024
+
+# rows per batch for Parquet and Avro input
+BATCH_ROWS = 100000
+
+# the formats that carry column types
+TYPED_FORMATS = (formats.JsonlFormat, formats.ParquetFormat, formats.AvroFormat, formats.ArrowFormat)
+
+
+def convert(input: typing.BinaryIO, output: typing.BinaryIO, source_format: formats.Format,
+            target_format: formats.Format, schema: 'pyarrow.Schema' = None) -> int:
+    """
+    Reads data in `source_format` from `input` and writes it in `target_format` to `output`
+
+    Args:
+        input: The stream to read
+        output: The stream to write to. It is closed at the end when the output is compressed.
+        source_format: The format of the input, one of `formats.NativeFormat`, `formats.CsvFormat`,
+                       `formats.JsonlFormat`, `formats.ParquetFormat`, `formats.AvroFormat` or `formats.ArrowFormat`
+        target_format: The format of the output, one of the same formats
+        schema: The column types of text and JSON input. Text input without header needs a field for each
+                column, with a header, columns that are not in the schema are read as strings.
+
+    Returns:
+        The number of converted rows
+    """
+    import pyarrow
+
+    row_count = 0
+    writer = None
+    compression = getattr(target_format, 'compression', None)
+    sink = pyarrow.CompressedOutputStream(pyarrow.PythonFile(output, mode='w'), compression) if compression else output
+    try:
+        for batch in _read_batches(input, source_format, schema):
+            if writer is None:
+                writer = _Writer(sink, target_format, batch.schema)
+            writer.write(batch)
+            row_count += batch.num_rows
+        if writer is None and isinstance(target_format, (formats.ParquetFormat, formats.ArrowFormat,
+                                                          formats.AvroFormat)):
+            # no input at all, binary formats still get a (column less) schema
+            writer = _Writer(sink, target_format, pyarrow.schema([]))
+    finally:
+        if writer is not None:
+            writer.close()
+        if compression:
+            sink.close()
+        else:
+            output.flush()
+    return row_count
+
+
+def _read_batches(input: typing.BinaryIO, pipe_format: formats.Format,
+                  schema: 'pyarrow.Schema' = None) -> typing.Iterator['pyarrow.RecordBatch']:
+    """Yields the data of a stream as record batches"""
+    import pyarrow
+
+    compression = getattr(pipe_format, 'compression', None)
+    if compression:
+        input = pyarrow.CompressedInputStream(pyarrow.PythonFile(input, mode='r'), compression)
+
+    if isinstance(pipe_format, (formats.CsvFormat, formats.NativeFormat)):
+        import pyarrow.csv
+
+        native = isinstance(pipe_format, formats.NativeFormat)
+        if native:
+            parse_options = pyarrow.csv.ParseOptions(delimiter='\t', quote_char=False)
+            null_values = ['\\N', 'NULL']
+        else:
+            if pipe_format.footer:
+                raise ValueError('Unsupported pipe_format.footer for format conversion')
+            parse_options = pyarrow.csv.ParseOptions(delimiter=pipe_format.delimiter_char or ',',
+                                                     quote_char=pipe_format.quote_char or '"')
+            null_values = [pipe_format.null_value_string or '']
+        header = not native and pipe_format.header
+        try:
+            reader = pyarrow.csv.open_csv(
+                input,
+                read_options=pyarrow.csv.ReadOptions(
+                    block_size=BLOCK_SIZE, column_names=schema.names if schema and not header else None,
+                    autogenerate_column_names=not header and not schema),
+                parse_options=parse_options,
+                convert_options=pyarrow.csv.ConvertOptions(
+                    column_types=schema, null_values=null_values, strings_can_be_null=True,
+                    quoted_strings_can_be_null=False, default_column_type=pyarrow.string()))
+        except pyarrow.ArrowInvalid as e:
+            if 'Empty CSV file' in str(e):
+                return
+            raise
+        for batch in reader:
+            yield _unescape(batch) if native else batch
+
+    elif isinstance(pipe_format, formats.JsonlFormat):
+        import pyarrow.json
+        yield from pyarrow.json.open_json(input, read_options=pyarrow.json.ReadOptions(block_size=BLOCK_SIZE),
+                                          parse_options=pyarrow.json.ParseOptions(explicit_schema=schema))
+
+    elif isinstance(pipe_format, formats.ParquetFormat):
+        import pyarrow.parquet
+        # the metadata of parquet files is at the end, so the input is spooled to a file first
+        with tempfile.TemporaryFile() as file:
+            shutil.copyfileobj(input, file, BLOCK_SIZE)
+            file.seek(0)
+            yield from pyarrow.parquet.ParquetFile(file).iter_batches(batch_size=BATCH_ROWS)
+
+    elif isinstance(pipe_format, formats.AvroFormat):
+        import fastavro
+        # fastavro decodes records one by one, they are collected into batches
+        rows = []
+        for row in fastavro.reader(input):
+            rows.append(row)
+            if len(rows) == BATCH_ROWS:
+                yield pyarrow.RecordBatch.from_pylist(rows)
+                rows = []
+        if rows:
+            yield pyarrow.RecordBatch.from_pylist(rows)
+
+    elif isinstance(pipe_format, formats.ArrowFormat):
+        import pyarrow.ipc
+        yield from pyarrow.ipc.open_stream(input)
+
+    else:
+        raise ValueError(f'Unsupported source format for format conversion: {pipe_format}')
+
+
+class _Writer:
+    """Writes record batches in a format, the schema of the first batch is kept for all batches"""
+
+    def __init__(self, output: typing.BinaryIO, pipe_format: formats.Format, schema: 'pyarrow.Schema'):
+        import pyarrow
+
+        self.output = output
+        self.pipe_format = pipe_format
+        # nested values are written as JSON texts in formats without nested types
+        self.nested_as_json = isinstance(pipe_format, (formats.CsvFormat, formats.NativeFormat, formats.AvroFormat))
+        # columns without a type (only NULL values in the first batch) are written as strings
+        self.schema = pyarrow.schema([field.with_type(pyarrow.string())
+                                      if field.type == pyarrow.null() or (self.nested_as_json and _is_nested(field.type))
+                                      else field
+                                      for field in schema])
+        self._writer = None
+
+        if isinstance(pipe_format, formats.CsvFormat):
+            import pyarrow.csv
+            if pipe_format.footer:
+                raise ValueError('Unsupported pipe_format.footer for format conversion')
+            if pipe_format.quote_char not in (None, '"'):
+                raise ValueError(f'Unsupported pipe_format.quote_char for format conversion: {pipe_format.quote_char}')
+            # without a quote char, values are written as they are (e.g. for bcp, which does not know quotes)
+            self._writer = pyarrow.csv.CSVWriter(output, self.schema, write_options=pyarrow.csv.WriteOptions(
+                include_header=pipe_format.header, delimiter=pipe_format.delimiter_char or ',',
+                null_string=pipe_format.null_value_string or '',
+                quoting_style='needed' if pipe_format.quote_char else 'none'))
+        elif isinstance(pipe_format, formats.ParquetFormat):
+            import pyarrow.parquet
+            self._writer = pyarrow.parquet.ParquetWriter(output, self.schema)
+        elif isinstance(pipe_format, formats.ArrowFormat):
+            import pyarrow.ipc
+            self._writer = pyarrow.ipc.new_stream(output, self.schema)
+        elif isinstance(pipe_format, formats.AvroFormat):
+            import fastavro.write
+            self._avro_writer = fastavro.write.Writer(output, fastavro.parse_schema(_avro_schema(self.schema)))
+        elif not isinstance(pipe_format, (formats.NativeFormat, formats.JsonlFormat)):
+            raise ValueError(f'Unsupported target format for format conversion: {pipe_format}')
+
+    def write(self, batch: 'pyarrow.RecordBatch'):
+        import pyarrow
+
+        table = pyarrow.Table.from_batches([batch])
+        if self.nested_as_json:
+            for i, column in enumerate(table.columns):
+                if _is_nested(column.type):
+                    table = table.set_column(i, table.field(i).with_type(pyarrow.string()), _json_texts(column))
+        if table.schema != self.schema:
+            try:
+                table = table.cast(self.schema)
+            except (pyarrow.ArrowInvalid, pyarrow.ArrowNotImplementedError) as e:
+                raise ValueError(f'Column types changed between batches, from {self.schema} to {table.schema}') from e
+
+        if isinstance(self.pipe_format, formats.CsvFormat) and not self.pipe_format.quote_char:
+            try:
+                self._writer.write_table(table)
+            except pyarrow.ArrowInvalid as e:
+                raise ValueError('Values with delimiters, quotes or line breaks can not be written as CSV '
+                                 f'without a quote char: {e}') from e
+        elif self._writer is not None:
+            self._writer.write_table(table)
+        elif isinstance(self.pipe_format, formats.NativeFormat):
+            _write_lines(self.output, _native_lines(table))
+        elif isinstance(self.pipe_format, formats.JsonlFormat):
+            _write_lines(self.output, _json_lines(table))
+        else:
+            # fastavro encodes records one by one
+            for row in table.to_pylist():
+                self._avro_writer.write(row)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        elif isinstance(self.pipe_format, formats.AvroFormat):
+            self._avro_writer.flush()
+
+
+def _is_nested(type: 'pyarrow.DataType') -> bool:
+    import pyarrow
+    return pyarrow.types.is_nested(type)
+
+
+def _json_texts(column: 'pyarrow.ChunkedArray') -> 'pyarrow.Array':
+    """Encodes values as JSON row by row"""
+    import pyarrow
+    return pyarrow.array([None if value is None else json.dumps(value, default=str, ensure_ascii=False)
+                          for value in column.to_pylist()], type=pyarrow.string())
+
+
+def _unescape(batch: 'pyarrow.RecordBatch') -> 'pyarrow.RecordBatch':
+    """Decodes the backslash escapes of native text in all string columns"""
+    import pyarrow
+    import pyarrow.compute
+
+    columns = []
+    for column in batch.columns:
+        if pyarrow.types.is_string(column.type) and pyarrow.compute.any(
+                pyarrow.compute.match_substring(column, '\\')).as_py():
+            # escaped backslashes are replaced by a noncharacter first, so that they are not decoded twice
+            column = pyarrow.compute.replace_substring(column, '\\\\', '\uffff')
+            for escaped, character in [('\\t', '\t'), ('\\n', '\n'), ('\\r', '\r'), ('\\0', '\0'), ('\uffff', '\\')]:
+                column = pyarrow.compute.replace_substring(column, escaped, character)
+        columns.append(column)
+    return pyarrow.RecordBatch.from_arrays(columns, schema=batch.schema)
+
+
+def _native_lines(table: 'pyarrow.Table') -> 'pyarrow.Array':
+    """Renders the rows of a table as native text lines (including the line break)"""
+    import pyarrow
+    import pyarrow.compute
+
+    texts = []
+    for column in table.columns:
+        text = _to_string(column)
+        for character, escaped in [('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r')]:
+            text = pyarrow.compute.replace_substring(text, character, escaped)
+        texts.append(text.fill_null('\\N'))
+    if not texts:
+        return None
+    return pyarrow.compute.binary_join_element_wise(pyarrow.compute.binary_join_element_wise(*texts, '\t'),
+                                                    pyarrow.scalar('\n'), '')
+
+
+def _json_lines(table: 'pyarrow.Table') -> 'pyarrow.Array':
+    """Renders the rows of a table as JSON objects (including the line break)"""
+    import pyarrow
+    import pyarrow.compute
+
+    parts = []
+    for i, (name, column) in enumerate(zip(table.column_names, table.columns)):
+        parts += [pyarrow.scalar(('{' if i == 0 else ',') + json.dumps(name) + ':'), _json_values(column)]
+    parts.append(pyarrow.scalar('}\n' if parts else '{}\n'))
+    return pyarrow.compute.binary_join_element_wise(*parts, '')
+
+
+def _json_values(column: 'pyarrow.ChunkedArray') -> 'pyarrow.ChunkedArray':
+    """The JSON representations of the values of a column, 'null' for NULL"""
+    import pyarrow
+    import pyarrow.compute
+
+    type = column.type
+    if pyarrow.types.is_integer(type) or pyarrow.types.is_decimal(type) or pyarrow.types.is_boolean(type):
+        values = pyarrow.compute.cast(column, pyarrow.string())
+    elif pyarrow.types.is_floating(type):
+        # NaN and infinity do not exist in JSON
+        values = pyarrow.compute.if_else(pyarrow.compute.is_finite(column),
+                                         pyarrow.compute.cast(column, pyarrow.string()), None)
+    elif (pyarrow.types.is_string(type) or pyarrow.types.is_large_string(type) or pyarrow.types.is_temporal(type)
+          or pyarrow.types.is_dictionary(type)):
+        values = _to_string(column)
+        for character, escaped in [('\\', '\\\\'), ('"', '\\"'), ('\n', '\\n'), ('\r', '\\r'), ('\t', '\\t')]:
+            values = pyarrow.compute.replace_substring(values, character, escaped)
+        if pyarrow.compute.any(pyarrow.compute.match_substring_regex(values, '[\\x00-\\x1f]')).as_py():
+            for code in range(32):
+                values = pyarrow.compute.replace_substring(values, chr(code), f'\\u{code:04x}')
+        values = pyarrow.compute.binary_join_element_wise(pyarrow.scalar('"'), values, pyarrow.scalar('"'), '')
+    else:
+        # nested and binary values are encoded row by row
+        values = _json_texts(column)
+    return values.fill_null('null')
+
+
+def _to_string(column: 'pyarrow.ChunkedArray') -> 'pyarrow.ChunkedArray':
+    import pyarrow
+    import pyarrow.compute
+
+    if pyarrow.types.is_dictionary(column.type):
+        column = pyarrow.compute.cast(column, column.type.value_type)
+    if pyarrow.types.is_binary(column.type):
+        # binary data as hex, like PostgreSQL text output
+        return pyarrow.array([None if value is None else '\\x' + value.hex() for value in column.to_pylist()],
+                             type=pyarrow.string())
+    return pyarrow.compute.cast(column, pyarrow.string())
+
+
+def _write_lines(output: typing.BinaryIO, lines: typing.Optional['pyarrow.ChunkedArray']):
+    """Writes the data buffers of string arrays, which are the concatenation of all values"""
+    import pyarrow
+
+    if lines is None:
+        return
+    chunks = lines.chunks if isinstance(lines, pyarrow.ChunkedArray) else [lines]
+    for chunk in chunks:
+        if len(chunk):
+            offsets = memoryview(chunk.buffers()[1]).cast('q' if pyarrow.types.is_large_string(chunk.type) else 'i')
+            start, end = offsets[chunk.offset], offsets[chunk.offset + len(chunk)]
+            output.write(memoryview(chunk.buffers()[2])[start:end])
+
+
+def _avro_schema(schema: 'pyarrow.Schema') -> dict:
+    """An Avro record schema for an Arrow schema, all fields are nullable"""
+    import pyarrow
+
+    def avro_type(type: 'pyarrow.DataType') -> typing.Union[str, dict]:
+        if pyarrow.types.is_boolean(type):
+            return 'boolean'
+        elif pyarrow.types.is_integer(type):
+            return 'int' if type.bit_width <= 32 and pyarrow.types.is_signed_integer(type) else 'long'
+        elif pyarrow.types.is_float32(type):
+            return 'float'
+        elif pyarrow.types.is_floating(type):
+            return 'double'
+        elif pyarrow.types.is_decimal(type):
+            return {'type': 'bytes', 'logicalType': 'decimal', 'precision': type.precision, 'scale': type.scale}
+        elif pyarrow.types.is_date(type):
+            return {'type': 'int', 'logicalType': 'date'}
+        elif pyarrow.types.is_timestamp(type):
+            return {'type': 'long', 'logicalType': 'timestamp-micros'}
+        elif pyarrow.types.is_binary(type) or pyarrow.types.is_large_binary(type):
+            return 'bytes'
+        else:
+            return 'string'
+
+    return {'type': 'record', 'name': 'row',
+            'fields': [{'name': field.name, 'type': ['null', avro_type(field.type)]} for field in schema]}
+
+
+def main():
+    from .bigquery_export import _deserialize
+
+    parser = argparse.ArgumentParser(description='Converts data from stdin between pipe formats and writes it to stdout')
+    parser.add_argument('--source-format', required=True, help='The serialized `mara_db.formats.Format` of stdin')
+    parser.add_argument('--target-format', required=True, help='The serialized `mara_db.formats.Format` of stdout')
+    args = parser.parse_args()
+
+    try:
+        convert(open(sys.stdin.fileno(), 'rb', closefd=False), open(sys.stdout.fileno(), 'wb', closefd=False),
+                source_format=_deserialize(args.source_format, formats, formats.NativeFormat),
+                target_format=_deserialize(args.target_format, formats, formats.NativeFormat))
+    except BrokenPipeError:
+        # the next stage of the pipeline stopped reading, it reports the error
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
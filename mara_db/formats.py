@@ -12,17 +12,26 @@ class Format:
                 + '>')
 
 
+# compressions which can be applied to text based formats
+COMPRESSIONS = ['gzip', 'zstd']
+
+
 class NativeFormat(Format):
     """Use the native format of e.g. a database."""
-    def __init__(self):
-        pass
+    def __init__(self, compression: Optional[str] = None):
+        """
+        Args:
+            compression: Compress the data with 'gzip' or 'zstd' while it is piped
+        """
+        self.compression = _check_compression(compression)
 
 
 class CsvFormat(Format):
     """
     CSV file format. See https://tools.ietf.org/html/rfc4180
     """
-    def __init__(self, delimiter_char: str = ',', quote_char: Optional[str] = None, header: bool = False, footer: bool = False, null_value_string: Optional[str] = None):
+    def __init__(self, delimiter_char: str = ',', quote_char: Optional[str] = None, header: bool = False, footer: bool = False, null_value_string: Optional[str] = None,
+                 compression: Optional[str] = None):
         """
         CSV file format. See https://tools.ietf.org/html/rfc4180
 
@@ -32,18 +41,37 @@ class CsvFormat(Format):
             header: Whether a csv header with the column name(s) is part of the CSV file.
             footer: Whether a footer will be included or not. False by default.
             null_value_string: The string used to indicate NULL.
+            compression: Compress the data with 'gzip' or 'zstd' while it is piped
         """
         self.delimiter_char = delimiter_char or ','
         self.quote_char = quote_char
         self.header = header or False
         self.footer = footer or False
         self.null_value_string = null_value_string
+        self.compression = _check_compression(compression)
 
 
 class JsonlFormat(Format):
     """New line delimited JSON stream. See https://en.wikipedia.org/wiki/JSON_streaming"""
-    def __init__(self):
-        pass
+    def __init__(self, compression: Optional[str] = None):
+        """
+        Args:
+            compression: Compress the data with 'gzip' or 'zstd' while it is piped
+        """
+        self.compression = _check_compression(compression)
+
+
+class PostgresBinaryFormat(Format):
+    """
+    The binary format of the PostgreSQL `COPY` command. Can only be used between PostgreSQL databases.
+    See https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+    """
+    def __init__(self, compression: Optional[str] = None):
+        """
+        Args:
+            compression: Compress the data with 'gzip' or 'zstd' while it is piped
+        """
+        self.compression = _check_compression(compression)
 
 
 class AvroFormat(Format):
@@ -58,12 +86,24 @@ class ParquetFormat(Format):
         pass
 
 
+class ArrowFormat(Format):
+    """Apache Arrow IPC stream. See https://arrow.apache.org/docs/format/Columnar.html#ipc-streaming-format"""
+    def __init__(self):
+        pass
+
+
 class OrcFormat(Format):
     """Apache ORC"""
     def __init__(self):
         pass
 
 
+def _check_compression(compression: Optional[str]) -> Optional[str]:
+    assert compression is None or compression in COMPRESSIONS, \
+        f"Unsupported compression '{compression}', use one of {', '.join(COMPRESSIONS)}"
+    return compression
+
+
 def _check_format_with_args_used(pipe_format: Format, header: Optional[bool] = None, footer: Optional[bool] = None, delimiter_char: Optional[str] = None,
                                  csv_format: Optional[bool] = None, quote_char: Optional[str] = None, null_value_string: Optional[str] = None):
     if pipe_format:
@@ -0,0 +1,108 @@
+"""
+Uploading stdin to Google Cloud Storage in size bounded chunks with concurrent `gsutil cp -` processes
+
+Used by `mara_db.shell.copy_from_stdin_command` when `gcs_upload_chunk_size` is set for a `dbs.BigQueryDB`:
+
+    cat data.csv | python -m mara_db.gcs_upload --prefix=gs://bucket/tmp/part- --extension=.csv --chunk-size=67108864
+"""
+
+import argparse
+import concurrent.futures
+import gzip
+import subprocess
+import sys
+import threading
+import typing
+
+
+def upload_chunks(input: typing.BinaryIO, prefix: str, extension: str = '', chunk_size: int = 64 * 1024 * 1024,
+                  parallelism: int = 4, skip_header: bool = False, compress: bool = False,
+                  upload_command: typing.List[str] = None) -> int:
+    """
+    Splits a stream of lines into chunks of at most `chunk_size` bytes (lines are never split) and uploads
+    each chunk to its own object, with up to `parallelism` uploads running at the same time.
+
+    At least one (possibly empty) object is uploaded, so that a wildcard URI over `prefix` always matches.
+
+    Args:
+        input: The stream to upload
+        prefix: The URI prefix of the objects, e.g. 'gs://bucket/tmp/part-'. Objects get a six digit sequence number.
+        extension: The file extension of the objects, e.g. '.csv'
+        chunk_size: The maximum number of bytes (before compression) per object
+        parallelism: The maximum number of concurrent uploads
+        skip_header: When true, the first line of the input is not uploaded
+        compress: When true, each object is gzip compressed (and gets an additional '.gz' extension)
+        upload_command: The command that reads an object from stdin, the URI is appended. Default: gsutil -q cp -
+
+    Returns:
+        The number of uploaded objects
+    """
+    if upload_command is None:
+        upload_command = ['gsutil', '-q', 'cp', '-']
+
+    # limits the number of chunks held in memory
+    free_slots = threading.BoundedSemaphore(2 * parallelism)
+    futures = []
+
+    def upload(data: bytes, uri: str):
+        try:
+            subprocess.run(upload_command + [uri], input=gzip.compress(data, compresslevel=6) if compress else data,
+                           check=True)
+        finally:
+            free_slots.release()
+
+    def submit(chunk: typing.List[bytes]):
+        free_slots.acquire()
+        for future in futures:
+            if future.done() and future.exception():
+                free_slots.release()
+                raise future.exception()
+        uri = f'{prefix}{len(futures):06d}{extension}' + ('.gz' if compress else '')
+        futures.append(executor.submit(upload, b''.join(chunk), uri))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=parallelism,
+                                               thread_name_prefix='mara-db-gcs-upload') as executor:
+        try:
+            if skip_header:
+                input.readline()
+
+            chunk, size = [], 0
+            for line in input:
+                if chunk and size + len(line) > chunk_size:
+                    submit(chunk)
+                    chunk, size = [], 0
+                chunk.append(line)
+                size += len(line)
+            if chunk or not futures:
+                submit(chunk)
+
+            for future in futures:
+                future.result()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    return len(futures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Uploads stdin in chunks to Google Cloud Storage')
+    parser.add_argument('--prefix', required=True, help='The URI prefix of the uploaded objects')
+    parser.add_argument('--extension', default='', help='The file extension of the uploaded objects')
+    parser.add_argument('--chunk-size', type=int, default=64 * 1024 * 1024, help='The maximum bytes per object')
+    parser.add_argument('--parallelism', type=int, default=4, help='The maximum number of concurrent uploads')
+    parser.add_argument('--skip-header', action='store_true', help='Do not upload the first line')
+    parser.add_argument('--gzip', action='store_true', help='Compress each object with gzip')
+    args = parser.parse_args()
+
+    try:
+        upload_chunks(sys.stdin.buffer, prefix=args.prefix, extension=args.extension, chunk_size=args.chunk_size,
+                      parallelism=args.parallelism, skip_header=args.skip_header, compress=args.gzip)
+    except subprocess.CalledProcessError as e:
+        print(f'Upload failed: {e}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""
+High-watermark state for incremental copies (see `mara_db.shell.incremental_copy_command`)
+
+For each combination of source database alias, query and target table, the state table stores the highest value
+of a monotonically increasing column (e.g. an id or an `updated_at` timestamp) that was copied successfully.
+A copy runs in two steps around the actual `copy_command`:
+
+    echo 'SELECT ...' | python -m mara_db.incremental prepare --source-db=crm --target-table=t --watermark-column=id
+    echo 'SELECT ...' | python -m mara_db.incremental commit --source-db=crm --target-table=t
+
+`prepare` determines the current maximum of the column in the source, stores it as pending watermark and prints
+a query for the rows between the committed and the pending watermark. `commit` makes the pending watermark the
+committed one, so that failed copies are repeated.
+"""
+
+import argparse
+import datetime
+import decimal
+import functools
+import hashlib
+import sys
+import typing
+
+from mara_db import dbs, sql_lexer
+
+
+def prepare(source_db_alias: str, target_table: str, query: str, watermark_column: str) -> str:
+    """
+    Determines the rows of a query that were not copied yet
+
+    Args:
+        source_db_alias: The alias of the database in which to run the query
+        target_table: The table into which the rows are copied
+        query: The query to copy incrementally. It is wrapped as a sub query, so it must not end with `ORDER BY` or `LIMIT`
+        watermark_column: A column of the query result whose values only increase for new or changed rows
+
+    Returns:
+        A query for the rows with `watermark_column` above the committed and up to the current watermark
+    """
+    query = _strip_query(query)
+    committed_watermark = get_watermark(source_db_alias, target_table, query)
+
+    with dbs.cursor_context(source_db_alias) as cursor:
+        cursor.execute(f'SELECT MAX({watermark_column}) FROM ({query}) incremental_source')
+        maximum = cursor.fetchone()[0]
+
+    if maximum is None:
+        # empty source, nothing to copy
+        pending_watermark, predicate = committed_watermark, '1 = 0'
+    else:
+        pending_watermark = sql_literal(maximum)
+        predicate = (f'{watermark_column} > {committed_watermark} AND ' if committed_watermark is not None else '') \
+                    + f'{watermark_column} <= {pending_watermark}'
+
+    _save_state(source_db_alias, target_table, query, committed_watermark, pending_watermark)
+    return f'SELECT * FROM ({query}) incremental_source WHERE {predicate}'
+
+
+def commit(source_db_alias: str, target_table: str, query: str):
+    """Makes the watermark of the last `prepare` the committed watermark, after the copy succeeded"""
+    query = _strip_query(query)
+    state = _load_state(source_db_alias, target_table, query)
+    if state is None:
+        raise ValueError(f'No prepared incremental copy from {source_db_alias} into {target_table}')
+    watermark, pending_watermark = state
+    # the pending watermark is None when the source was empty
+    _save_state(source_db_alias, target_table, query,
+                pending_watermark if pending_watermark is not None else watermark, None)
+
+
+def get_watermark(source_db_alias: str, target_table: str, query: str) -> typing.Optional[str]:
+    """Returns the committed watermark (as SQL literal) of an incremental copy, None when nothing was copied yet"""
+    state = _load_state(source_db_alias, target_table, _strip_query(query))
+    return state[0] if state else None
+
+
+def reset_watermark(source_db_alias: str, target_table: str, query: str):
+    """Removes the state of an incremental copy, so that the next copy starts from the beginning"""
+    _ensure_state_table()
+    with dbs.cursor_context(_state_db()) as cursor:
+        cursor.execute(f'DELETE FROM {_state_table()} WHERE state_key = {_placeholder(_state_db())}',
+                       (_state_key(source_db_alias, target_table, _strip_query(query)),))
+
+
+def sql_literal(value: object) -> str:
+    """Renders a watermark value from a database driver as SQL literal"""
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    elif isinstance(value, (int, float, decimal.Decimal)):
+        return str(value)
+    elif isinstance(value, datetime.datetime):
+        return f"'{value.isoformat(sep=' ')}'"
+    elif isinstance(value, (datetime.date, datetime.time)):
+        return f"'{value.isoformat()}'"
+    else:
+        return "'" + str(value).replace("'", "''") + "'"
+
+
+@functools.singledispatch
+def _placeholder(db: object) -> str:
+    """The query parameter placeholder of the database driver"""
+    raise NotImplementedError(f'Please implement _placeholder for type "{db.__class__.__name__}"')
+
+
+@_placeholder.register(str)
+def __(alias: str) -> str:
+    return _placeholder(dbs.db(alias))
+
+
+@_placeholder.register(dbs.PostgreSQLDB)
+@_placeholder.register(dbs.MysqlDB)
+def __(db: dbs.DB) -> str:
+    return '%s'
+
+
+@_placeholder.register(dbs.SQLiteDB)
+@_placeholder.register(dbs.SQLServerDB)
+def __(db: dbs.DB) -> str:
+    return '?'
+
+
+def _state_db() -> typing.Union[str, dbs.DB]:
+    from mara_db import config
+    return config.incremental_state_db()
+
+
+def _state_table() -> str:
+    from mara_db import config
+    return config.incremental_state_table()
+
+
+def _state_key(source_db_alias: str, target_table: str, query: str) -> str:
+    from .query_cache import normalize_query
+    return hashlib.sha256('\0'.join([source_db_alias, target_table, normalize_query(query)]).encode()).hexdigest()
+
+
+def _strip_query(query: str) -> str:
+    return sql_lexer.subquery(query)
+
+
+def _ensure_state_table():
+    with dbs.cursor_context(_state_db()) as cursor:
+        cursor.execute(f'''
+CREATE TABLE IF NOT EXISTS {_state_table()} (
+  state_key         VARCHAR(64) PRIMARY KEY,
+  source_db_alias   VARCHAR(255),
+  target_table      VARCHAR(255),
+  watermark         TEXT,
+  pending_watermark TEXT,
+  updated_at        VARCHAR(32)
+)''')
+
+
+def _load_state(source_db_alias: str, target_table: str,
+                query: str) -> typing.Optional[typing.Tuple[typing.Optional[str], typing.Optional[str]]]:
+    """Returns (watermark, pending_watermark) or None"""
+    _ensure_state_table()
+    with dbs.cursor_context(_state_db()) as cursor:
+        cursor.execute(f'SELECT watermark, pending_watermark FROM {_state_table()} '
+                       f'WHERE state_key = {_placeholder(_state_db())}',
+                       (_state_key(source_db_alias, target_table, query),))
+        row = cursor.fetchone()
+    return tuple(row) if row else None
+
+
+def _save_state(source_db_alias: str, target_table: str, query: str, watermark: typing.Optional[str],
+                pending_watermark: typing.Optional[str]):
+    _ensure_state_table()
+    placeholder = _placeholder(_state_db())
+    key = _state_key(source_db_alias, target_table, query)
+    # delete and insert in one transaction instead of a dialect specific upsert
+    with dbs.cursor_context(_state_db()) as cursor:
+        cursor.execute(f'DELETE FROM {_state_table()} WHERE state_key = {placeholder}', (key,))
+        cursor.execute(f'INSERT INTO {_state_table()} '
+                       '(state_key, source_db_alias, target_table, watermark, pending_watermark, updated_at) '
+                       f'VALUES ({", ".join([placeholder] * 6)})',
+                       (key, source_db_alias, target_table, watermark, pending_watermark,
+                        datetime.datetime.now(datetime.timezone.utc).isoformat()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manages the watermarks of incremental copies, the query is read from stdin')
+    parser.add_argument('step', choices=['prepare', 'commit'])
+    parser.add_argument('--source-db', required=True, help='The alias of the source database')
+    parser.add_argument('--target-table', required=True, help='The table into which the rows are copied')
+    parser.add_argument('--watermark-column', help='The increasing column (for `prepare`)')
+    args = parser.parse_args()
+
+    query = sys.stdin.read()
+    if args.step == 'prepare':
+        if not args.watermark_column:
+            parser.error('--watermark-column is required for prepare')
+        print(prepare(args.source_db, args.target_table, query, args.watermark_column))
+    else:
+        commit(args.source_db, args.target_table, query)
+
+
+if __name__ == '__main__':
+    main()
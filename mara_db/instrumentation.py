@@ -0,0 +1,268 @@
+"""Timing events for connecting to databases, executing queries and fetching results"""
+
+import threading
+import time
+import typing
+import warnings
+
+# functions that are called with each `Event`, see `add_listener`
+listeners = []
+
+
+class Event:
+    """Something that happened while talking to a database"""
+
+    def __init__(self, kind: str, alias: typing.Optional[str], duration: float = None, rows: int = None,
+                 bytes: int = None, error: BaseException = None, query: str = None):
+        """
+        Args:
+            kind: One of 'connect', 'execute', 'fetch' or 'error'
+            alias: The alias of the database, None when the database is not configured in `mara_db.config.databases`
+            duration: Seconds it took to connect, to execute the query or to fetch all rows from the cursor
+            rows: The number of rows fetched (for 'fetch' events)
+            bytes: The estimated size of the fetched values (for 'fetch' events)
+            error: The exception (for 'error' events)
+            query: The executed query (for 'execute' and 'error' events)
+        """
+        self.kind = kind
+        self.alias = alias
+        self.duration = duration
+        self.rows = rows
+        self.bytes = bytes
+        self.error = error
+        self.query = query
+
+    def __repr__(self) -> str:
+        return (f'<Event: ' + ', '.join([f'{var}={getattr(self, var)!r}' for var in vars(self)
+                                         if getattr(self, var) is not None and var != 'query']) + '>')
+
+
+def add_listener(listener: typing.Callable[[Event], None]):
+    """
+    Registers a function that is called with each event emitted by `dbs.connect` and `dbs.cursor_context`
+
+    Listeners are called synchronously in the thread that talks to the database, they should be fast.
+    When no listener is registered, database access is not instrumented at all.
+
+    Example:
+        >>> add_listener(lambda event: print(event))
+    """
+    if listener not in listeners:
+        listeners.append(listener)
+
+
+def remove_listener(listener: typing.Callable[[Event], None]):
+    """Unregisters a listener that was added with `add_listener`"""
+    if listener in listeners:
+        listeners.remove(listener)
+
+
+def emit(event: Event):
+    """Passes an event to all listeners. Errors in listeners are turned into warnings."""
+    for listener in list(listeners):
+        try:
+            listener(event)
+        except Exception as e:
+            warnings.warn(f'Instrumentation listener {listener!r} failed: {e!r}')
+
+
+def alias_of(db: object) -> typing.Optional[str]:
+    """Returns the alias under which a database is configured"""
+    if isinstance(db, str):
+        return db
+    from . import dbs
+    with dbs._registry_lock:
+        for alias, (resolved_db, _) in dbs._registry.items():
+            if resolved_db is db:
+                return alias
+    return None
+
+
+class InstrumentedCursor:
+    """
+    A proxy around a DB-API 2.0 cursor which emits 'execute' and 'error' events per query and a 'fetch'
+    event with the accumulated number of rows, size and fetch time after the results of a query are consumed
+    """
+
+    def __init__(self, cursor: object, alias: typing.Optional[str]):
+        self._cursor = cursor
+        self._alias = alias
+        self._rows = 0
+        self._bytes = 0
+        self._fetch_duration = 0.0
+
+    def execute(self, query, *args, **kwargs):
+        return self._timed_execute(self._cursor.execute, query, *args, **kwargs)
+
+    def executemany(self, query, *args, **kwargs):
+        return self._timed_execute(self._cursor.executemany, query, *args, **kwargs)
+
+    def fetchone(self):
+        row = self._timed_fetch(self._cursor.fetchone)
+        if row is not None:
+            self._rows += 1
+            self._bytes += _estimate_size(row)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        return self._count_rows(self._timed_fetch(self._cursor.fetchmany, *args, **kwargs))
+
+    def fetchall(self):
+        return self._count_rows(self._timed_fetch(self._cursor.fetchall))
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany(getattr(self._cursor, 'arraysize', 1) or 1)
+            if not rows:
+                return
+            yield from rows
+
+    def close(self):
+        self._emit_fetch()
+        return self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _timed_execute(self, execute_function, query, *args, **kwargs):
+        self._emit_fetch()
+        start_time = time.monotonic()
+        try:
+            result = execute_function(query, *args, **kwargs)
+        except Exception as e:
+            emit(Event('error', self._alias, duration=time.monotonic() - start_time, error=e, query=query))
+            raise
+        emit(Event('execute', self._alias, duration=time.monotonic() - start_time, query=query))
+        return result
+
+    def _timed_fetch(self, fetch_function, *args, **kwargs):
+        start_time = time.monotonic()
+        try:
+            result = fetch_function(*args, **kwargs)
+        except Exception as e:
+            emit(Event('error', self._alias, duration=time.monotonic() - start_time, error=e))
+            raise
+        self._fetch_duration += time.monotonic() - start_time
+        return result
+
+    def _count_rows(self, rows):
+        self._rows += len(rows)
+        self._bytes += sum(_estimate_size(row) for row in rows)
+        return rows
+
+    def _emit_fetch(self):
+        if self._rows or self._fetch_duration:
+            emit(Event('fetch', self._alias, duration=self._fetch_duration, rows=self._rows, bytes=self._bytes))
+            self._rows, self._bytes, self._fetch_duration = 0, 0, 0.0
+
+
+def _estimate_size(row: typing.Sequence) -> int:
+    """A cheap estimate of the size of the values in a row as transferred over the wire"""
+    size = 0
+    for value in row:
+        if value is None:
+            continue
+        elif isinstance(value, (str, bytes, bytearray, memoryview)):
+            size += len(value)
+        else:
+            size += 8
+    return size
+
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+class Histogram:
+    """Counts observations in cumulative buckets (like a Prometheus histogram)"""
+
+    def __init__(self, buckets: typing.Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsAggregator:
+    """
+    A listener which aggregates events in process: duration histograms per alias and event kind,
+    and counters for fetched rows, fetched bytes and errors
+    """
+
+    def __init__(self, buckets: typing.Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.durations = {}  # (kind, alias) -> Histogram
+        self.rows = {}  # alias -> int
+        self.bytes = {}  # alias -> int
+        self.errors = {}  # alias -> int
+        self._lock = threading.Lock()
+
+    def __call__(self, event: Event):
+        with self._lock:
+            if event.kind == 'error':
+                self.errors[event.alias] = self.errors.get(event.alias, 0) + 1
+                return
+            if event.duration is not None:
+                key = (event.kind, event.alias)
+                if key not in self.durations:
+                    self.durations[key] = Histogram(self.buckets)
+                self.durations[key].observe(event.duration)
+            if event.kind == 'fetch':
+                self.rows[event.alias] = self.rows.get(event.alias, 0) + (event.rows or 0)
+                self.bytes[event.alias] = self.bytes.get(event.alias, 0) + (event.bytes or 0)
+
+    def prometheus_text(self) -> str:
+        """Returns the aggregated metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for kind in ['connect', 'execute', 'fetch']:
+                name = f'mara_db_{kind}_duration_seconds'
+                lines += [f'# HELP {name} Seconds spent in {kind}', f'# TYPE {name} histogram']
+                for (histogram_kind, alias), histogram in sorted(self.durations.items(), key=lambda item: str(item[0])):
+                    if histogram_kind != kind:
+                        continue
+                    label = _label(alias)
+                    for upper_bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{name}_bucket{{{label},le="{upper_bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{{label}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{label}}} {histogram.count}')
+
+            for name, help, values in [('mara_db_fetched_rows_total', 'Number of rows fetched', self.rows),
+                                       ('mara_db_fetched_bytes_total', 'Estimated size of the fetched values',
+                                        self.bytes),
+                                       ('mara_db_errors_total', 'Number of failed connects, queries and fetches',
+                                        self.errors)]:
+                lines += [f'# HELP {name} {help}', f'# TYPE {name} counter']
+                for alias, value in sorted(values.items(), key=lambda item: str(item[0])):
+                    lines.append(f'{name}{{{_label(alias)}}} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self.durations.clear()
+            self.rows.clear()
+            self.bytes.clear()
+            self.errors.clear()
+
+
+def _label(alias: typing.Optional[str]) -> str:
+    value = (alias or '').replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'alias="{value}"'
+
+
+# the aggregator behind `mara_db.views.metrics_blueprint`, added as a listener when the blueprint is registered
+metrics = MetricsAggregator()
@@ -0,0 +1,199 @@
+"""
+Measuring the throughput of copy pipelines
+
+`Meter.copy` passes a stream through unchanged while counting bytes and rows, and a background thread reports
+the totals and rates periodically. `mara_db.shell.copy_command` inserts it as a stage between source and target
+when `mara_db.config.copy_metering` is enabled:
+
+    ... | python -m mara_db.metering --label=dwh.orders --interval=60 | ...
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import typing
+
+# bytes read from the input per call, the buffer is allocated once and reused
+BUFFER_SIZE = 1024 * 1024
+
+
+class Meter:
+    """Counts bytes and rows of a stream and reports throughput periodically"""
+
+    def __init__(self, label: str = None, interval: float = 60, count_rows: bool = True,
+                 callback: typing.Callable[[typing.Dict[str, typing.Any]], None] = None,
+                 stats_file: str = None):
+        """
+        Args:
+            label: A name of the stream that is included in the reports, e.g. the target table
+            interval: Seconds between two reports
+            count_rows: Whether to count lines (rows of text formats). False for binary or compressed streams.
+            callback: A function which is called with the statistics (see `statistics`) instead of printing them
+            stats_file: A file which is overwritten with the statistics as JSON instead of printing them
+        """
+        self.label = label
+        self.interval = interval
+        self.count_rows = count_rows
+        self.callback = callback
+        self.stats_file = stats_file
+
+        self.bytes = 0
+        self.rows = 0
+        self.finished = False
+        self._start_time = None
+        self._last_report = None  # (time, bytes, rows)
+        self._stopped = threading.Event()
+        self._reporter = None
+
+    def copy(self, input: typing.BinaryIO, output: typing.BinaryIO, buffer_size: int = BUFFER_SIZE) -> int:
+        """
+        Copies `input` to `output` until the end of input while counting bytes and rows
+
+        Data is read into a single reusable buffer and written from a view of it, without creating
+        intermediate byte strings.
+
+        Returns:
+            The number of copied bytes
+        """
+        buffer = bytearray(buffer_size)
+        view = memoryview(buffer)
+        self.start()
+        try:
+            while True:
+                size = input.readinto(buffer)
+                if not size:
+                    break
+                if self.count_rows:
+                    self.rows += buffer.count(b'\n', 0, size)
+                self.bytes += size
+                _write_all(output, view[:size])
+            output.flush()
+            self.finished = True
+        finally:
+            self.stop()
+        return self.bytes
+
+    def start(self):
+        """Starts the timer and the background reporting"""
+        self._start_time = time.monotonic()
+        self._last_report = (self._start_time, 0, 0)
+        self._stopped.clear()
+        self._reporter = threading.Thread(target=self._report_periodically, name='mara-db-meter', daemon=True)
+        self._reporter.start()
+
+    def stop(self):
+        """Stops the background reporting and reports the final statistics"""
+        self._stopped.set()
+        if self._reporter is not None:
+            self._reporter.join()
+            self._reporter = None
+        self.report()
+
+    def statistics(self) -> typing.Dict[str, typing.Any]:
+        """
+        Returns the totals since `start`, the average rates, and the rates since the previous report
+
+        Rows and row rates are None when rows are not counted.
+        """
+        now = time.monotonic()
+        bytes, rows = self.bytes, self.rows
+        seconds = now - self._start_time if self._start_time is not None else 0.0
+        last_time, last_bytes, last_rows = self._last_report or (now, 0, 0)
+        recent_seconds = now - last_time
+
+        def rate(value: int, seconds: float) -> typing.Optional[float]:
+            return value / seconds if seconds > 0 else None
+
+        return {'label': self.label,
+                'finished': self.finished,
+                'seconds': seconds,
+                'bytes': bytes,
+                'rows': rows if self.count_rows else None,
+                'bytes_per_second': rate(bytes, seconds),
+                'rows_per_second': rate(rows, seconds) if self.count_rows else None,
+                'recent_bytes_per_second': rate(bytes - last_bytes, recent_seconds),
+                'recent_rows_per_second': rate(rows - last_rows, recent_seconds) if self.count_rows else None}
+
+    def report(self):
+        """Passes the current statistics to the callback, the stats file or stderr"""
+        bytes, rows = self.bytes, self.rows
+        statistics = self.statistics()
+        self._last_report = (time.monotonic(), bytes, rows)
+        try:
+            if self.callback:
+                self.callback(statistics)
+            elif self.stats_file:
+                # written to a temporary file first so that readers never see a partial file
+                with open(f'{self.stats_file}.tmp', 'w') as file:
+                    json.dump(statistics, file)
+                os.replace(f'{self.stats_file}.tmp', self.stats_file)
+            else:
+                print(format_statistics(statistics), file=sys.stderr, flush=True)
+        except Exception as e:
+            # reporting never breaks the stream
+            print(f'Reporting throughput failed: {e!r}', file=sys.stderr, flush=True)
+
+    def _report_periodically(self):
+        while not self._stopped.wait(self.interval):
+            self.report()
+
+
+def format_statistics(statistics: typing.Dict[str, typing.Any]) -> str:
+    """A one line summary of the statistics of a `Meter`"""
+    def size(value: typing.Optional[float]) -> str:
+        value = value or 0
+        for unit in ['B', 'KB', 'MB', 'GB']:
+            if value < 1024:
+                return f'{value:.1f} {unit}'
+            value /= 1024
+        return f'{value:.1f} TB'
+
+    text = ((f'{statistics["label"]}: ' if statistics['label'] else '')
+            + size(statistics['bytes'])
+            + (f', {statistics["rows"]} rows' if statistics['rows'] is not None else '')
+            + f' in {statistics["seconds"]:.1f} s'
+            + f' ({size(statistics["bytes_per_second"])}/s'
+            + (f', {statistics["rows_per_second"] or 0:.0f} rows/s' if statistics['rows'] is not None else ''))
+    if not statistics['finished']:
+        text += (f'; recent {size(statistics["recent_bytes_per_second"])}/s'
+                 + (f', {statistics["recent_rows_per_second"] or 0:.0f} rows/s'
+                    if statistics['rows'] is not None else ''))
+    return text + ')' + (' finished' if statistics['finished'] else '')
+
+
+def _write_all(output: typing.BinaryIO, view: memoryview):
+    """Writes a view completely, also when the output accepts only parts of it per call"""
+    while view:
+        written = output.write(view)
+        if written is None:
+            # non-blocking output that is not ready, wait a bit
+            time.sleep(0.001)
+            continue
+        view = view[written:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Copies stdin to stdout and reports the throughput')
+    parser.add_argument('--label', help='A name of the stream that is included in the reports')
+    parser.add_argument('--interval', type=float, default=60, help='Seconds between two reports')
+    parser.add_argument('--no-rows', action='store_true', help='Do not count rows (for binary formats)')
+    parser.add_argument('--stats-file', help='Write the statistics as JSON to this file instead of to stderr')
+    args = parser.parse_args()
+
+    meter = Meter(label=args.label, interval=args.interval, count_rows=not args.no_rows,
+                  stats_file=args.stats_file)
+    try:
+        # unbuffered file objects, so that each chunk is read and written with a single system call
+        meter.copy(open(sys.stdin.fileno(), 'rb', buffering=0, closefd=False),
+                   open(sys.stdout.fileno(), 'wb', buffering=0, closefd=False))
+    except BrokenPipeError:
+        # the next stage of the pipeline stopped reading, it reports the error
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""Per database connection pools used by `dbs.connect` and `dbs.cursor_context`"""
+
+import collections
+import os
+import threading
+import time
+import typing
+
+
+class PooledConnection:
+    """
+    A proxy around a DB-API 2.0 connection which is handed out by a `ConnectionPool`.
+
+    Calling `close()` does not close the underlying connection but returns it to its pool. All other
+    attributes are passed through to the underlying connection.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', connection: object):
+        self._pool = pool
+        self._connection = connection
+        self._pid = os.getpid()  # the process that owns the connection
+
+    def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool.checkin(connection, pid=self._pid)
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise AttributeError(f'Connection has already been returned to the pool (accessing "{name}")')
+        return getattr(self._connection, name)
+
+    def __enter__(self):
+        self._connection.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self._connection.__exit__(exc_type, exc_val, exc_tb)
+
+    def __repr__(self) -> str:
+        return f'<PooledConnection: {self._connection!r}>'
+
+
+class ConnectionPool:
+    """A thread safe pool of DB-API 2.0 connections to a single database"""
+
+    def __init__(self, factory: typing.Callable[[], object],
+                 min_size: int = 0, max_size: int = 10,
+                 max_idle_time: float = 300, checkout_timeout: float = 30, pre_ping: bool = True):
+        """
+        Args:
+            factory: A function without arguments that opens a new connection
+            min_size: The number of connections that are kept open even when they are idle
+            max_size: The maximum number of connections that can be checked out at the same time
+            max_idle_time: Seconds after which an idle connection (above `min_size`) is closed
+            checkout_timeout: Seconds to wait for a free connection when `max_size` is reached
+            pre_ping: When true, connections are checked for liveness before they are handed out
+        """
+        assert 0 <= min_size <= max_size, 'min_size must be between 0 and max_size'
+        self.factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle_time = max_idle_time
+        self.checkout_timeout = checkout_timeout
+        self.pre_ping = pre_ping
+
+        self._condition = threading.Condition()
+        self._idle = collections.deque()  # (connection, time of check in), most recently used on the right
+        self._size = 0  # number of open connections (idle + checked out)
+        self._pid = os.getpid()
+        self._disposed = False
+
+        for _ in range(min_size):
+            self._idle.append((self.factory(), time.monotonic()))
+            self._size += 1
+
+    def checkout(self) -> PooledConnection:
+        """Returns a connection from the pool, opens a new one when none is idle"""
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._condition:
+            self._check_fork()
+            while True:
+                self._evict_idle_connections()
+                while self._idle:
+                    connection, _ = self._idle.pop()
+                    if not self.pre_ping or is_alive(connection):
+                        return PooledConnection(self, connection)
+                    _close(connection)
+                    self._size -= 1
+
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    raise TimeoutError(f'No free connection in pool after {self.checkout_timeout} seconds '
+                                       f'(max_size={self.max_size})')
+
+        # open connection outside the lock, connecting can be slow
+        try:
+            return PooledConnection(self, self.factory())
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def checkin(self, connection: object, pid: int = None):
+        """
+        Returns a connection to the pool
+
+        Args:
+            connection: The connection
+            pid: The id of the process in which the connection was checked out, defaults to the current process
+        """
+        with self._condition:
+            self._check_fork()
+            if pid is not None and pid != os.getpid():
+                # connection was checked out in the parent process, leave it alone
+                _abandon(connection)
+                return
+            if not self._disposed and _reset(connection):
+                self._idle.append((connection, time.monotonic()))
+            else:
+                _close(connection)
+                self._size -= 1
+            self._evict_idle_connections()
+            self._condition.notify()
+
+    def dispose(self):
+        """Closes all idle connections. Connections which are checked out are closed on check in."""
+        with self._condition:
+            self._check_fork()
+            while self._idle:
+                connection, _ = self._idle.popleft()
+                _close(connection)
+                self._size -= 1
+            self._disposed = True
+
+    def _evict_idle_connections(self):
+        """Closes connections that are idle for longer than `max_idle_time`, keeps at least `min_size` open"""
+        now = time.monotonic()
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.max_idle_time:
+            connection, _ = self._idle.popleft()
+            _close(connection)
+            self._size -= 1
+
+    def _check_fork(self):
+        """Drops all connections inherited from a parent process"""
+        if os.getpid() != self._pid:
+            while self._idle:
+                _abandon(self._idle.popleft()[0])
+            self._size = 0
+            self._pid = os.getpid()
+
+
+def is_alive(connection: object) -> bool:
+    """Checks whether a connection can still be used"""
+    if getattr(connection, 'closed', False):  # psycopg2
+        return False
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+        finally:
+            cursor.close()
+        return _reset(connection)
+    except Exception:
+        return False
+
+
+def _reset(connection: object) -> bool:
+    """Ends an open transaction of a connection, returns False when the connection is not usable anymore"""
+    try:
+        if hasattr(connection, 'rollback'):
+            connection.rollback()
+        return True
+    except Exception:
+        return False
+
+
+def _close(connection: object):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+# Connections inherited from a parent process must not be closed in the child: this would e.g. send a
+# termination message to the server and break the connection of the parent. They are kept referenced
+# here so that their finalizers don't run.
+_abandoned_connections = []
+
+
+def _abandon(connection: object):
+    _abandoned_connections.append(connection)
+
+
+_pools = {}  # by `_cache_key` of the database
+_pools_lock = threading.Lock()
+
+
+def _cache_key(db: 'mara_db.dbs.DB') -> tuple:
+    """
+    The key of a database configuration in caches of connections: configurations with the same values share
+    connections (also when the objects are created again for each call), changed configurations get new ones
+    """
+    return (type(db), tuple(sorted((name, repr(value)) for name, value in vars(db).items())))
+
+
+def connection_pool(db: 'mara_db.dbs.DB', factory: typing.Callable[[], object]) -> ConnectionPool:
+    """
+    Returns the connection pool of a database, creates it with the settings from `mara_db.config` when needed
+
+    Args:
+        db: The database (a `dbs.DB` object)
+        factory: A function without arguments that opens a new connection to the database
+    """
+    key = _cache_key(db)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            from . import config
+            pool = ConnectionPool(factory,
+                                  min_size=config.connection_pool_min_size(),
+                                  max_size=config.connection_pool_max_size(),
+                                  max_idle_time=config.connection_pool_max_idle_time(),
+                                  checkout_timeout=config.connection_pool_checkout_timeout(),
+                                  pre_ping=config.connection_pool_pre_ping())
+            _pools[key] = pool
+        return pool
+
+
+def dispose(db: 'mara_db.dbs.DB' = None):
+    """
+    Closes the idle connections of the pool of a database and removes the pool
+
+    Args:
+        db: The database of which the pool shall be disposed. When not given, all pools are disposed.
+    """
+    with _pools_lock:
+        if db is not None:
+            pools = [_pools.pop(_cache_key(db))] if _cache_key(db) in _pools else []
+        else:
+            pools = list(_pools.values())
+            _pools.clear()
+    for pool in pools:
+        pool.dispose()
+
+
+def _reset_after_fork():
+    global _pools_lock
+    _pools_lock = threading.Lock()
+    for pool in list(_pools.values()):
+        # the lock might have been held by another thread of the parent while forking
+        pool._condition = threading.Condition()
+        pool._check_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
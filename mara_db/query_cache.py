@@ -0,0 +1,191 @@
+"""An opt-in cache for the results of (metadata) queries"""
+
+import collections
+import hashlib
+import pathlib
+import pickle
+import sqlite3
+import threading
+import time
+import typing
+
+from mara_db import dbs, sql_lexer
+
+
+class QueryCache:
+    """
+    A cache of query results, keyed by database, normalized query and parameters.
+
+    Entries expire after a time to live. Results are kept in memory up to `max_bytes` (least recently used
+    entries are evicted first). When a `file_name` is given, evicted entries are spilled to a SQLite file
+    and can be read from there until they expire.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300,
+                 file_name: typing.Union[str, pathlib.Path] = None):
+        """
+        Args:
+            max_bytes: The maximum size of the pickled results kept in memory
+            ttl: Seconds after which a cached result expires
+            file_name: Optional SQLite file for results evicted from memory
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.file_name = file_name
+
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        self._lock = threading.RLock()
+        self._entries = collections.OrderedDict()  # key -> (expires_at, pickled rows), most recently used last
+        self._bytes = 0
+        self._disk = None
+        if file_name:
+            self._disk = sqlite3.connect(str(file_name), check_same_thread=False, isolation_level=None)
+            self._disk.execute('PRAGMA journal_mode = WAL')
+            self._disk.execute(
+                'CREATE TABLE IF NOT EXISTS query_cache (key TEXT PRIMARY KEY, expires_at REAL, data BLOB)')
+
+    def fetchall(self, db: typing.Union[str, dbs.DB], query: str, parameters: object = None,
+                 ttl: float = None) -> typing.List[tuple]:
+        """
+        Returns the result rows of a query from the cache, runs the query when it is not cached
+
+        Args:
+            db: The database in which to run the query (either an alias or a `dbs.DB` object)
+            query: The query to execute
+            parameters: Optional query parameters, in the parameter style of the database driver
+            ttl: Seconds after which the result expires, defaults to the time to live of the cache
+        """
+        key = cache_key(db, query, parameters)
+        rows = self.get(key)
+        if rows is not None:
+            return rows
+
+        with dbs.cursor_context(db) as cursor:
+            if parameters is None:
+                cursor.execute(query)
+            else:
+                cursor.execute(query, parameters)
+            rows = [tuple(row) for row in cursor.fetchall()]
+
+        self.set(key, rows, ttl)
+        return rows
+
+    def get(self, key: str) -> typing.Optional[typing.List[tuple]]:
+        """Returns a cached result or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, data = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return pickle.loads(data)
+                self._remove(key)
+
+            if self._disk is not None:
+                row = self._disk.execute('SELECT expires_at, data FROM query_cache WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    expires_at, data = row
+                    if expires_at > now:
+                        self.hits += 1
+                        self.disk_hits += 1
+                        self._store(key, expires_at, data)
+                        return pickle.loads(data)
+                    self._disk.execute('DELETE FROM query_cache WHERE key = ?', (key,))
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, rows: typing.List[tuple], ttl: float = None):
+        """Adds a result to the cache"""
+        data = pickle.dumps(rows, protocol=pickle.HIGHEST_PROTOCOL)
+        expires_at = time.time() + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            self._store(key, expires_at, data)
+
+    def clear(self):
+        """Removes all cached results (in memory and on disk)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._disk is not None:
+                self._disk.execute('DELETE FROM query_cache')
+
+    def statistics(self) -> typing.Dict[str, int]:
+        """Returns hit/miss counters and the current size of the cache"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'disk_hits': self.disk_hits,
+                    'entries': len(self._entries), 'bytes': self._bytes}
+
+    def _store(self, key: str, expires_at: float, data: bytes):
+        self._remove(key)
+        if len(data) > self.max_bytes:
+            self._spill(key, expires_at, data)
+            return
+        self._entries[key] = (expires_at, data)
+        self._bytes += len(data)
+        while self._bytes > self.max_bytes:
+            evicted_key, (evicted_expires_at, evicted_data) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted_data)
+            self._spill(evicted_key, evicted_expires_at, evicted_data)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+    def _spill(self, key: str, expires_at: float, data: bytes):
+        if self._disk is not None and expires_at > time.time():
+            self._disk.execute('INSERT OR REPLACE INTO query_cache (key, expires_at, data) VALUES (?, ?, ?)',
+                               (key, expires_at, data))
+
+
+def cache_key(db: typing.Union[str, dbs.DB], query: str, parameters: object = None) -> str:
+    """A key for a query result that does not depend on the formatting of the query"""
+    key = '\0'.join([db if isinstance(db, str) else repr(db), normalize_query(query), repr(parameters)])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def normalize_query(query: str) -> str:
+    """Collapses whitespace outside of string literals and removes trailing semicolons"""
+    tokens = []
+    for kind, text in sql_lexer.tokenize(query):
+        tokens.append(' ' if kind == 'whitespace' else text)
+    return ''.join(tokens).strip().rstrip(';').strip()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache() -> QueryCache:
+    """Returns the query cache configured in `mara_db.config`"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            from mara_db import config
+            _default_cache = QueryCache(max_bytes=config.query_cache_max_bytes(),
+                                        ttl=config.query_cache_ttl(),
+                                        file_name=config.query_cache_file_name())
+        return _default_cache
+
+
+def fetchall(db: typing.Union[str, dbs.DB], query: str, parameters: object = None,
+             ttl: float = None) -> typing.List[tuple]:
+    """
+    Returns the result rows of a query, from the default query cache when possible
+
+    Args:
+        db: The database in which to run the query (either an alias or a `dbs.DB` object)
+        query: The query to execute
+        parameters: Optional query parameters, in the parameter style of the database driver
+        ttl: Seconds after which the result expires, defaults to `mara_db.config.query_cache_ttl`
+
+    Example:
+        >>> fetchall('dwh', 'SELECT table_name FROM information_schema.tables')
+    """
+    return default_cache().fetchall(db, query, parameters, ttl)
@@ -5,14 +5,15 @@ Shell command generation for
 """
 
 import shlex
-from functools import singledispatch
+import typing
+from functools import singledispatch, wraps
 from warnings import warn
 
 import sys
 from mara_db import dbs, config
 from multimethod import multidispatch
 
-from mara_db import formats
+from mara_db import formats, sql_lexer
 from mara_db.formats import _check_format_with_args_used, _get_format_from_args
 
 
@@ -125,8 +126,7 @@ def __(db: dbs.SqshSQLServerDB, timezone: str = None, echo_queries: bool = None)
         echo_queries = config.default_echo_queries()
 
     # sqsh does not do anything when a statement is not terminated by a ';', add one to be sure
-    command = "(cat && echo ';') \\\n  | "
-    command += "(cat && echo ';\n\go') \\\n  | "
+    command = _sql_filter_command(terminate=True, suffix='\n;\n\\go\n') + ' \\\n  | '
 
     return (command + 'sqsh -a 1 -d 0 -f 10'
             + (f' -U {db.user}' if db.user else '')
@@ -180,8 +180,7 @@ def __(db: dbs.OracleDB, timezone: str = None, echo_queries: bool = None):
     # sqlplus does not do anything when a statement is not terminated by a ';', add one to be sure
     return (  # Oracle needs a semicolon at the end, with no newlines before
         # Remove all trailing whitespace and then add a semicolon if not there yet
-            shlex.quote(sys.executable)
-            + ''' -c "import sys; sql = sys.stdin.read().strip(); sql = sql + ';' if not sql[-1]==';' else sql; print(sql)" '''
+            _sql_filter_command(terminate=True, suffix='\n')
             + ' \\\n  | sqlplus64 -s '
             + f'{db.user}/{db.password}@{db.host}:{db.port or 1521}/{db.endpoint}')
 
@@ -225,6 +224,112 @@ def __(db: dbs.DatabricksDB, timezone: str = None, echo_queries: bool = None):
 # -------------------------------
 
 
+def _sql_filter_command(first_statement: bool = False, terminate: bool = False, prefix: str = '',
+                        suffix: str = '') -> str:
+    """
+    The shell command that rewrites a query from stdin with `mara_db.sql_lexer`
+
+    Args:
+        first_statement: Only pass the query up to the first semicolon outside of strings and comments
+        terminate: Append a semicolon when the query is not terminated
+        prefix: Text to write before the query
+        suffix: Text to write after the query
+    """
+    return (f'{shlex.quote(sys.executable)} -m mara_db.sql_lexer'
+            + (' --first-statement' if first_statement else '')
+            + (' --terminate' if terminate else '')
+            + (f' --prefix={shlex.quote(prefix)}' if prefix else '')
+            + (f' --suffix={shlex.quote(suffix)}' if suffix else ''))
+
+
+def _metering_command(target_table: str, pipe_format: formats.Format = None) -> str:
+    """
+    The pipeline stage that reports the throughput of a copy command when `config.copy_metering` is enabled,
+    including the leading pipe. Rows are counted only for uncompressed text formats.
+    """
+    if not config.copy_metering():
+        return ''
+    count_rows = not (getattr(pipe_format, 'compression', None)
+                      or isinstance(pipe_format, (formats.PostgresBinaryFormat, formats.AvroFormat,
+                                                  formats.ParquetFormat, formats.OrcFormat)))
+    stats_file = config.copy_metering_stats_file()
+    return (' \\\n  | ' + f'{shlex.quote(sys.executable)} -m mara_db.metering'
+            + f' --label={shlex.quote(target_table)}'
+            + f' --interval={config.copy_metering_interval()}'
+            + ('' if count_rows else ' --no-rows')
+            + (f' --stats-file={shlex.quote(stats_file.format(target_table=target_table))}' if stats_file else ''))
+
+
+def _arrow_export_command(db: dbs.DB, pipe_format: formats.Format) -> str:
+    """
+    A shell command that runs a query from stdin and writes the result as Parquet or Arrow IPC stream
+    (see `mara_db.arrow_export`)
+    """
+    from .bigquery_export import _serialize
+    # the configuration is passed in the environment, so that passwords are not visible in the process list
+    return (f'MARA_DB_ARROW_EXPORT_DB={shlex.quote(_serialize(db))} '
+            # libpq reads the session timezone from PGTZ, like psql in `query_command`
+            + (f'PGTZ={config.default_timezone()} ' if isinstance(db, dbs.PostgreSQLDB) else '')
+            + f'{shlex.quote(sys.executable)} -m mara_db.arrow_export'
+            + f' --pipe-format={shlex.quote(_serialize(pipe_format))}'
+            + f' --batch-rows={config.arrow_export_batch_rows()}')
+
+
+def _format_conversion_command(source_format: formats.Format, target_format: formats.Format) -> str:
+    """
+    A shell command that converts stdin from `source_format` to `target_format` (see `mara_db.format_conversion`)
+    """
+    from .bigquery_export import _serialize
+    return (f'{shlex.quote(sys.executable)} -m mara_db.format_conversion'
+            + f' --source-format={shlex.quote(_serialize(source_format))}'
+            + f' --target-format={shlex.quote(_serialize(target_format))}')
+
+
+def _compress_command(compression: str) -> str:
+    """The shell command that compresses stdin to stdout"""
+    return {'gzip': 'gzip -c', 'zstd': 'zstd -q -c -T0'}[compression]
+
+
+def _decompress_command(compression: str) -> str:
+    """The shell command that decompresses stdin to stdout"""
+    return {'gzip': 'gzip -d -c', 'zstd': 'zstd -q -d -c'}[compression]
+
+
+def _compressed_output(copy_to_stdout_function):
+    """
+    Decorator for `copy_to_stdout_command` implementations: compresses the output when
+    the `pipe_format` has a compression
+    """
+    @wraps(copy_to_stdout_function)
+    def wrapper(db, header: bool = None, footer: bool = None, delimiter_char: str = None, csv_format: bool = None,
+                pipe_format: formats.Format = None):
+        command = copy_to_stdout_function(db, header=header, footer=footer, delimiter_char=delimiter_char,
+                                          csv_format=csv_format, pipe_format=pipe_format)
+        compression = getattr(pipe_format, 'compression', None)
+        return command + ' \\\n  | ' + _compress_command(compression) if compression else command
+
+    return wrapper
+
+
+def _decompressed_input(copy_from_stdin_function):
+    """
+    Decorator for `copy_from_stdin_command` implementations of databases that can not read compressed
+    data: decompresses stdin when the `pipe_format` has a compression
+    """
+    @wraps(copy_from_stdin_function)
+    def wrapper(db, target_table: str, csv_format: bool = None, skip_header: bool = None,
+                delimiter_char: str = None, quote_char: str = None, null_value_string: str = None,
+                timezone: str = None, pipe_format: formats.Format = None):
+        command = copy_from_stdin_function(db, target_table=target_table, csv_format=csv_format,
+                                           skip_header=skip_header, delimiter_char=delimiter_char,
+                                           quote_char=quote_char, null_value_string=null_value_string,
+                                           timezone=timezone, pipe_format=pipe_format)
+        compression = getattr(pipe_format, 'compression', None)
+        return _decompress_command(compression) + ' \\\n  | ' + command if compression else command
+
+    return wrapper
+
+
 @singledispatch
 def copy_to_stdout_command(db: object,
                            header: bool = None,
@@ -242,7 +347,8 @@ def copy_to_stdout_command(db: object,
         footer: Whether a footer will be included or not. False by default. (Only implemented for PostgreSQLDB)
         delimiter_char: str to delimit the fields in one row. Default: tab character
         csv_format: Double quote 'difficult' strings (Only implemented for PostgreSQLDB)
-        pipe_format: The format passed to stdout
+        pipe_format: The format passed to stdout. `formats.ParquetFormat` and `formats.ArrowFormat` are written
+                     by a Python process (see `mara_db.arrow_export`) for PostgreSQL, MySQL and SQLite.
 
     Returns:
         The composed shell command
@@ -264,20 +370,32 @@ def __(alias: str, header: bool = None, footer: bool = None, delimiter_char: str
 
 
 @copy_to_stdout_command.register(dbs.PostgreSQLDB)
+@_compressed_output
 def __(db: dbs.PostgreSQLDB, header: bool = None, footer: bool = None,
        delimiter_char: str = None, csv_format: bool = None, pipe_format: formats.Format = None):
     _check_format_with_args_used(pipe_format, header=header, footer=footer, delimiter_char=delimiter_char, csv_format=csv_format)
     if not pipe_format:
         pipe_format = _get_format_from_args(header=header, footer=footer, delimiter_char=delimiter_char, csv_format=csv_format)
 
-    if isinstance(pipe_format, formats.CsvFormat):
+    if isinstance(pipe_format, (formats.ParquetFormat, formats.ArrowFormat)):
+        return _arrow_export_command(db, pipe_format)
+
+    elif isinstance(pipe_format, formats.CsvFormat):
         assert not (pipe_format.footer or pipe_format.header), 'unsupported when format is CsvFormat'
         delimiter_char = pipe_format.delimiter_char or ','
-        return (r" sed '/\;/q' | sed 's/\;.*//' " + '\\\n'
-               + f'''| (echo "COPY (" && cat && echo ") TO STDOUT WITH CSV  DELIMITER '{delimiter_char}' ") \\\n'''
+        return (_sql_filter_command(first_statement=True, prefix='COPY (\n',
+                                    suffix=f"\n) TO STDOUT WITH CSV  DELIMITER '{delimiter_char}' \n") + ' \\\n'
                + '  | ' + query_command(db, echo_queries=False) + ' --variable=FETCH_COUNT=10000 \\\n'
                + "  | sed '/^$/d'")  # remove empty lines
 
+    elif isinstance(pipe_format, formats.PostgresBinaryFormat):
+        if isinstance(db, dbs.RedshiftDB):
+            raise ValueError(f'Unsupported pipe_format for RedshiftDB: {pipe_format}')
+        # binary output is passed through as it is, without removing empty lines
+        return (_sql_filter_command(first_statement=True, prefix='COPY (\n',
+                                    suffix='\n) TO STDOUT WITH (FORMAT binary)\n') + ' \\\n'
+                + '  | ' + query_command(db, echo_queries=False))
+
     elif isinstance(pipe_format, formats.NativeFormat):
         header_argument = '--tuples-only' if not header else ''
         footer_argument = '--pset="footer=off"' if not footer else ''
@@ -292,12 +410,22 @@ def __(db: dbs.PostgreSQLDB, header: bool = None, footer: bool = None,
 
 
 @copy_to_stdout_command.register(dbs.BigQueryDB)
+@_compressed_output
 def __(db: dbs.BigQueryDB, header: bool = None, footer: bool = None, delimiter_char: str = None,
        csv_format: bool = None, pipe_format: formats.Format = None):
     _check_format_with_args_used(pipe_format, header=header, footer=footer, delimiter_char=delimiter_char, csv_format=csv_format)
     if not pipe_format:
         pipe_format = _get_format_from_args(header=header, footer=footer, delimiter_char=delimiter_char, csv_format=csv_format)
 
+    if db.storage_read_streams:
+        from .bigquery_export import _serialize
+        if isinstance(pipe_format, formats.CsvFormat) and pipe_format.footer:
+            raise ValueError('Unsupported pipe_format.footer for BigQueryDB')
+        return (f'{shlex.quote(sys.executable)} -m mara_db.bigquery_export'
+                + f' --db={shlex.quote(_serialize(db))}'
+                + f' --pipe-format={shlex.quote(_serialize(pipe_format))}'
+                + f' --streams={db.storage_read_streams}')
+
     if isinstance(pipe_format, formats.CsvFormat):
         if pipe_format.header:
             raise ValueError('Unsupported pipe_format.header for BigQueryDB')
@@ -315,6 +443,7 @@ def __(db: dbs.BigQueryDB, header: bool = None, footer: bool = None, delimiter_c
 
 
 @copy_to_stdout_command.register(dbs.MysqlDB)
+@_compressed_output
 def __(db: dbs.MysqlDB, header: bool = None, footer: bool = None, delimiter_char: str = None, csv_format: bool = None,
        pipe_format: formats.Format = None):
     _check_format_with_args_used(pipe_format, header=header, footer=footer, delimiter_char=delimiter_char, csv_format=csv_format)
@@ -323,7 +452,10 @@ def __(db: dbs.MysqlDB, header: bool = None, footer: bool = None, delimiter_char
 
     header: bool
 
-    if isinstance(pipe_format, formats.CsvFormat):
+    if isinstance(pipe_format, (formats.ParquetFormat, formats.ArrowFormat)):
+        return _arrow_export_command(db, pipe_format)
+
+    elif isinstance(pipe_format, formats.CsvFormat):
         if pipe_format.footer:
             raise ValueError('Unsupported pipe_format.footer for MysqlDB')
         if pipe_format.delimiter_char:
@@ -342,6 +474,7 @@ def __(db: dbs.MysqlDB, header: bool = None, footer: bool = None, delimiter_char
 
 
 @copy_to_stdout_command.register(dbs.SqshSQLServerDB)
+@_compressed_output
 def __(db: dbs.SqshSQLServerDB, header: bool = None, footer: bool = None, delimiter_char: str = None,
        csv_format: bool = None, pipe_format: formats.Format = None):
     _check_format_with_args_used(pipe_format, header=header, footer=footer, delimiter_char=delimiter_char, csv_format=csv_format)
@@ -366,6 +499,7 @@ def __(db: dbs.SqshSQLServerDB, header: bool = None, footer: bool = None, delimi
 
 
 @copy_to_stdout_command.register(dbs.SqlcmdSQLServerDB)
+@_compressed_output
 def __(db: dbs.SqlcmdSQLServerDB, header: bool = None, footer: bool = None, delimiter_char: str = None,
        csv_format: bool = None, pipe_format: formats.Format = None):
     _check_format_with_args_used(pipe_format, header=header, footer=footer, delimiter_char=delimiter_char, csv_format=csv_format)
@@ -389,8 +523,7 @@ def __(db: dbs.SqlcmdSQLServerDB, header: bool = None, footer: bool = None, deli
         raise ValueError(f'Unsupported pipe_format for SqlcmdSQLServerDB: {pipe_format}')
 
     # manipulate the SQL query
-    command = "(echo 'SET NOCOUNT ON\n' && cat) \\\n  | "
-    command += "(echo 'GO\n' && cat) \\\n  | "
+    command = _sql_filter_command(prefix='GO\n\nSET NOCOUNT ON\n\n') + ' \\\n  | '
 
     return (command + query_command(db, echo_queries=False)
             + ' -W'
@@ -402,6 +535,7 @@ def __(db: dbs.SqlcmdSQLServerDB, header: bool = None, footer: bool = None, deli
 
 
 @copy_to_stdout_command.register(dbs.OracleDB)
+@_compressed_output
 def __(db: dbs.OracleDB, header: bool = None, footer: bool = None, delimiter_char: str = None, csv_format: bool = None,
        pipe_format: formats.Format = None):
     _check_format_with_args_used(pipe_format, header=header, footer=footer, delimiter_char=delimiter_char, csv_format=csv_format)
@@ -427,6 +561,7 @@ def __(db: dbs.OracleDB, header: bool = None, footer: bool = None, delimiter_cha
 
 
 @copy_to_stdout_command.register(dbs.SQLiteDB)
+@_compressed_output
 def __(db: dbs.SQLiteDB, header: bool = None, footer: bool = None, delimiter_char: str = None, csv_format: bool = None,
        pipe_format: formats.Format = None):
     _check_format_with_args_used(pipe_format, header=header, footer=footer, delimiter_char=delimiter_char, csv_format=csv_format)
@@ -436,7 +571,10 @@ def __(db: dbs.SQLiteDB, header: bool = None, footer: bool = None, delimiter_cha
     header_argument: str
     delimiter_char: str
 
-    if isinstance(pipe_format, formats.CsvFormat):
+    if isinstance(pipe_format, (formats.ParquetFormat, formats.ArrowFormat)):
+        return _arrow_export_command(db, pipe_format)
+
+    elif isinstance(pipe_format, formats.CsvFormat):
         if pipe_format.footer:
             raise ValueError('pipe_format.footer is not supported for SQLiteDB')
 
@@ -454,6 +592,7 @@ def __(db: dbs.SQLiteDB, header: bool = None, footer: bool = None, delimiter_cha
 
 
 @copy_to_stdout_command.register(dbs.SnowflakeDB)
+@_compressed_output
 def __(db: dbs.SnowflakeDB, header: bool = None, footer: bool = None, delimiter_char: str = None, csv_format: bool = None,
        pipe_format: formats.Format = None):
     _check_format_with_args_used(pipe_format, header=header, footer=footer, delimiter_char=delimiter_char, csv_format=csv_format)
@@ -492,6 +631,7 @@ def __(db: dbs.SnowflakeDB, header: bool = None, footer: bool = None, delimiter_
 
 
 @copy_to_stdout_command.register(dbs.DatabricksDB)
+@_compressed_output
 def __(db: dbs.DatabricksDB, header: bool = None, footer: bool = None, delimiter_char: str = None, csv_format: bool = None,
        pipe_format: formats.Format = None):
     _check_format_with_args_used(pipe_format, header=header, footer=footer, delimiter_char=delimiter_char, csv_format=csv_format)
@@ -575,6 +715,7 @@ def __(alias: str, target_table: str, csv_format: bool = None, skip_header: bool
 
 
 @copy_from_stdin_command.register(dbs.PostgreSQLDB)
+@_decompressed_input
 def __(db: dbs.PostgreSQLDB, target_table: str, csv_format: bool = None, skip_header: bool = None,
        delimiter_char: str = None, quote_char: str = None, null_value_string: str = None, timezone: str = None,
        pipe_format: formats.Format = None):
@@ -584,9 +725,20 @@ def __(db: dbs.PostgreSQLDB, target_table: str, csv_format: bool = None, skip_he
         pipe_format = _get_format_from_args(header=skip_header, delimiter_char=delimiter_char, csv_format=csv_format,
                                             quote_char=quote_char, null_value_string=null_value_string)
 
-    columns = ''
+    sed_stdin, sql = _postgres_copy_from_stdin_sql(target_table, pipe_format)
+
+    # escape double quotes
+    sql = sql.replace('"', '\\"')
+
+    return f'{sed_stdin}{query_command(db, timezone)} \\\n      --command="{sql}"'
+
+
+def _postgres_copy_from_stdin_sql(target_table: str, pipe_format: formats.Format,
+                                  columns: typing.List[str] = None) -> typing.Tuple[str, str]:
+    """Returns a shell command prefix that prepares stdin and the `COPY ... FROM STDIN` statement"""
     if isinstance(pipe_format, formats.JsonlFormat):
-        columns = ' (' + ', '.join(['data']) + ')'
+        columns = ['data']
+    columns = ' (' + ', '.join(columns) + ')' if columns else ''
 
     sed_stdin = ''
     sql = f'COPY {target_table}{columns} FROM STDIN WITH'
@@ -606,16 +758,16 @@ def __(db: dbs.PostgreSQLDB, target_table: str, csv_format: bool = None, skip_he
         if pipe_format.quote_char is not None:
             sql += f" QUOTE AS '{pipe_format.quote_char}'"
 
+    elif isinstance(pipe_format, formats.PostgresBinaryFormat):
+        sql += ' (FORMAT binary)'
+
     elif isinstance(pipe_format, formats.NativeFormat):
         pass
 
     else:
         raise ValueError(f'Unsupported pipe_format for PostgreSQLDB: {pipe_format}')
 
-    # escape double quotes
-    sql = sql.replace('"', '\\"')
-
-    return f'{sed_stdin}{query_command(db, timezone)} \\\n      --command="{sql}"'
+    return sed_stdin, sql
 
 
 @copy_from_stdin_command.register(dbs.RedshiftDB)
@@ -631,13 +783,15 @@ def __(db: dbs.RedshiftDB, target_table: str, csv_format: bool = None, skip_head
     import uuid
     import datetime
 
-    tmp_file_name = f'tmp-{datetime.datetime.now().isoformat()}-{uuid.uuid4().hex}.csv'
-    s3_write_command = f'AWS_ACCESS_KEY_ID={db.aws_access_key_id} AWS_SECRET_ACCESS_KEY={db.aws_secret_access_key} aws s3 cp - s3://{db.aws_s3_bucket_name}/{tmp_file_name}'
-    s3_delete_tmp_file_command = f'AWS_ACCESS_KEY_ID={db.aws_access_key_id} AWS_SECRET_ACCESS_KEY={db.aws_secret_access_key} aws s3 rm s3://{db.aws_s3_bucket_name}/{tmp_file_name}'
+    compression = getattr(pipe_format, 'compression', None)
+    file_extension = {None: '', 'gzip': '.gz', 'zstd': '.zst'}[compression]
+    split = db.copy_file_count and db.copy_file_count > 1
+    aws_env = f'AWS_ACCESS_KEY_ID={db.aws_access_key_id} AWS_SECRET_ACCESS_KEY={db.aws_secret_access_key}'
 
     columns = ''
     sed_stdin = ''
-    sql = f"COPY {target_table}{columns} FROM 's3://{db.aws_s3_bucket_name}/{tmp_file_name}' access_key_id '{db.aws_access_key_id}' secret_access_key '{db.aws_secret_access_key}'"
+    sql_options = f" access_key_id '{db.aws_access_key_id}' secret_access_key '{db.aws_secret_access_key}'"
+    header = False
     if isinstance(pipe_format, formats.JsonlFormat):
         columns = ' (' + ', '.join(['data']) + ')'
         # escapes JSON escapings since PostgreSQL interprets C-escapes in TEXT mode
@@ -652,15 +806,16 @@ def __(db: dbs.RedshiftDB, target_table: str, csv_format: bool = None, skip_head
             quote_char = pipe_format.quote_char
         if skip_header is None:
             skip_header = pipe_format.header
-        sql += ' CSV'
-        if pipe_format.header:
-            sql += ' HEADER'
+        header = pipe_format.header
+        sql_options += ' CSV'
+        if pipe_format.header and not split:
+            sql_options += ' HEADER'
         if pipe_format.delimiter_char is not None:
-            sql += f" DELIMITER AS '{pipe_format.delimiter_char}'"
+            sql_options += f" DELIMITER AS '{pipe_format.delimiter_char}'"
         if pipe_format.null_value_string is not None:
-            sql += f" NULL AS '{pipe_format.null_value_string}'"
+            sql_options += f" NULL AS '{pipe_format.null_value_string}'"
         if pipe_format.quote_char is not None:
-            sql += f" QUOTE AS '{pipe_format.quote_char}'"
+            sql_options += f" QUOTE AS '{pipe_format.quote_char}'"
 
     elif isinstance(pipe_format, formats.NativeFormat):
         pass
@@ -668,6 +823,44 @@ def __(db: dbs.RedshiftDB, target_table: str, csv_format: bool = None, skip_head
     else:
         raise ValueError(f'Unsupported pipe_format for RedshiftDB: {pipe_format}')
 
+    if compression:
+        sql_options += f' {compression.upper()}'
+
+    if not split:
+        # the data is staged in S3 as it is received (compressed or not)
+        tmp_file_name = f'tmp-{datetime.datetime.now().isoformat()}-{uuid.uuid4().hex}.csv{file_extension}'
+        s3_write_command = f'{aws_env} aws s3 cp - s3://{db.aws_s3_bucket_name}/{tmp_file_name}'
+        s3_delete_tmp_file_command = f'{aws_env} aws s3 rm s3://{db.aws_s3_bucket_name}/{tmp_file_name}'
+        sql = f"COPY {target_table}{columns} FROM 's3://{db.aws_s3_bucket_name}/{tmp_file_name}'{sql_options}"
+
+    else:
+        # stdin is split round robin line by line into `copy_file_count` files which are uploaded concurrently
+        import json
+
+        tmp_folder = f's3://{db.aws_s3_bucket_name}/tmp-{datetime.datetime.now().isoformat()}-{uuid.uuid4().hex}/'
+        suffix_length = max(2, len(str(db.copy_file_count - 1)))
+        upload_command = f'{aws_env} aws s3 cp - {tmp_folder}$FILE{file_extension}'
+
+        s3_write_command = ''
+        if compression:
+            # compressed data can not be split line wise, each file is compressed on its own
+            s3_write_command += _decompress_command(compression) + ' \\\n  | '
+            upload_command = _compress_command(compression) + ' | ' + upload_command
+        if header:
+            # removes the header before splitting, otherwise it would end up in the first file only
+            s3_write_command += 'tail -n +2 \\\n  | '
+        s3_write_command += (f'split -n r/{db.copy_file_count} -a {suffix_length} --numeric-suffixes'
+                             f' --filter={shlex.quote(upload_command)} - part-')
+
+        manifest = json.dumps({'entries': [{'url': f'{tmp_folder}part-{i:0{suffix_length}d}{file_extension}',
+                                            'mandatory': True}
+                                           for i in range(db.copy_file_count)]})
+        s3_write_command += (' &&\n\n' + f'echo {shlex.quote(manifest)} \\\n'
+                             + f'  | {aws_env} aws s3 cp - {tmp_folder}manifest')
+
+        s3_delete_tmp_file_command = f'{aws_env} aws s3 rm --recursive --quiet {tmp_folder}'
+        sql = f"COPY {target_table}{columns} FROM '{tmp_folder}manifest'{sql_options} MANIFEST"
+
     return s3_write_command + ' &&\n\n' \
             + f'{sed_stdin}{query_command(db, timezone)} \\\n      --command="{sql}" \\\n  || /bin/false \\\n  ; RC=$?\n\n' \
             + s3_delete_tmp_file_command+' &&\n  $(exit $RC) || /bin/false'
@@ -732,18 +925,49 @@ def __(db: dbs.BigQueryDB, target_table: str, csv_format: bool = None, skip_head
     else:
         raise ValueError(f'Unsupported pipe_format for BigQueryDB: {pipe_format}')
 
-    tmp_file_name = f'tmp-{datetime.datetime.now().isoformat()}-{uuid.uuid4().hex}.{file_extension}'
-    bq_load_command += f" '{target_table}'  gs://{db.gcloud_gcs_bucket_name}/{tmp_file_name}"
+    compression = getattr(pipe_format, 'compression', None)
+    tmp_name = f'tmp-{datetime.datetime.now().isoformat()}-{uuid.uuid4().hex}'
+
+    if db.gcs_upload_chunk_size and file_extension in ['csv', 'jsonl']:
+        # stdin is uploaded in chunks by concurrent processes and loaded with a wildcard uri
+        tmp_folder = f'gs://{db.gcloud_gcs_bucket_name}/{tmp_name}/'
+        gcs_write_command = ''
+        if compression:
+            # compressed data can not be split line wise, each chunk is compressed on its own
+            gcs_write_command += _decompress_command(compression) + ' \\\n  | '
+        gcs_write_command += (f'{set_env_prefix} {shlex.quote(sys.executable)} -m mara_db.gcs_upload'
+                              + f' --prefix={tmp_folder}part- --extension=.{file_extension}'
+                              + f' --chunk-size={db.gcs_upload_chunk_size}'
+                              + f' --parallelism={db.gcs_upload_parallelism}'
+                              # the header is only in the first chunk, `--skip_leading_rows` would apply to all chunks
+                              + (' --skip-header' if skip_header else '')
+                              + (' --gzip' if compression else ''))
+        bq_load_command = bq_load_command.replace(' --skip_leading_rows=1', '')
+        bq_load_command += f" '{target_table}'  {tmp_folder}part-*"
+        gcs_delete_temp_file_command = f'{set_env_prefix} gsutil -q -m rm -r {tmp_folder}'
+
+    else:
+        if compression:
+            # BigQuery reads gzip compressed CSV and JSON files, zstd is converted to gzip before staging
+            file_extension += '.gz'
+
+        tmp_file_name = f'{tmp_name}.{file_extension}'
+        bq_load_command += f" '{target_table}'  gs://{db.gcloud_gcs_bucket_name}/{tmp_file_name}"
 
-    gcs_write_command = f'{set_env_prefix} gsutil -q cp - gs://{db.gcloud_gcs_bucket_name}/{tmp_file_name}'
-    gcs_delete_temp_file_command = f'{set_env_prefix} gsutil -q rm gs://{db.gcloud_gcs_bucket_name}/{tmp_file_name}'
+        gcs_write_command = f'{set_env_prefix} gsutil -q cp - gs://{db.gcloud_gcs_bucket_name}/{tmp_file_name}'
+        if compression == 'zstd':
+            gcs_write_command = (_decompress_command(compression) + ' \\\n  | ' + _compress_command('gzip')
+                                 + ' \\\n  | ' + gcs_write_command)
+        gcs_delete_temp_file_command = f'{set_env_prefix} gsutil -q rm gs://{db.gcloud_gcs_bucket_name}/{tmp_file_name}'
 
+    # the staged data is removed also when the load fails
     return gcs_write_command + '\\\n  \\\n  && ' \
-           + bq_load_command + '\\\n  \\\n  && ' \
-           + gcs_delete_temp_file_command
+           + bq_load_command + ' \\\n  || /bin/false \\\n  ; RC=$?\n\n' \
+           + gcs_delete_temp_file_command + ' &&\n  $(exit $RC) || /bin/false'
 
 
 @copy_from_stdin_command.register(dbs.SqlcmdSQLServerDB)
+@_decompressed_input
 def __(db: dbs.SqlcmdSQLServerDB, target_table: str, csv_format: bool = None, skip_header: bool = None,
        delimiter_char: str = None, quote_char: str = None, null_value_string: str = None, timezone: str = None,
        pipe_format: formats.Format = None):
@@ -781,19 +1005,55 @@ def __(db: dbs.SqlcmdSQLServerDB, target_table: str, csv_format: bool = None, sk
             else:
                 server = db.host
 
+    bcp_arguments = ((f' -U {db.user}' if db.user else '')
+                     + (f' -P {db.password}' if db.password else '')
+                     + (f' -S {server}' if server else '')
+                     + (' -u' if db.trust_server_certificate else '')
+                     + (f' -d {db.database}' if db.database else '')
+                     + ' -c'
+                     + (f' -t {pipe_format.delimiter_char or ","}' if pipe_format.delimiter_char != '\t' else '')
+                     + (f' -b {db.bcp_batch_size}' if db.bcp_batch_size else '')
+                     + (f' -a {db.bcp_packet_size}' if db.bcp_packet_size else ''))
+
+    if db.bcp_streaming or db.bcp_parallelism > 1:
+        # bcp reads from named pipes while stdin is received, nothing is written to disk
+        fifo_count = db.bcp_parallelism
+        suffix_length = len(str(fifo_count - 1))
+        fifos = [f'"$BCP_DIR/part-{n:0{suffix_length}d}"' for n in range(fifo_count)]
+
+        if fifo_count > 1:
+            # the header is removed before splitting, bulk update locks allow concurrent loads into the same table
+            bcp_arguments += ' -h TABLOCK'
+            write_command = ((f'tail -n +2 | ' if pipe_format.header else '')
+                             + f'split -n r/{fifo_count} -a {suffix_length} --numeric-suffixes'
+                             # transforms CRLF to LF; bcp uses LF in unix systems by default
+                             + ''' --filter='sed "s/\\r$//g" > "$FILE"' - "$BCP_DIR/part-"''')
+        else:
+            bcp_arguments += ' -F2' if pipe_format.header else ''
+            write_command = f'sed "s/\\r$//g" > {fifos[0]}'
+
+        return ('{ BCP_DIR="$(mktemp -d)"; BCP_PIDS=""; \\\n'
+                + f'  mkfifo {" ".join(fifos)}; \\\n'
+                + '  for BCP_FIFO in "$BCP_DIR"/part-*; do \\\n'
+                # a failed bcp process drains its pipe so that the writer is not blocked
+                + f'    (bcp {target_table} in "$BCP_FIFO"{bcp_arguments} \\\n'
+                + '       || { BCP_RC=$?; cat "$BCP_FIFO" > /dev/null; exit $BCP_RC; }) & \\\n'
+                + '    BCP_PIDS="$BCP_PIDS $!"; \\\n'
+                + '  done; \\\n'
+                + f'  {write_command}; BCP_RC=$?; \\\n'
+                # releases readers of pipes that were never opened by the writer
+                + '  for BCP_FIFO in "$BCP_DIR"/part-*; do : <> "$BCP_FIFO"; done; \\\n'
+                + '  for BCP_PID in $BCP_PIDS; do wait $BCP_PID || BCP_RC=1; done; \\\n'
+                + '  rm -rf "$BCP_DIR"; \\\n'
+                + '  [ $BCP_RC = 0 ]; }')
+
     return ('{ '
             # create a temporary file for stdin; bcp does not support stdin by default
             + 'TEMP_STDIN="$(mktemp)"; '
             # transforms CRLF to LF and saves stdin; bcp uses LF in unix systems by default
             + 'cat - | sed "s/\\r$//g" > "${TEMP_STDIN}"; '
             + f'bcp {target_table} in "${{TEMP_STDIN}}"'
-            + (f' -U {db.user}' if db.user else '')
-            + (f' -P {db.password}' if db.password else '')
-            + (f' -S {server}' if server else '')
-            + (' -u' if db.trust_server_certificate else '')
-            + (f' -d {db.database}' if db.database else '')
-            + ' -c'
-            + (f' -t {pipe_format.delimiter_char or ","}' if pipe_format.delimiter_char != '\t' else '')
+            + bcp_arguments
             + (' -F2' if pipe_format.header else '')
             # removes the temporary file
             + f'; rm -f "${{TEMP_STDIN}}" > /dev/null; '
@@ -803,6 +1063,289 @@ def __(db: dbs.SqlcmdSQLServerDB, target_table: str, csv_format: bool = None, sk
 # -------------------------------
 
 
+@singledispatch
+def merge_from_stdin_command(db: object, target_table: str, key_columns: typing.List[str],
+                             columns: typing.List[str], csv_format: bool = None, skip_header: bool = None,
+                             delimiter_char: str = None, quote_char: str = None, null_value_string: str = None,
+                             timezone: str = None, pipe_format: formats.Format = None) -> str:
+    """
+    Creates a shell command that receives data from stdin and merges it into a table (an "upsert"): rows with
+    new keys are inserted, rows with existing keys are updated when at least one of their values changed.
+
+    The data is bulk loaded into a staging table first and then applied to `target_table` with a single
+    statement of the database (`INSERT ... ON CONFLICT`, `MERGE` or `INSERT ... ON DUPLICATE KEY UPDATE`),
+    so that `target_table` is changed in one transaction.
+
+    Args:
+        db: The database to use (either an alias or a `dbs.DB` object
+        target_table: The table into which the data is merged
+        key_columns: The columns that identify a row. For PostgreSQL and MySQL, they need a unique constraint.
+                     Keys must be unique in the data.
+        columns: All columns of the data, in the order in which they are passed from stdin
+        csv_format: Treat the input as a CSV file (comma separated, double quoted literals)
+        skip_header: When true, skip the first line
+        delimiter_char: The character that separates columns
+        quote_char: The character for quoting strings
+        null_value_string: The string that denotes NULL values
+        timezone: Sets the timezone of the client, if applicable
+        pipe_format: The format passed from stdin
+
+    Returns:
+        The composed shell command
+
+    Example:
+        >>> print(merge_from_stdin_command('dwh', 'crm_data.customer', key_columns=['customer_id'],
+        ...                                columns=['customer_id', 'name', 'email'], csv_format=True))
+    """
+    raise NotImplementedError(f'Please implement merge_from_stdin_command for type "{db.__class__.__name__}"')
+
+
+@merge_from_stdin_command.register(str)
+def __(alias: str, target_table: str, key_columns: typing.List[str], columns: typing.List[str],
+       csv_format: bool = None, skip_header: bool = None, delimiter_char: str = None, quote_char: str = None,
+       null_value_string: str = None, timezone: str = None, pipe_format: formats.Format = None):
+    return merge_from_stdin_command(
+        dbs.db(alias), target_table=target_table, key_columns=key_columns, columns=columns, csv_format=csv_format,
+        skip_header=skip_header, delimiter_char=delimiter_char, quote_char=quote_char,
+        null_value_string=null_value_string, timezone=timezone, pipe_format=pipe_format)
+
+
+@merge_from_stdin_command.register(dbs.PostgreSQLDB)
+def __(db: dbs.PostgreSQLDB, target_table: str, key_columns: typing.List[str], columns: typing.List[str],
+       csv_format: bool = None, skip_header: bool = None, delimiter_char: str = None, quote_char: str = None,
+       null_value_string: str = None, timezone: str = None, pipe_format: formats.Format = None):
+    _check_format_with_args_used(pipe_format, header=skip_header, delimiter_char=delimiter_char, csv_format=csv_format,
+                                 quote_char=quote_char, null_value_string=null_value_string)
+    if not pipe_format:
+        pipe_format = _get_format_from_args(header=skip_header, delimiter_char=delimiter_char, csv_format=csv_format,
+                                            quote_char=quote_char, null_value_string=null_value_string)
+    if isinstance(pipe_format, formats.JsonlFormat):
+        raise ValueError(f'Unsupported pipe_format for merging into PostgreSQLDB: {pipe_format}')
+
+    _check_merge_columns(key_columns, columns)
+    staging_table = _merge_staging_table(target_table, temporary=True)
+    update_columns = [column for column in columns if column not in key_columns]
+
+    sed_stdin, copy_sql = _postgres_copy_from_stdin_sql(staging_table, pipe_format, columns)
+
+    # the staging table exists only in the transaction of the psql session
+    statements = [f'BEGIN; CREATE TEMPORARY TABLE {staging_table} ON COMMIT DROP'
+                  f' AS SELECT {", ".join(columns)} FROM {target_table} WITH NO DATA',
+                  copy_sql,
+                  f'INSERT INTO {target_table} AS t ({", ".join(columns)})'
+                  f' SELECT {", ".join(columns)} FROM {staging_table}'
+                  f' ON CONFLICT ({", ".join(key_columns)}) '
+                  + (f'DO UPDATE SET {", ".join(f"{column} = EXCLUDED.{column}" for column in update_columns)}'
+                     # rows are only written when a value changed
+                     f' WHERE ROW({", ".join(f"t.{column}" for column in update_columns)})'
+                     f' IS DISTINCT FROM ROW({", ".join(f"EXCLUDED.{column}" for column in update_columns)})'
+                     if update_columns else 'DO NOTHING')
+                  + '; COMMIT']
+
+    compression = getattr(pipe_format, 'compression', None)
+    return ((_decompress_command(compression) + ' \\\n  | ' if compression else '')
+            + f'{sed_stdin}{query_command(db, timezone)}'
+            + ''.join(' \\\n      --command="' + statement.replace('"', '\\"') + '"' for statement in statements))
+
+
+@merge_from_stdin_command.register(dbs.RedshiftDB)
+def __(db: dbs.RedshiftDB, target_table: str, key_columns: typing.List[str], columns: typing.List[str],
+       csv_format: bool = None, skip_header: bool = None, delimiter_char: str = None, quote_char: str = None,
+       null_value_string: str = None, timezone: str = None, pipe_format: formats.Format = None):
+    raise NotImplementedError(f'Please implement merge_from_stdin_command for type "{db.__class__.__name__}"')
+
+
+@merge_from_stdin_command.register(dbs.SqlcmdSQLServerDB)
+def __(db: dbs.SqlcmdSQLServerDB, target_table: str, key_columns: typing.List[str], columns: typing.List[str],
+       csv_format: bool = None, skip_header: bool = None, delimiter_char: str = None, quote_char: str = None,
+       null_value_string: str = None, timezone: str = None, pipe_format: formats.Format = None):
+    _check_merge_columns(key_columns, columns)
+    # bcp loads in its own session, so the staging table is a regular table that is removed afterwards
+    staging_table = _merge_staging_table(target_table)
+    update_columns = [column for column in columns if column not in key_columns]
+
+    return _merge_via_staging_table(
+        # the union keeps SELECT INTO from copying identity properties, which would make bcp ignore the values
+        create_command=_sql_command(db, f'SELECT TOP 0 {", ".join(columns)} INTO {staging_table} FROM {target_table}'
+                                        f' UNION ALL SELECT TOP 0 {", ".join(columns)} FROM {target_table}'),
+        load_command=copy_from_stdin_command(
+            db, target_table=staging_table, csv_format=csv_format, skip_header=skip_header,
+            delimiter_char=delimiter_char, quote_char=quote_char, null_value_string=null_value_string,
+            timezone=timezone, pipe_format=pipe_format),
+        merge_command=_sql_command(db, 'SET XACT_ABORT ON; BEGIN TRANSACTION; '
+                                   + _merge_statement(f'{target_table} WITH (HOLDLOCK)', staging_table,
+                                                      key_columns, columns,
+                                                      changed=(f'EXISTS (SELECT {", ".join(f"s.{column}" for column in update_columns)}'
+                                                               f' EXCEPT SELECT {", ".join(f"t.{column}" for column in update_columns)})'))
+                                   + '; COMMIT'),
+        drop_command=_sql_command(db, f'DROP TABLE IF EXISTS {staging_table}'))
+
+
+@merge_from_stdin_command.register(dbs.BigQueryDB)
+def __(db: dbs.BigQueryDB, target_table: str, key_columns: typing.List[str], columns: typing.List[str],
+       csv_format: bool = None, skip_header: bool = None, delimiter_char: str = None, quote_char: str = None,
+       null_value_string: str = None, timezone: str = None, pipe_format: formats.Format = None):
+    _check_merge_columns(key_columns, columns)
+    staging_table = _merge_staging_table(target_table)
+    update_columns = [column for column in columns if column not in key_columns]
+
+    return _merge_via_staging_table(
+        # expires automatically when it is not dropped
+        create_command=_sql_command(db, f'CREATE TABLE {staging_table}'
+                                        ' OPTIONS (expiration_timestamp = TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL 1 DAY))'
+                                        f' AS SELECT {", ".join(columns)} FROM {target_table} LIMIT 0'),
+        load_command=copy_from_stdin_command(
+            db, target_table=staging_table, csv_format=csv_format, skip_header=skip_header,
+            delimiter_char=delimiter_char, quote_char=quote_char, null_value_string=null_value_string,
+            timezone=timezone, pipe_format=pipe_format),
+        merge_command=_sql_command(db, _merge_statement(
+            target_table, staging_table, key_columns, columns,
+            changed=' OR '.join(f't.{column} IS DISTINCT FROM s.{column}' for column in update_columns))),
+        drop_command=_sql_command(db, f'DROP TABLE IF EXISTS {staging_table}'))
+
+
+@merge_from_stdin_command.register(dbs.MysqlDB)
+def __(db: dbs.MysqlDB, target_table: str, key_columns: typing.List[str], columns: typing.List[str],
+       csv_format: bool = None, skip_header: bool = None, delimiter_char: str = None, quote_char: str = None,
+       null_value_string: str = None, timezone: str = None, pipe_format: formats.Format = None):
+    _check_format_with_args_used(pipe_format, header=skip_header, delimiter_char=delimiter_char, csv_format=csv_format,
+                                 quote_char=quote_char, null_value_string=null_value_string)
+    if not pipe_format:
+        pipe_format = _get_format_from_args(header=skip_header, delimiter_char=delimiter_char, csv_format=csv_format,
+                                            quote_char=quote_char, null_value_string=null_value_string)
+    if timezone is not None:
+        raise ValueError('Parameter timezone is not supported for MysqlDB')
+
+    load_options = ''
+    if isinstance(pipe_format, formats.CsvFormat):
+        if pipe_format.null_value_string:
+            raise ValueError('pipe_format.null_value_string is not supported for MysqlDB, use NULL or \\N')
+        delimiter_char = pipe_format.delimiter_char or ','
+        quote_char = pipe_format.quote_char or '"'
+        load_options += (f" FIELDS TERMINATED BY '{_escape_sql_string(delimiter_char)}'"
+                         f" OPTIONALLY ENCLOSED BY '{_escape_sql_string(quote_char)}'"
+                         + (' IGNORE 1 LINES' if pipe_format.header else ''))
+    elif isinstance(pipe_format, formats.NativeFormat):
+        # tab separated, the default of LOAD DATA
+        pass
+    else:
+        raise ValueError(f'Unsupported pipe_format for merging into MysqlDB: {pipe_format}')
+
+    _check_merge_columns(key_columns, columns)
+    staging_table = _merge_staging_table(target_table, temporary=True)
+    # MySQL writes rows only when a value changed
+    update_columns = [column for column in columns if column not in key_columns] or key_columns[:1]
+
+    sql = (f'CREATE TEMPORARY TABLE {staging_table} AS SELECT {", ".join(columns)} FROM {target_table} LIMIT 0; '
+           f"LOAD DATA LOCAL INFILE '/dev/stdin' INTO TABLE {staging_table}{load_options} ({', '.join(columns)}); "
+           'START TRANSACTION; '
+           f'INSERT INTO {target_table} ({", ".join(columns)}) SELECT {", ".join(columns)} FROM {staging_table}'
+           f' ON DUPLICATE KEY UPDATE {", ".join(f"{column} = {staging_table}.{column}" for column in update_columns)}; '
+           'COMMIT')
+
+    compression = getattr(pipe_format, 'compression', None)
+    return ((_decompress_command(compression) + ' \\\n  | ' if compression else '')
+            + query_command(db) + ' --local-infile=1 --execute=' + shlex.quote(sql))
+
+
+@merge_from_stdin_command.register(dbs.SnowflakeDB)
+def __(db: dbs.SnowflakeDB, target_table: str, key_columns: typing.List[str], columns: typing.List[str],
+       csv_format: bool = None, skip_header: bool = None, delimiter_char: str = None, quote_char: str = None,
+       null_value_string: str = None, timezone: str = None, pipe_format: formats.Format = None):
+    _check_format_with_args_used(pipe_format, header=skip_header, delimiter_char=delimiter_char, csv_format=csv_format,
+                                 quote_char=quote_char, null_value_string=null_value_string)
+    if not pipe_format:
+        pipe_format = _get_format_from_args(header=skip_header, delimiter_char=delimiter_char, csv_format=csv_format,
+                                            quote_char=quote_char, null_value_string=null_value_string)
+    if timezone is not None:
+        raise ValueError('Parameter timezone is not supported for SnowflakeDB')
+
+    if isinstance(pipe_format, formats.CsvFormat):
+        file_format = (f"TYPE = CSV FIELD_DELIMITER = '{_escape_sql_string(pipe_format.delimiter_char or ',')}'"
+                       f" FIELD_OPTIONALLY_ENCLOSED_BY = '{_escape_sql_string(pipe_format.quote_char or chr(34))}'"
+                       + (' SKIP_HEADER = 1' if pipe_format.header else '')
+                       + (f" NULL_IF = ('{_escape_sql_string(pipe_format.null_value_string)}')"
+                          if pipe_format.null_value_string is not None else ''))
+    elif isinstance(pipe_format, formats.JsonlFormat):
+        file_format = 'TYPE = JSON'
+    else:
+        raise ValueError(f'Unsupported pipe_format for merging into SnowflakeDB: {pipe_format}')
+    compression = getattr(pipe_format, 'compression', None)
+    if compression:
+        file_format += f' COMPRESSION = {compression.upper()}'
+
+    _check_merge_columns(key_columns, columns)
+    staging_table = _merge_staging_table(target_table, temporary=True)
+    update_columns = [column for column in columns if column not in key_columns]
+
+    # stdin is written to a file which is uploaded to the stage of the temporary table in the same session
+    sql_before_file = (f'CREATE TEMPORARY TABLE {staging_table} AS SELECT {", ".join(columns)} FROM {target_table} LIMIT 0;\n'
+                       "PUT 'file://")
+    sql_after_file = (f"' @%{staging_table} AUTO_COMPRESS = FALSE;\n"
+                      + f'COPY INTO {staging_table} ' + (f'({", ".join(columns)}) ' if 'JSON' not in file_format else '')
+                      + f'FROM @%{staging_table} FILE_FORMAT = ({file_format})'
+                      + (' MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE' if 'JSON' in file_format else '') + ';\n'
+                      + _merge_statement(target_table, staging_table, key_columns, columns,
+                                         changed=' OR '.join(f't.{column} IS DISTINCT FROM s.{column}'
+                                                             for column in update_columns))
+                      + ';')
+
+    return ('MERGE_DIR="$(mktemp -d)" \\\n'
+            + '  && cat > "$MERGE_DIR/data" \\\n'
+            + f'  && printf \'%s\\n\' {shlex.quote(sql_before_file)}"$MERGE_DIR/data"{shlex.quote(sql_after_file)} \\\n'
+            + '  | ' + query_command(db) + ' \\\n'
+            + '  || /bin/false \\\n  ; RC=$?\n\n'
+            + 'rm -rf "$MERGE_DIR" &&\n  $(exit $RC) || /bin/false')
+
+
+def _check_merge_columns(key_columns: typing.List[str], columns: typing.List[str]):
+    if not key_columns:
+        raise ValueError('At least one key column is required for merging')
+    missing_columns = [column for column in key_columns if column not in columns]
+    if missing_columns:
+        raise ValueError(f'Key columns {missing_columns} are not in columns')
+
+
+def _merge_staging_table(target_table: str, temporary: bool = False) -> str:
+    """The name of the staging table of a merge, temporary tables are not schema qualified"""
+    import uuid
+    table_name = target_table.split('.')[-1] if temporary else target_table
+    return f'{table_name}_merge_staging' + ('' if temporary else f'_{uuid.uuid4().hex[:12]}')
+
+
+def _merge_statement(target_table: str, staging_table: str, key_columns: typing.List[str],
+                     columns: typing.List[str], changed: str) -> str:
+    """A `MERGE` statement that updates rows only when the `changed` condition on `t` and `s` is true"""
+    update_columns = [column for column in columns if column not in key_columns]
+    return (f'MERGE INTO {target_table} AS t USING {staging_table} AS s'
+            f' ON {" AND ".join(f"t.{column} = s.{column}" for column in key_columns)}'
+            + (f' WHEN MATCHED AND ({changed}) THEN UPDATE SET'
+               f' {", ".join(f"{column} = s.{column}" for column in update_columns)}' if update_columns else '')
+            + f' WHEN NOT MATCHED THEN INSERT ({", ".join(columns)})'
+            f' VALUES ({", ".join(f"s.{column}" for column in columns)})')
+
+
+def _merge_via_staging_table(create_command: str, load_command: str, merge_command: str, drop_command: str) -> str:
+    """Chains the steps of a merge through a regular staging table, which is dropped also when a step fails"""
+    return (create_command + ' \\\n'
+            + '  && (' + load_command + ') \\\n'
+            + '  && ' + merge_command + ' \\\n'
+            + '  || /bin/false \\\n  ; RC=$?\n\n'
+            + drop_command + ' &&\n  $(exit $RC) || /bin/false')
+
+
+def _sql_command(db: dbs.DB, sql: str) -> str:
+    """A shell command that runs a single statement with `query_command`"""
+    return f"printf '%s\\n' {shlex.quote(sql + ';')} | " + query_command(db)
+
+
+def _escape_sql_string(value: str) -> str:
+    return value.replace('\\', '\\\\').replace("'", "''")
+
+
+# -------------------------------
+
+
 @multidispatch
 def copy_command(source_db: object, target_db: object, target_table: str,
                  timezone=None, csv_format=None, delimiter_char=None,
@@ -813,6 +1356,9 @@ def copy_command(source_db: object, target_db: object, target_table: str,
     - executes the query in `source_db`
     - writes the results of the query to `target_table` in `target_db`
 
+    For combinations of databases without a specific implementation, the output of the source is converted
+    with `mara_db.format_conversion` when the target can not read it.
+
     Args:
         source_db: The database in which to run the query (either an alias or a `dbs.DB` object
         target_db: The database where to write the query results (alias or db configuration)
@@ -861,9 +1407,11 @@ def __(source_db: dbs.DB, target_db_alias: str, target_table: str, timezone: str
 def __(source_db: dbs.PostgreSQLDB, target_db: dbs.PostgreSQLDB, target_table: str,
        timezone: str = None, csv_format: bool = None, delimiter_char: str = None, pipe_format: formats.Format = None):
     return (copy_to_stdout_command(source_db, delimiter_char=delimiter_char, csv_format=csv_format,
-                                   pipe_format=pipe_format) + ' \\\n'
+                                   pipe_format=pipe_format)
+            + _metering_command(target_table, pipe_format) + ' \\\n'
             + '  | ' + copy_from_stdin_command(target_db, target_table=target_table,
-                                               null_value_string='', timezone=timezone, csv_format=csv_format,
+                                               null_value_string='' if not pipe_format else None,
+                                               timezone=timezone, csv_format=csv_format,
                                                delimiter_char=delimiter_char, pipe_format=pipe_format))
 
 
@@ -874,7 +1422,8 @@ def __(source_db: dbs.PostgreSQLDB, target_db: dbs.BigQueryDB, target_table: str
         pipe_format = formats.CsvFormat(
             delimiter_char='\t' if not delimiter_char and csv_format else delimiter_char)
     return (copy_to_stdout_command(source_db, delimiter_char=delimiter_char, csv_format=csv_format,
-                                   pipe_format=pipe_format) + ' \\\n'
+                                   pipe_format=pipe_format)
+            + _metering_command(target_table, pipe_format) + ' \\\n'
             + '  | ' + copy_from_stdin_command(target_db, target_table=target_table,
                                                timezone=timezone, csv_format=csv_format,
                                                delimiter_char='\t' if not delimiter_char and csv_format else delimiter_char))
@@ -887,7 +1436,8 @@ def __(source_db: dbs.BigQueryDB, target_db: dbs.PostgreSQLDB, target_table: str
         pipe_format = formats.CsvFormat(
             delimiter_char='\t' if not delimiter_char and csv_format else delimiter_char)
     return (copy_to_stdout_command(source_db, delimiter_char=delimiter_char, csv_format=csv_format,
-                                   pipe_format=pipe_format) + ' \\\n'
+                                   pipe_format=pipe_format)
+            + _metering_command(target_table, pipe_format) + ' \\\n'
             + '  | ' + copy_from_stdin_command(target_db, target_table=target_table,
                                                timezone=timezone, csv_format=csv_format,
                                                pipe_format=pipe_format))
@@ -896,7 +1446,8 @@ def __(source_db: dbs.BigQueryDB, target_db: dbs.PostgreSQLDB, target_table: str
 @copy_command.register(dbs.MysqlDB, dbs.PostgreSQLDB)
 def __(source_db: dbs.MysqlDB, target_db: dbs.PostgreSQLDB, target_table: str,
        timezone: str = None, csv_format: bool = None, delimiter_char: str = None, pipe_format: formats.Format = None):
-    return (copy_to_stdout_command(source_db, pipe_format=pipe_format) + ' \\\n'
+    return (copy_to_stdout_command(source_db, pipe_format=pipe_format)
+            + _metering_command(target_table, pipe_format) + ' \\\n'
             + '  | ' + copy_from_stdin_command(target_db, target_table=target_table,
                                                null_value_string='NULL', timezone=timezone,
                                                csv_format=csv_format, delimiter_char=delimiter_char,
@@ -908,7 +1459,8 @@ def __(source_db: dbs.MysqlDB, target_db: dbs.PostgreSQLDB, target_table: str,
        timezone: str = None, csv_format: bool = None, delimiter_char: str = None, pipe_format: formats.Format = None):
     if csv_format is None and pipe_format is None:
         pipe_format = formats.CsvFormat(delimiter_char=delimiter_char)
-    return (copy_to_stdout_command(source_db, pipe_format=pipe_format) + ' \\\n'
+    return (copy_to_stdout_command(source_db, pipe_format=pipe_format)
+            + _metering_command(target_table, pipe_format) + ' \\\n'
             + '  | ' + copy_from_stdin_command(target_db, target_table=target_table,
                                                null_value_string='NULL', timezone=timezone,
                                                csv_format=csv_format,
@@ -920,7 +1472,8 @@ def __(source_db: dbs.SQLServerDB, target_db: dbs.PostgreSQLDB, target_table: st
        timezone: str = None, csv_format: bool = None, delimiter_char: str = None, pipe_format: formats.Format = None):
     if csv_format is None and pipe_format is None:
         pipe_format = formats.CsvFormat(delimiter_char=delimiter_char, header=True)
-    return (copy_to_stdout_command(source_db, pipe_format=pipe_format) + ' \\\n'
+    return (copy_to_stdout_command(source_db, pipe_format=pipe_format)
+            + _metering_command(target_table, pipe_format) + ' \\\n'
             + '  | ' + copy_from_stdin_command(target_db, target_table=target_table, csv_format=csv_format,
                                                skip_header=True, timezone=timezone,
                                                pipe_format=pipe_format))
@@ -931,7 +1484,8 @@ def __(source_db: dbs.SQLServerDB, target_db: dbs.PostgreSQLDB, target_table: st
        timezone: str = None, csv_format: bool = None, delimiter_char: str = None, pipe_format: formats.Format = None):
     if csv_format is None and pipe_format is None:
         pipe_format = formats.CsvFormat(delimiter_char=delimiter_char, header=True)
-    return (copy_to_stdout_command(source_db, pipe_format=pipe_format) + ' \\\n'
+    return (copy_to_stdout_command(source_db, pipe_format=pipe_format)
+            + _metering_command(target_table, pipe_format) + ' \\\n'
             + '  | ' + copy_from_stdin_command(target_db, target_table=target_table, csv_format=csv_format,
                                                skip_header=True, timezone=timezone,
                                                pipe_format=pipe_format))
@@ -942,7 +1496,8 @@ def __(source_db: dbs.SqlcmdSQLServerDB, target_db: dbs.PostgreSQLDB, target_tab
        timezone: str = None, csv_format: bool = None, delimiter_char: str = None):
     if csv_format is None:
         csv_format = True
-    return (copy_to_stdout_command(source_db) + ' \\\n'
+    return (copy_to_stdout_command(source_db)
+            + _metering_command(target_table) + ' \\\n'
             + '  | ' + copy_from_stdin_command(target_db, target_table=target_table, csv_format=csv_format,
                                                delimiter_char=delimiter_char,
                                                null_value_string='NULL', skip_header=True))
@@ -953,7 +1508,8 @@ def __(source_db: dbs.OracleDB, target_db: dbs.PostgreSQLDB, target_table: str,
        timezone: str = None, csv_format: bool = None, delimiter_char: str = None, pipe_format: formats.Format = None):
     if csv_format is None and pipe_format is None:
         pipe_format = formats.CsvFormat(delimiter_char=delimiter_char, header=False)
-    return (copy_to_stdout_command(source_db, pipe_format=pipe_format) + ' \\\n'
+    return (copy_to_stdout_command(source_db, pipe_format=pipe_format)
+            + _metering_command(target_table, pipe_format) + ' \\\n'
             + '  | ' + copy_from_stdin_command(target_db, target_table=target_table,
                                                csv_format=csv_format, skip_header=False,
                                                null_value_string='NULL', timezone=timezone, pipe_format=pipe_format))
@@ -964,7 +1520,8 @@ def __(source_db: dbs.OracleDB, target_db: dbs.PostgreSQLDB, target_table: str,
        timezone: str = None, csv_format: bool = None, delimiter_char: str = None, pipe_format: formats.Format = None):
     if csv_format is None and pipe_format is None:
         pipe_format = formats.CsvFormat(delimiter_char=delimiter_char, header=False)
-    return (copy_to_stdout_command(source_db, pipe_format=pipe_format) + ' \\\n'
+    return (copy_to_stdout_command(source_db, pipe_format=pipe_format)
+            + _metering_command(target_table, pipe_format) + ' \\\n'
             + '  | ' + copy_from_stdin_command(target_db, target_table=target_table,
                                                csv_format=csv_format, skip_header=False,
                                                null_value_string='NULL', timezone=timezone, pipe_format=pipe_format))
@@ -975,7 +1532,8 @@ def __(source_db: dbs.SQLiteDB, target_db: dbs.PostgreSQLDB, target_table: str,
        timezone: str = None, csv_format: bool = None, delimiter_char: str = None, pipe_format: formats.Format = None):
     if csv_format is None and pipe_format is None:
         pipe_format = formats.CsvFormat(delimiter_char=delimiter_char, quote_char="''")
-    return (copy_to_stdout_command(source_db, pipe_format=pipe_format) + ' \\\n'
+    return (copy_to_stdout_command(source_db, pipe_format=pipe_format)
+            + _metering_command(target_table, pipe_format) + ' \\\n'
             + '  | ' + copy_from_stdin_command(target_db, target_table=target_table, timezone=timezone,
                                                null_value_string='NULL', csv_format=csv_format,
                                                pipe_format=pipe_format))
@@ -986,7 +1544,284 @@ def __(source_db: dbs.SQLiteDB, target_db: dbs.PostgreSQLDB, target_table: str,
        timezone: str = None, csv_format: bool = None, delimiter_char: str = None, pipe_format: formats.Format = None):
     if csv_format is None and pipe_format is None:
         pipe_format = formats.CsvFormat(delimiter_char=delimiter_char, quote_char="''")
-    return (copy_to_stdout_command(source_db, pipe_format=pipe_format) + ' \\\n'
+    return (copy_to_stdout_command(source_db, pipe_format=pipe_format)
+            + _metering_command(target_table, pipe_format) + ' \\\n'
             + '  | ' + copy_from_stdin_command(target_db, target_table=target_table, timezone=timezone,
                                                null_value_string='NULL', quote_char="''", csv_format=csv_format,
                                                pipe_format=pipe_format))
+
+
+@copy_command.register(dbs.DB, dbs.DB)
+def __(source_db: dbs.DB, target_db: dbs.DB, target_table: str,
+       timezone: str = None, csv_format: bool = None, delimiter_char: str = None, pipe_format: formats.Format = None):
+    # all other combinations: the source writes one of its output formats, which is converted
+    # to an input format of the target when the target can not read it
+    if pipe_format is None and (csv_format is not None or delimiter_char is not None):
+        pipe_format = _get_format_from_args(csv_format=csv_format, delimiter_char=delimiter_char)
+    if pipe_format is None:
+        source_format = _output_formats(source_db)[0]
+    elif any(type(pipe_format) is type(output_format) for output_format in _output_formats(source_db)):
+        source_format = pipe_format
+    else:
+        raise ValueError(f'Unsupported pipe_format for {source_db.__class__.__name__}: {pipe_format}')
+    return _converting_copy_command(source_db, target_db, target_table, timezone, source_format,
+                                    _target_format(target_db, source_format))
+
+
+def _converting_copy_command(source_db: dbs.DB, target_db: dbs.DB, target_table: str, timezone: str,
+                             source_format: formats.Format, target_format: formats.Format) -> str:
+    """
+    A copy command that pipes the output of `source_db` in `source_format` through `mara_db.format_conversion`
+    into `target_db` in `target_format` (without the conversion when both formats are the same)
+    """
+    conversion = ''
+    if type(source_format) is not type(target_format) or vars(source_format) != vars(target_format):
+        conversion = ' \\\n  | ' + _format_conversion_command(source_format, target_format)
+    return (copy_to_stdout_command(source_db, pipe_format=source_format)
+            + _metering_command(target_table, source_format)
+            + conversion + ' \\\n'
+            + '  | ' + copy_from_stdin_command(target_db, target_table=target_table, timezone=timezone,
+                                               pipe_format=target_format))
+
+
+def _target_format(target_db: dbs.DB, source_format: formats.Format) -> formats.Format:
+    """
+    The format in which to load data that is written in `source_format` into `target_db`: `source_format` itself
+    when the target can read it, otherwise a typed format for typed data or CSV for text
+    """
+    from .format_conversion import TYPED_FORMATS
+
+    input_formats = _input_formats(target_db)
+    if not input_formats:
+        raise NotImplementedError(f'Please implement copy_from_stdin_command for type "{target_db.__class__.__name__}"')
+    for input_format in input_formats:
+        # the native formats of different databases are not the same, and CSV with quotes can only
+        # be passed on to targets that understand quotes
+        if (type(input_format) is type(source_format) and not isinstance(source_format, formats.NativeFormat)
+                and not (isinstance(source_format, formats.CsvFormat) and not input_format.quote_char)):
+            return source_format
+    typed = isinstance(source_format, TYPED_FORMATS)
+    for input_format in input_formats:
+        if isinstance(input_format, TYPED_FORMATS) == typed:
+            return input_format
+    return input_formats[0]
+
+
+@singledispatch
+def _output_formats(db: object) -> typing.List[formats.Format]:
+    """
+    The formats in which `copy_to_stdout_command` can write data for a database that
+    `mara_db.format_conversion` can read, the first one is used by default
+    """
+    return [formats.CsvFormat(quote_char='"')]
+
+
+@_output_formats.register(dbs.PostgreSQLDB)
+def __(db: dbs.PostgreSQLDB):
+    return [formats.CsvFormat(quote_char='"'), formats.ParquetFormat(), formats.ArrowFormat()]
+
+
+@_output_formats.register(dbs.RedshiftDB)
+def __(db: dbs.RedshiftDB):
+    return [formats.CsvFormat(quote_char='"')]
+
+
+@_output_formats.register(dbs.MysqlDB)
+def __(db: dbs.MysqlDB):
+    return [formats.NativeFormat(), formats.ParquetFormat(), formats.ArrowFormat()]
+
+
+@_output_formats.register(dbs.SQLiteDB)
+def __(db: dbs.SQLiteDB):
+    # the text output of sqlite3 is SQL literals
+    return [formats.ParquetFormat(), formats.ArrowFormat()]
+
+
+@singledispatch
+def _input_formats(db: object) -> typing.List[formats.Format]:
+    """The formats in which `copy_from_stdin_command` can read data for a database, in order of preference"""
+    return []
+
+
+@_input_formats.register(dbs.PostgreSQLDB)
+def __(db: dbs.PostgreSQLDB):
+    return [formats.CsvFormat(quote_char='"')]
+
+
+@_input_formats.register(dbs.BigQueryDB)
+def __(db: dbs.BigQueryDB):
+    return [formats.CsvFormat(quote_char='"'), formats.ParquetFormat(), formats.AvroFormat(), formats.JsonlFormat()]
+
+
+@_input_formats.register(dbs.SqlcmdSQLServerDB)
+def __(db: dbs.SqlcmdSQLServerDB):
+    # bcp does not know quotes
+    return [formats.CsvFormat()]
+
+
+# -------------------------------
+
+
+def parallel_copy_command(source_db: object, target_db: object, target_table: str, query: str,
+                          partitions: typing.List[str], parallelism: int = 4,
+                          timezone: str = None, csv_format: bool = None, delimiter_char: str = None,
+                          pipe_format: formats.Format = None) -> str:
+    """
+    Creates a shell command that copies the result of a query from `source_db` to `target_table` in `target_db`
+    in several partitions, with up to `parallelism` `copy_command` pipelines running at the same time.
+
+    Each partition is copied with its own source query and target connection. The command fails when
+    the copy of any partition fails (all other partitions are still copied).
+
+    Args:
+        source_db: The database in which to run the query (either an alias or a `dbs.DB` object)
+        target_db: The database where to write the query results (alias or db configuration)
+        target_table: The table in which to write the query results
+        query: The query to copy. It is wrapped as a sub query, so it must not end with `ORDER BY` or `LIMIT`
+        partitions: SQL predicates on the columns of the query result which together select all rows exactly
+                    once, e.g. created with `modulo_partitions` or `range_partitions`
+        parallelism: The maximum number of partitions that are copied at the same time
+        timezone: Sets the timezone of the client, if applicable
+        csv_format: double quote 'difficult' strings
+        delimiter_char: The character that separates columns, default '\t'
+        pipe_format: The piping data format to be used
+
+    Returns:
+        A shell command string
+
+    Example:
+        >>> print(parallel_copy_command('crm', 'dwh', 'crm_data.order', 'SELECT * FROM orders',
+        ...                             partitions=modulo_partitions('crm', 'order_id', 8), parallelism=4))
+    """
+    assert partitions, 'At least one partition is required'
+    assert parallelism >= 1, 'parallelism must be at least 1'
+
+    query = sql_lexer.subquery(query)
+
+    # partitions are assigned round robin to the lanes, each lane copies its partitions one after the other
+    lanes = [[] for _ in range(min(parallelism, len(partitions)))]
+    for i, predicate in enumerate(partitions):
+        partition_query = f'SELECT * FROM ({query}) partition_source WHERE {predicate}'
+        lanes[i % len(lanes)].append(
+            f'printf \'%s\\n\' {shlex.quote(partition_query)} \\\n  | '
+            + copy_command(source_db, target_db, target_table=target_table, timezone=timezone,
+                           csv_format=csv_format, delimiter_char=delimiter_char, pipe_format=pipe_format))
+
+    # each lane runs in a background sub shell and continues after a failed partition,
+    # the exit codes of all lanes are collected with `wait`
+    return ('( PARALLEL_COPY_PIDS=\'\'\n\n'
+            + ''.join('( PARALLEL_COPY_LANE_RC=0\n\n'
+                      + ''.join('( ' + partition_command + ' ) || PARALLEL_COPY_LANE_RC=1\n\n' for partition_command in lane)
+                      + 'exit $PARALLEL_COPY_LANE_RC ) &\nPARALLEL_COPY_PIDS="$PARALLEL_COPY_PIDS $!"\n\n'
+                      for lane in lanes)
+            + 'PARALLEL_COPY_RC=0\n'
+            + 'for PID in $PARALLEL_COPY_PIDS; do wait $PID || PARALLEL_COPY_RC=1; done\n'
+            + 'exit $PARALLEL_COPY_RC )')
+
+
+def incremental_copy_command(source_db: object, target_db: object, target_table: str, query: str,
+                             watermark_column: str, timezone: str = None, csv_format: bool = None,
+                             delimiter_char: str = None, pipe_format: formats.Format = None) -> str:
+    """
+    Creates a shell command that copies only the rows of a query that were added or changed since the last
+    successful copy, based on a monotonically increasing column (e.g. an id or an `updated_at` timestamp).
+
+    Before copying, the current maximum of `watermark_column` is read from `source_db`, and the rows above the
+    previously copied maximum and up to the current one are copied with `copy_command`. The new maximum is stored
+    only when the copy succeeds (see `mara_db.incremental`), per source alias, query and target table.
+
+    Args:
+        source_db: The database in which to run the query (an alias or a `dbs.DB` object configured under an alias)
+        target_db: The database where to write the query results (alias or db configuration)
+        target_table: The table in which to write the query results
+        query: The query to copy. It is wrapped as a sub query, so it must not end with `ORDER BY` or `LIMIT`
+        watermark_column: A column of the query result whose values only increase for new or changed rows
+        timezone: Sets the timezone of the client, if applicable
+        csv_format: double quote 'difficult' strings
+        delimiter_char: The character that separates columns, default '\t'
+        pipe_format: The piping data format to be used
+
+    Returns:
+        A shell command string
+
+    Example:
+        >>> print(incremental_copy_command('crm', 'dwh', 'crm_data.order', 'SELECT * FROM orders',
+        ...                                watermark_column='updated_at'))
+    """
+    from .instrumentation import alias_of
+
+    source_db_alias = alias_of(source_db)
+    if source_db_alias is None:
+        raise ValueError('Incremental copies need a source database that is configured under an alias')
+
+    query = sql_lexer.subquery(query)
+    state_arguments = f' --source-db={shlex.quote(source_db_alias)} --target-table={shlex.quote(target_table)}'
+    incremental_command = f'{shlex.quote(sys.executable)} -m mara_db.incremental'
+
+    return ('( INCREMENTAL_QUERY="$(printf \'%s\\n\' ' + shlex.quote(query) + ' \\\n'
+            + f'    | {incremental_command} prepare{state_arguments}'
+            + f' --watermark-column={shlex.quote(watermark_column)})" \\\n'
+            + '  && printf \'%s\\n\' "$INCREMENTAL_QUERY" \\\n  | '
+            + copy_command(dbs.db(source_db_alias), target_db, target_table=target_table, timezone=timezone,
+                           csv_format=csv_format, delimiter_char=delimiter_char, pipe_format=pipe_format)
+            + ' \\\n  && printf \'%s\\n\' ' + shlex.quote(query)
+            + f' | {incremental_command} commit{state_arguments} )')
+
+
+@singledispatch
+def modulo_partitions(db: object, key: str, number_of_partitions: int) -> typing.List[str]:
+    """
+    Returns predicates for `parallel_copy_command` which split rows by the remainder of an integer column.
+    Rows with a NULL key are part of the first partition.
+
+    Args:
+        db: The source database (either an alias or a `dbs.DB` object)
+        key: An integer column (or expression) of the query result
+        number_of_partitions: The number of partitions
+
+    Example:
+        >>> modulo_partitions(dbs.PostgreSQLDB(), 'order_id', 2)
+        ['(ABS(MOD(order_id, 2)) = 0 OR order_id IS NULL)', 'ABS(MOD(order_id, 2)) = 1']
+    """
+    return _modulo_partitions(key, number_of_partitions, f'ABS(MOD({key}, {number_of_partitions}))')
+
+
+@modulo_partitions.register(str)
+def __(alias: str, key: str, number_of_partitions: int) -> typing.List[str]:
+    return modulo_partitions(dbs.db(alias), key, number_of_partitions)
+
+
+@modulo_partitions.register(dbs.SQLServerDB)
+@modulo_partitions.register(dbs.SQLiteDB)
+def __(db: dbs.DB, key: str, number_of_partitions: int) -> typing.List[str]:
+    return _modulo_partitions(key, number_of_partitions, f'ABS({key} % {number_of_partitions})')
+
+
+def _modulo_partitions(key: str, number_of_partitions: int, remainder_expression: str) -> typing.List[str]:
+    assert number_of_partitions >= 1, 'number_of_partitions must be at least 1'
+    predicates = [f'{remainder_expression} = {i}' for i in range(number_of_partitions)]
+    predicates[0] = f'({predicates[0]} OR {key} IS NULL)'
+    return predicates
+
+
+def range_partitions(key: str, boundaries: typing.List[object]) -> typing.List[str]:
+    """
+    Returns predicates for `parallel_copy_command` which split rows into ranges of a column.
+    `n` boundaries result in `n + 1` partitions. Rows with a NULL key are part of the first partition.
+
+    Args:
+        key: A column (or expression) of the query result
+        boundaries: Sorted values at which a new partition starts. Strings are quoted as SQL literals,
+                    other values are rendered as they are.
+
+    Example:
+        >>> range_partitions('order_date', ['2022-01-01', '2023-01-01'])
+        ["(order_date < '2022-01-01' OR order_date IS NULL)", "order_date >= '2022-01-01' AND order_date < '2023-01-01'", "order_date >= '2023-01-01'"]
+    """
+    assert boundaries, 'At least one boundary is required'
+    literals = ["'" + value.replace("'", "''") + "'" if isinstance(value, str) else str(value) for value in boundaries]
+    predicates = [f'({key} < {literals[0]} OR {key} IS NULL)']
+    for lower, upper in zip(literals, literals[1:]):
+        predicates.append(f'{key} >= {lower} AND {key} < {upper}')
+    predicates.append(f'{key} >= {literals[-1]}')
+    return predicates
@@ -0,0 +1,135 @@
+"""
+A small SQL tokenizer that knows about string literals, quoted identifiers, comments and dollar quoting
+
+Used for finding statement boundaries in queries without being fooled by semicolons in strings or comments.
+The module is also a filter for shell pipelines (see `mara_db.shell`):
+
+    echo "SELECT ';' AS x; DROP TABLE y;" | python -m mara_db.sql_lexer --first-statement --prefix='COPY (' --suffix=') TO STDOUT'
+"""
+
+import argparse
+import re
+import sys
+import typing
+
+_token_pattern = re.compile(r'''
+      (?P<whitespace>\s+)
+    | (?P<comment>--[^\n]*|/\*.*?(?:\*/|\Z))
+    | (?P<string>[eE]'(?:[^'\\]|\\.|'')*(?:'|\Z)|'(?:[^']|'')*(?:'|\Z)|\$(?P<tag>[A-Za-z_][A-Za-z0-9_]*)?\$.*?(?:\$(?P=tag)\$|\Z))
+    | (?P<word>[A-Za-z0-9_][A-Za-z0-9_$]*)
+    | (?P<identifier>"(?:[^"]|"")*(?:"|\Z)|`(?:[^`]|``)*(?:`|\Z)|\[[^\]]*(?:\]|\Z))
+    | (?P<semicolon>;)
+    | (?P<other>.)
+''', re.VERBOSE | re.DOTALL)
+
+
+def tokenize(sql: str) -> typing.Iterator[typing.Tuple[str, str]]:
+    """
+    Splits a SQL text into tokens
+
+    Unterminated strings, identifiers and comments extend to the end of the text, so the tokens always
+    add up to the input.
+
+    Args:
+        sql: The SQL text
+
+    Returns:
+        An iterator of (kind, text) tuples. The kind is one of 'whitespace', 'comment', 'word', 'string',
+        'identifier', 'semicolon' or 'other'.
+
+    Example:
+        >>> list(tokenize("SELECT ';' -- x"))
+        [('word', 'SELECT'), ('whitespace', ' '), ('string', "';'"), ('whitespace', ' '), ('comment', '-- x')]
+    """
+    for match in _token_pattern.finditer(sql):
+        yield match.lastgroup, match.group()
+
+
+def split_statements(sql: str) -> typing.List[str]:
+    """Splits a SQL text at semicolons into statements (without the semicolons), empty statements are dropped"""
+    statements, current = [], []
+    for kind, text in tokenize(sql):
+        if kind == 'semicolon':
+            statements.append(''.join(current))
+            current = []
+        else:
+            current.append(text)
+    statements.append(''.join(current))
+    return [statement.strip() for statement in statements
+            if any(kind not in ('whitespace', 'comment') for kind, _ in tokenize(statement))]
+
+
+def first_statement(sql: str) -> str:
+    """Returns the text before the first semicolon that is not part of a string, identifier or comment"""
+    tokens = []
+    for kind, text in tokenize(sql):
+        if kind == 'semicolon':
+            break
+        tokens.append(text)
+    return ''.join(tokens)
+
+
+def subquery(sql: str) -> str:
+    """
+    Returns the first statement of a SQL text without leading whitespace and without trailing whitespace and
+    comments, so that it can be wrapped in parentheses (a trailing line comment would comment out the
+    closing parenthesis)
+
+    Example:
+        >>> subquery('SELECT 1 -- one\n;')
+        'SELECT 1'
+    """
+    tokens = list(tokenize(first_statement(sql)))
+    while tokens and tokens[-1][0] in ('whitespace', 'comment'):
+        tokens.pop()
+    return ''.join(text for _, text in tokens).lstrip()
+
+
+def is_terminated(sql: str, terminator: str = ';') -> bool:
+    """Whether the last token of a SQL text other than whitespace and comments is `terminator`"""
+    last_text = None
+    for kind, text in tokenize(sql):
+        if kind not in ('whitespace', 'comment'):
+            last_text = text
+    return last_text == terminator
+
+
+def terminate(sql: str, terminator: str = ';') -> str:
+    """
+    Appends `terminator` to a SQL text (without trailing whitespace) when it is not terminated yet
+
+    Example:
+        >>> terminate('SELECT 1 -- one\\n')
+        'SELECT 1 -- one\\n;'
+    """
+    sql = sql.rstrip()
+    tokens = list(tokenize(sql))
+    significant_tokens = [text for kind, text in tokens if kind not in ('whitespace', 'comment')]
+    if not significant_tokens or significant_tokens[-1] == terminator:
+        return sql
+    # a terminator in the same line as a trailing line comment would be commented out
+    if tokens[-1][0] == 'comment' and tokens[-1][1].startswith('--'):
+        return sql + '\n' + terminator
+    return sql + terminator
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rewrites a SQL query from stdin and writes it to stdout')
+    parser.add_argument('--first-statement', action='store_true',
+                        help='Only pass the text before the first semicolon')
+    parser.add_argument('--terminate', action='store_true',
+                        help='Remove trailing whitespace and append a semicolon when missing')
+    parser.add_argument('--prefix', default='', help='Text to write before the query')
+    parser.add_argument('--suffix', default='', help='Text to write after the query')
+    args = parser.parse_args()
+
+    sql = sys.stdin.read()
+    if args.first_statement:
+        sql = first_statement(sql)
+    if args.terminate:
+        sql = terminate(sql)
+    sys.stdout.write(args.prefix + sql + args.suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,12 @@
 import functools
+import os
+import threading
 
 import sqlalchemy.engine
 import sqlalchemy.sql.schema
 
 import mara_db.dbs
+import mara_db.pool
 
 
 @functools.singledispatch
@@ -11,6 +14,9 @@ def engine(db: object) -> sqlalchemy.engine.Engine:
     """
     Returns a sql alchemy engine for a configured database connection
 
+    Engines are created once per database and then reused, so that all callers share the same connection pool.
+    The pool settings are taken from `mara_db.config`. Use `invalidate` to drop cached engines.
+
     Args:
         db: The database to use (either an alias or a `dbs.DB` object
 
@@ -31,7 +37,13 @@ def __(alias: str, **_):
 
 @engine.register(mara_db.dbs.DB)
 def __(db: mara_db.dbs.DB, **_):
-    return sqlalchemy.create_engine(db.sqlalchemy_url)
+    return _cached_engine(db, db.sqlalchemy_url, **_queue_pool_options())
+
+
+@engine.register(mara_db.dbs.SQLiteDB)
+def __(db: mara_db.dbs.SQLiteDB, **_):
+    # the pool class for sqlite depends on the sqlalchemy version, not all of them accept a pool size
+    return _cached_engine(db, db.sqlalchemy_url)
 
 
 @engine.register(mara_db.dbs.BigQueryDB)
@@ -39,16 +51,84 @@ def __(db: mara_db.dbs.BigQueryDB):
     # creates bigquery dialect
     url = db.sqlalchemy_url
 
-    return sqlalchemy.create_engine(url,
-                                    credentials_path=db.service_account_json_file_name,
-                                    location=db.location)
+    return _cached_engine(db, url,
+                          credentials_path=db.service_account_json_file_name,
+                          location=db.location,
+                          **_queue_pool_options())
 
 
 @engine.register(mara_db.dbs.DatabricksDB)
 def __(db: mara_db.dbs.DatabricksDB):
     url = db.sqlalchemy_url
 
-    return sqlalchemy.create_engine(url,
-                                    connect_args={
-                                        "http_path": db.http_path
-                                    })
+    return _cached_engine(db, url,
+                          connect_args={
+                              "http_path": db.http_path
+                          },
+                          **_queue_pool_options())
+
+
+def invalidate(db: object = None):
+    """
+    Disposes the cached engine of a database so that the next call of `engine` creates a new one
+
+    Args:
+        db: The database (either an alias or a `dbs.DB` object). When not given, all cached engines are disposed.
+    """
+    if isinstance(db, str):
+        db = mara_db.dbs.db(db)
+
+    with _engines_lock:
+        if db is not None:
+            key = mara_db.pool._cache_key(db)
+            engines = [_engines.pop(key)] if key in _engines else []
+        else:
+            engines = list(_engines.values())
+            _engines.clear()
+
+    for cached_engine in engines:
+        cached_engine.dispose()
+
+
+_engines = {}  # by `pool._cache_key` of the database
+_engines_lock = threading.Lock()
+
+
+def _cached_engine(db: mara_db.dbs.DB, url: str, **kwargs) -> sqlalchemy.engine.Engine:
+    """Returns the cached engine of a database, creates it when needed"""
+    key = mara_db.pool._cache_key(db)
+    with _engines_lock:
+        cached_engine = _engines.get(key)
+        if cached_engine is None:
+            from mara_db import config
+            cached_engine = sqlalchemy.create_engine(url,
+                                                     pool_recycle=config.sqlalchemy_pool_recycle(),
+                                                     pool_pre_ping=config.sqlalchemy_pool_pre_ping(),
+                                                     **kwargs)
+            _engines[key] = cached_engine
+        return cached_engine
+
+
+def _queue_pool_options() -> dict:
+    from mara_db import config
+    return {'pool_size': config.sqlalchemy_pool_size(),
+            'max_overflow': config.sqlalchemy_max_overflow()}
+
+
+def _dispose_engines_after_fork():
+    """Makes sure that a forked process (e.g. a gunicorn worker) does not use the connections of its parent"""
+    global _engines_lock
+    _engines_lock = threading.Lock()
+    for cached_engine in list(_engines.values()):
+        try:
+            # leaves the connections of the parent process untouched
+            cached_engine.dispose(close=False)
+        except TypeError:  # sqlalchemy < 1.4.33
+            # what `dispose(close=False)` does in later versions, the old pool is kept referenced
+            # so that garbage collection does not close the connections of the parent
+            mara_db.pool._abandon(cached_engine.pool)
+            cached_engine.pool = cached_engine.pool.recreate()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_dispose_engines_after_fork)
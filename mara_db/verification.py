@@ -0,0 +1,441 @@
+"""
+Verifying copies by comparing checksums of the source and the target
+
+Row counts and order independent sums of MD5 hashes of the rows (and of each column) are computed in the
+databases, for the source and the target at the same time. When an integer key column is given and the
+checksums differ, they are computed per key range, and mismatching ranges are split further until the
+differing keys are narrowed down. Only the checksums are transferred, never the rows:
+
+    >>> result = verify('crm', 'SELECT * FROM customer', 'dwh', 'SELECT * FROM crm_data.customer',
+    ...                 columns=['customer_id', 'name', 'email'], key_column='customer_id')
+    >>> result.matches, result.mismatches
+    (False, [<Mismatch: customer_id 4096..4111, rows 16/15, columns ['email']>])
+
+Values are hashed as text, so the checksums of different database engines only agree when both render the
+values in the same way (which is the case for integers and strings, but not necessarily for floats, timestamps
+or booleans). Cast such columns in the queries when needed.
+"""
+
+import concurrent.futures
+import functools
+import hashlib
+import math
+import typing
+
+from mara_db import dbs, sql_lexer
+
+# the number of hex digits of the MD5 hash that are summed up, 56 bits fit into a signed 64 bit integer
+HASH_DIGITS = 14
+
+# replaces NULL values in hashed texts
+NULL_TEXT = '#NULL#'
+
+
+class Checksum:
+    """The row count and hash sums of (a key range of) a query result"""
+
+    def __init__(self, count: int = 0, row_hash: int = 0, column_hashes: typing.Dict[str, int] = None,
+                 min_key: int = None, max_key: int = None):
+        """
+        Args:
+            count: The number of rows
+            row_hash: The sum of the hashes of all rows
+            column_hashes: The sum of the hashes of the values by column
+            min_key: The smallest value of the key column
+            max_key: The largest value of the key column
+        """
+        self.count = count
+        self.row_hash = row_hash
+        self.column_hashes = column_hashes or {}
+        self.min_key = min_key
+        self.max_key = max_key
+
+    def __add__(self, other: 'Checksum') -> 'Checksum':
+        keys = [key for key in [self.min_key, self.max_key, other.min_key, other.max_key] if key is not None]
+        return Checksum(count=self.count + other.count, row_hash=self.row_hash + other.row_hash,
+                        column_hashes={column: self.column_hashes.get(column, 0) + other.column_hashes.get(column, 0)
+                                       for column in set(self.column_hashes) | set(other.column_hashes)},
+                        min_key=min(keys) if keys else None, max_key=max(keys) if keys else None)
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, Checksum) and self.count == other.count and self.row_hash == other.row_hash
+                and self.column_hashes == other.column_hashes)
+
+    def __repr__(self) -> str:
+        return f'<Checksum: count={self.count}, row_hash={self.row_hash}>'
+
+
+class Mismatch:
+    """A key range (or the whole result when there is no key column) in which source and target differ"""
+
+    def __init__(self, key_column: typing.Optional[str], low: typing.Optional[int], high: typing.Optional[int],
+                 source: Checksum, target: Checksum):
+        """
+        Args:
+            key_column: The key column, None when the whole results were compared
+            low: The smallest key of the range, None for the rows with a NULL key or without key column
+            high: The largest key of the range
+            source: The checksum of the range in the source
+            target: The checksum of the range in the target
+        """
+        self.key_column = key_column
+        self.low = low
+        self.high = high
+        self.source = source
+        self.target = target
+
+    @property
+    def differing_columns(self) -> typing.List[str]:
+        """The columns with different values in the range"""
+        return [column for column in self.source.column_hashes
+                if self.source.column_hashes[column] != self.target.column_hashes.get(column)]
+
+    def __repr__(self) -> str:
+        if self.key_column is None:
+            range = 'all rows'
+        elif self.low is None:
+            range = f'{self.key_column} NULL'
+        else:
+            range = f'{self.key_column} {self.low}..{self.high}'
+        return (f'<Mismatch: {range}, rows {self.source.count}/{self.target.count}'
+                + (f', columns {self.differing_columns}' if self.differing_columns else '') + '>')
+
+
+class VerificationResult:
+    """The outcome of comparing a source and a target"""
+
+    def __init__(self, source: Checksum, target: Checksum, mismatches: typing.List[Mismatch], queries: int):
+        """
+        Args:
+            source: The checksum of the whole source
+            target: The checksum of the whole target
+            mismatches: The smallest key ranges found in which source and target differ
+            queries: The number of checksum queries that were run (per database)
+        """
+        self.source = source
+        self.target = target
+        self.mismatches = mismatches
+        self.queries = queries
+
+    @property
+    def matches(self) -> bool:
+        return self.source == self.target
+
+    def __repr__(self) -> str:
+        return (f'<VerificationResult: matches={self.matches}, rows {self.source.count}/{self.target.count}'
+                + (f', mismatches={len(self.mismatches)}' if self.mismatches else '') + '>')
+
+
+def verify(source_db: typing.Union[str, dbs.DB], source_query: str,
+           target_db: typing.Union[str, dbs.DB], target_query: str,
+           columns: typing.List[str] = None, key_column: str = None, buckets: int = 16, max_depth: int = 4,
+           max_mismatches: int = 100, per_column: bool = True, max_workers: int = 8) -> VerificationResult:
+    """
+    Compares the results of a query in the source and a query in the target by checksums that are computed in
+    the databases, with the source and target queries running concurrently.
+
+    When the checksums differ and a `key_column` is given, the key range is split into `buckets` ranges
+    and the checksums of all ranges are computed with one grouped query per database. Mismatching ranges are
+    split again, up to `max_depth` times or until a range contains a single key.
+
+    Args:
+        source_db: The source database (either an alias or a `dbs.DB` object)
+        source_query: The query in the source, e.g. the query that was copied. It is wrapped as a sub query,
+                      so it must not end with `ORDER BY`
+        target_db: The target database
+        target_query: The query in the target, e.g. `SELECT * FROM <target_table>`
+        columns: The columns to compare. When not given, only row counts (and key ranges) are compared.
+        key_column: An integer column that identifies rows, used for locating differences
+        buckets: The number of ranges into which a mismatching key range is split
+        max_depth: The maximum number of times a range is split
+        max_mismatches: Ranges are not split any further when more than this number of ranges mismatch
+        per_column: Whether to compute hash sums per column (for reporting the differing columns)
+        max_workers: The maximum number of queries running at the same time
+
+    Returns:
+        The checksums of source and target and the mismatching key ranges
+    """
+    columns = columns or []
+    source_query, target_query = sql_lexer.subquery(source_query), sql_lexer.subquery(target_query)
+    query_count = 0
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                               thread_name_prefix='mara-db-verification') as executor:
+
+        def checksums(ranges: typing.List[typing.Tuple[int, int, int]]) \
+                -> typing.List[typing.Tuple[typing.Dict[int, Checksum], typing.Dict[int, Checksum]]]:
+            """Computes the checksums per bucket for (low, high, bucket_width) ranges in source and target"""
+            futures = [(executor.submit(_bucket_checksums, source_db, source_query, columns, key_column,
+                                        low, high, width, per_column),
+                        executor.submit(_bucket_checksums, target_db, target_query, columns, key_column,
+                                        low, high, width, per_column))
+                       for low, high, width in ranges]
+            return [(source.result(), target.result()) for source, target in futures]
+
+        # rows with a NULL key are in bucket -1, all others in bucket 0
+        source_buckets, target_buckets = checksums([(None, None, None)])[0]
+        query_count += 1
+        source_total = source_buckets.get(-1, Checksum()) + source_buckets.get(0, Checksum())
+        target_total = target_buckets.get(-1, Checksum()) + target_buckets.get(0, Checksum())
+
+        if source_total == target_total:
+            return VerificationResult(source_total, target_total, mismatches=[], queries=query_count)
+        if not key_column:
+            return VerificationResult(source_total, target_total, queries=query_count,
+                                      mismatches=[Mismatch(None, None, None, source_total, target_total)])
+
+        mismatches = []
+        if source_buckets.get(-1, Checksum()) != target_buckets.get(-1, Checksum()):
+            mismatches.append(Mismatch(key_column, None, None, source_buckets.get(-1, Checksum()),
+                                       target_buckets.get(-1, Checksum())))
+
+        ranges = []
+        if source_buckets.get(0, Checksum()) != target_buckets.get(0, Checksum()):
+            keys = source_buckets.get(0, Checksum()) + target_buckets.get(0, Checksum())
+            ranges.append((keys.min_key, keys.max_key))
+        depth = 0
+        while ranges:
+            depth += 1
+            split = [(low, high, _bucket_width(low, high, buckets)) for low, high in ranges]
+            results = checksums(split)
+            query_count += len(split)
+
+            ranges = []
+            for (low, high, width), (source_buckets, target_buckets) in zip(split, results):
+                for bucket in sorted(set(source_buckets) | set(target_buckets)):
+                    source, target = source_buckets.get(bucket, Checksum()), target_buckets.get(bucket, Checksum())
+                    if source != target:
+                        ranges.append((low + bucket * width, min(low + (bucket + 1) * width - 1, high),
+                                       source, target))
+
+            if depth >= max_depth or len(ranges) > max_mismatches:
+                # report the ranges as they are
+                mismatches += [Mismatch(key_column, low, high, source, target) for low, high, source, target in ranges]
+                break
+            # ranges with a single key can not be split any further
+            mismatches += [Mismatch(key_column, low, high, source, target)
+                           for low, high, source, target in ranges if low == high]
+            ranges = [(low, high) for low, high, _, _ in ranges if low != high]
+
+    return VerificationResult(source_total, target_total, mismatches=mismatches, queries=query_count)
+
+
+def checksum_query(db: typing.Union[str, dbs.DB], query: str, columns: typing.List[str], key_column: str = None,
+                   low: int = None, high: int = None, bucket_width: int = None, per_column: bool = True) -> str:
+    """
+    Returns a query that computes the checksums of a query result, optionally per key range
+
+    Args:
+        db: The database in which the query runs (determines the SQL dialect)
+        query: The query to compute the checksums of
+        columns: The columns to hash
+        key_column: An integer key column
+        low: The smallest key to include
+        high: The largest key to include
+        bucket_width: The number of keys per bucket. When given, there is one result row per bucket, otherwise
+                      a single row with the bucket 0 (and one with the bucket -1 for NULL keys).
+        per_column: Whether to compute hash sums per column
+
+    Returns:
+        A query with the columns bucket, count, row hash sum, [min key, max key,] [column hash sums]
+    """
+    if bucket_width is None:
+        bucket = f'CASE WHEN {key_column} IS NULL THEN -1 ELSE 0 END' if key_column else '0'
+    else:
+        bucket = (f'CASE WHEN {key_column} IS NULL THEN -1'
+                  f' ELSE FLOOR(({key_column} - {low}) / {bucket_width}) END')
+
+    conditions = []
+    if low is not None:
+        conditions.append(f'{key_column} >= {low}')
+    if high is not None:
+        conditions.append(f'{key_column} <= {high}')
+
+    texts = [_text(db, column) for column in columns]
+    aggregates = ['COUNT(*)', _hash_sum(db, _concat(db, texts)) if texts else '0']
+    if key_column:
+        aggregates += [f'MIN({key_column})', f'MAX({key_column})']
+    if per_column and len(columns) > 1:
+        aggregates += [_hash_sum(db, text) for text in texts]
+
+    return (f'SELECT verification_bucket, {", ".join(aggregates)}\n'
+            f'FROM (SELECT {bucket} AS verification_bucket, verification_source.*\n'
+            f'      FROM ({sql_lexer.subquery(query)}) verification_source'
+            + (f'\n      WHERE {" AND ".join(conditions)}' if conditions else '') + ') verification_buckets\n'
+            + 'GROUP BY verification_bucket')
+
+
+def _bucket_checksums(db: typing.Union[str, dbs.DB], query: str, columns: typing.List[str], key_column: str,
+                      low: int, high: int, bucket_width: int, per_column: bool) -> typing.Dict[int, Checksum]:
+    """Runs a checksum query and returns the checksums by bucket"""
+    rows = _fetch(db, checksum_query(db, query, columns, key_column=key_column, low=low, high=high,
+                                     bucket_width=bucket_width, per_column=per_column))
+    checksums = {}
+    for row in rows:
+        bucket, count, row_hash, *rest = row
+        min_key, max_key = rest[:2] if key_column else (None, None)
+        column_hashes = rest[2:] if key_column else rest
+        checksums[int(bucket)] = Checksum(count=int(count), row_hash=_int(row_hash),
+                            column_hashes=dict(zip(columns, map(_int, column_hashes))) if column_hashes else {},
+                            min_key=_int(min_key) if min_key is not None else None,
+                            max_key=_int(max_key) if max_key is not None else None)
+    return checksums
+
+
+def _bucket_width(low: int, high: int, buckets: int) -> int:
+    return max(1, math.ceil((high - low + 1) / buckets))
+
+
+def _int(value: object) -> int:
+    """Sums come as int, Decimal, float or str from the database drivers, and are NULL for no rows"""
+    return int(value) if value is not None else 0
+
+
+@functools.singledispatch
+def _fetch(db: object, query: str) -> typing.List[tuple]:
+    """Runs a query and returns all rows"""
+    with dbs.cursor_context(db) as cursor:
+        cursor.execute(query)
+        return cursor.fetchall()
+
+
+@_fetch.register(str)
+def __(alias: str, query: str) -> typing.List[tuple]:
+    return _fetch(dbs.db(alias), query)
+
+
+@_fetch.register(dbs.SQLiteDB)
+def __(db: dbs.SQLiteDB, query: str) -> typing.List[tuple]:
+    # SQLite has no MD5 function and its SUM fails on overflows, both are provided by Python
+    connection = dbs.connect(db)
+    try:
+        connection.create_aggregate('mara_db_hash_sum', 1, _HashSum)
+        return connection.execute(query).fetchall()
+    finally:
+        connection.close()
+
+
+class _HashSum:
+    """A SQLite aggregate function that sums up the hashes of texts, the result is returned as text"""
+
+    def __init__(self):
+        self.sum = 0
+
+    def step(self, text: str):
+        self.sum += _md5_int(text)
+
+    def finalize(self) -> str:
+        return str(self.sum)
+
+
+def _md5_int(text: str) -> int:
+    """The value of the first `HASH_DIGITS` hex digits of the MD5 hash of a text, as computed by the databases"""
+    return int(hashlib.md5(text.encode()).hexdigest()[:HASH_DIGITS], 16)
+
+
+@functools.singledispatch
+def _hash_sum(db: object, text: str) -> str:
+    """A SQL aggregate that sums up the first `HASH_DIGITS` hex digits of the MD5 hashes of a text expression"""
+    raise NotImplementedError(f'Please implement _hash_sum for type "{db.__class__.__name__}"')
+
+
+@_hash_sum.register(str)
+def __(alias: str, text: str) -> str:
+    return _hash_sum(dbs.db(alias), text)
+
+
+@_hash_sum.register(dbs.PostgreSQLDB)
+def __(db: dbs.PostgreSQLDB, text: str) -> str:
+    return f"SUM(('x' || SUBSTR(MD5({text}), 1, {HASH_DIGITS}))::BIT({HASH_DIGITS * 4})::BIGINT)"
+
+
+@_hash_sum.register(dbs.RedshiftDB)
+def __(db: dbs.RedshiftDB, text: str) -> str:
+    return f'SUM(STRTOL(SUBSTRING(MD5({text}), 1, {HASH_DIGITS}), 16)::DECIMAL(38, 0))'
+
+
+@_hash_sum.register(dbs.MysqlDB)
+def __(db: dbs.MysqlDB, text: str) -> str:
+    return f'SUM(CAST(CONV(SUBSTRING(MD5({text}), 1, {HASH_DIGITS}), 16, 10) AS UNSIGNED))'
+
+
+@_hash_sum.register(dbs.SQLServerDB)
+def __(db: dbs.SQLServerDB, text: str) -> str:
+    return (f"SUM(CAST(CONVERT(BIGINT, SUBSTRING(HASHBYTES('MD5', {text}), 1, {HASH_DIGITS // 2}))"
+            ' AS DECIMAL(38, 0)))')
+
+
+@_hash_sum.register(dbs.BigQueryDB)
+def __(db: dbs.BigQueryDB, text: str) -> str:
+    return (f"SUM(CAST(CAST(CONCAT('0x', SUBSTR(TO_HEX(MD5({text})), 1, {HASH_DIGITS})) AS INT64)"
+            ' AS BIGNUMERIC))')
+
+
+@_hash_sum.register(dbs.SnowflakeDB)
+def __(db: dbs.SnowflakeDB, text: str) -> str:
+    return f"SUM(TO_NUMBER(SUBSTR(MD5({text}), 1, {HASH_DIGITS}), '{'X' * HASH_DIGITS}'))"
+
+
+@_hash_sum.register(dbs.DatabricksDB)
+def __(db: dbs.DatabricksDB, text: str) -> str:
+    return f'SUM(CAST(CONV(SUBSTR(MD5({text}), 1, {HASH_DIGITS}), 16, 10) AS DECIMAL(38, 0)))'
+
+
+@_hash_sum.register(dbs.SQLiteDB)
+def __(db: dbs.SQLiteDB, text: str) -> str:
+    return f'mara_db_hash_sum({text})'
+
+
+def _text(db: typing.Union[str, dbs.DB], column: str) -> str:
+    """A SQL expression that renders a column as text, with NULL as `NULL_TEXT`"""
+    return f"COALESCE(CAST({column} AS {_text_type(db)}), '{NULL_TEXT}')"
+
+
+@functools.singledispatch
+def _text_type(db: object) -> str:
+    return 'VARCHAR'
+
+
+@_text_type.register(str)
+def __(alias: str) -> str:
+    return _text_type(dbs.db(alias))
+
+
+@_text_type.register(dbs.PostgreSQLDB)
+@_text_type.register(dbs.SQLiteDB)
+def __(db: dbs.DB) -> str:
+    return 'TEXT'
+
+
+@_text_type.register(dbs.MysqlDB)
+def __(db: dbs.MysqlDB) -> str:
+    return 'CHAR'
+
+
+@_text_type.register(dbs.SQLServerDB)
+def __(db: dbs.SQLServerDB) -> str:
+    # not NVARCHAR, so that ASCII texts are hashed as the same bytes as in other databases
+    return 'VARCHAR(MAX)'
+
+
+@_text_type.register(dbs.BigQueryDB)
+@_text_type.register(dbs.DatabricksDB)
+def __(db: dbs.DB) -> str:
+    return 'STRING'
+
+
+@functools.singledispatch
+def _concat(db: object, texts: typing.List[str]) -> str:
+    """A SQL expression that joins text expressions with '|'"""
+    return 'CONCAT(' + ", '|', ".join(texts) + ')' if len(texts) > 1 else texts[0]
+
+
+@_concat.register(str)
+def __(alias: str, texts: typing.List[str]) -> str:
+    return _concat(dbs.db(alias), texts)
+
+
+@_concat.register(dbs.SQLiteDB)
+@_concat.register(dbs.PostgreSQLDB)
+def __(db: dbs.DB, texts: typing.List[str]) -> str:
+    return " || '|' || ".join(texts)
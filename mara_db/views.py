@@ -14,6 +14,22 @@ blueprint = flask.Blueprint('mara_db', __name__, static_folder='static', templat
 
 acl_resource = acl.AclResource(name='DB Schema')
 
+# an optional blueprint that exposes the metrics of `mara_db.instrumentation` in the Prometheus text format
+metrics_blueprint = flask.Blueprint('mara_db_metrics', __name__)
+
+
+@metrics_blueprint.record_once
+def __(_):
+    from mara_db import instrumentation
+    instrumentation.add_listener(instrumentation.metrics)
+
+
+@metrics_blueprint.route('/metrics')
+def metrics_page():
+    """Database connect, execute and fetch timings per alias in the Prometheus text format"""
+    from mara_db import instrumentation
+    return flask.Response(instrumentation.metrics.prometheus_text(), mimetype='text/plain; version=0.0.4')
+
 
 def navigation_entry():
     return navigation.NavigationEntry(
@@ -26,8 +42,9 @@ def navigation_entry():
                          label=alias, icon='database',
                          description=f'The schema of the {alias} db',
                          uri_fn=lambda current_db=alias: flask.url_for('mara_db.schema_page', db_alias=current_db))
-                     for alias, db in config.databases().items()
-                     if supports_extract_schema(db)
+                     # databases are resolved when the navigation is rendered, not when it is registered
+                     for alias in dbs.aliases()
+                     if supports_extract_schema(alias)
                  ])
 
 
@@ -43,7 +60,7 @@ def index_page():
                       _.br,
                       _.span(style='color:#888')[escape(str(type(db).__name__))]
                   ]
-                  for db_alias, db in config.databases().items()]),
+                  for db_alias, db in ((db_alias, dbs.db(db_alias)) for db_alias in dbs.aliases())]),
 
         js_files=[flask.url_for('mara_db.static', filename='schema-page.js')])
 
@@ -96,9 +113,12 @@ def __(db: dbs.SQLServerDB):
 @blueprint.route('/<string:db_alias>')
 def schema_page(db_alias: str):
     """A page that visiualizes the schemas of a database"""
-    if db_alias not in config.databases():
+    if db_alias not in dbs.aliases():
         flask.abort(404, f'unkown database {db_alias}')
 
+    if not supports_extract_schema(db_alias):
+        flask.abort(404, f"could not extract schema for database {db_alias}")
+
     return response.Response(
         title=f'Schema of database {db_alias}',
         html=[bootstrap.card(sections=[
@@ -448,7 +468,7 @@ WHERE s.name IN ('%s')
 def draw_schema(db_alias: str, schemas: str):
     """Shows a chart of the tables and FK relationships in a given database and schema list"""
 
-    if db_alias not in config.databases():
+    if db_alias not in dbs.aliases():
         flask.abort(404, f'unkown database {db_alias}')
 
     if not supports_extract_schema(db_alias):
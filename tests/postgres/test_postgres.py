@@ -224,3 +224,59 @@ def test_postgres_cursor_context_legacy(postgres_db):
         cursor.execute('SELECT 1')
         row = cursor.fetchone()
         assert row[0] == 1
+
+
+def test_postgres_copy_engine(postgres_db):
+    """Copies a query result within the same database with `COPY TO STDOUT` / `COPY FROM STDIN`"""
+    from mara_db import copy_engine, dbs
+
+    with dbs.cursor_context(postgres_db) as cursor:
+        cursor.execute('DROP TABLE IF EXISTS copy_engine_target; CREATE TABLE copy_engine_target (n INT, label TEXT)')
+
+    # columns are matched by name, a trailing comment does not break the wrapping `COPY (...) TO STDOUT`
+    row_count = copy_engine.copy(postgres_db, postgres_db, 'copy_engine_target',
+                                 "SELECT 'label ' || n AS label, n FROM generate_series(1, 10000) n -- all")
+    assert row_count == 10000
+
+    with dbs.cursor_context(postgres_db) as cursor:
+        cursor.execute('SELECT COUNT(*), MAX(label) FROM copy_engine_target')
+        assert cursor.fetchone() == (10000, 'label 9999')
+
+
+def test_postgres_copy_engine_to_sqlite(postgres_db, tmp_path):
+    """Copies a query result from a server side cursor into another database type"""
+    from mara_db import copy_engine, dbs
+
+    target_db = dbs.SQLiteDB(file_name=tmp_path / 'target.db')
+    with dbs.cursor_context(target_db) as cursor:
+        cursor.execute('CREATE TABLE copy_engine_target (n INT, label TEXT)')
+
+    row_count = copy_engine.copy(postgres_db, target_db, 'copy_engine_target',
+                                 "SELECT n, 'label ' || n AS label FROM generate_series(1, 2500) n", batch_rows=1000)
+    assert row_count == 2500
+
+    with dbs.cursor_context(target_db) as cursor:
+        cursor.execute('SELECT COUNT(*), MAX(label) FROM copy_engine_target')
+        assert cursor.fetchone() == (2500, 'label 999')
+
+
+def test_postgres_shell_copy_command_binary(postgres_db):
+    """Copies numeric, timestamp and bytea values with the binary COPY format"""
+    from mara_db import dbs
+
+    with dbs.cursor_context(postgres_db) as cursor:
+        cursor.execute('DROP TABLE IF EXISTS binary_copy_target; '
+                       'CREATE TABLE binary_copy_target (n NUMERIC, t TIMESTAMPTZ, b BYTEA)')
+
+    query = "SELECT 1.5::NUMERIC, now(), '\\x00ff'::BYTEA;"
+    command = (f"printf '%s\\n' {shlex.quote(query)} \\\n"
+               + '  | ' + shell.copy_command(postgres_db, postgres_db, 'binary_copy_target',
+                                             pipe_format=formats.PostgresBinaryFormat()))
+    (exitcode, pstdout) = subprocess.getstatusoutput(command)
+    print(pstdout)
+    assert exitcode == 0
+
+    with dbs.cursor_context(postgres_db) as cursor:
+        cursor.execute('SELECT n, b FROM binary_copy_target')
+        n, b = cursor.fetchone()
+        assert str(n) == '1.5' and bytes(b) == b'\x00\xff'
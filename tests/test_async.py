@@ -0,0 +1,22 @@
+import asyncio
+
+import pytest
+
+from mara_db import dbs
+
+pytest.importorskip('aiosqlite')
+
+
+def test_async_cursor_context_sqlite(tmp_path):
+    db = dbs.SQLiteDB(file_name=tmp_path / 'test.db')
+
+    async def run():
+        async with dbs.async_cursor_context(db) as cursor:
+            await cursor.execute('CREATE TABLE foo (a INT)')
+            await cursor.execute('INSERT INTO foo VALUES (1), (2)')
+
+        async with dbs.async_cursor_context(db) as cursor:
+            await cursor.execute('SELECT a FROM foo ORDER BY a')
+            return [row[0] async for row in cursor]
+
+    assert asyncio.run(run()) == [1, 2]
@@ -0,0 +1,53 @@
+import io
+import types
+
+import pytest
+
+from mara_db import bigquery_export, dbs, formats
+
+pyarrow = pytest.importorskip('pyarrow')
+
+
+class FakeClient:
+    """Stands in for `google.cloud.bigquery.Client`"""
+
+    def query(self, query):
+        result = types.SimpleNamespace(schema=[types.SimpleNamespace(name='id'), types.SimpleNamespace(name='name')])
+        return types.SimpleNamespace(result=lambda: result, destination=None)
+
+
+class FakeReadClient:
+    """Stands in for `google.cloud.bigquery_storage.BigQueryReadClient`, each stream has one page per batch"""
+
+    def __init__(self, streams):
+        self.streams = streams
+
+    def read_rows(self, stream_name):
+        pages = [types.SimpleNamespace(to_arrow=lambda batch=batch: batch) for batch in self.streams[stream_name]]
+        return types.SimpleNamespace(rows=lambda session: types.SimpleNamespace(pages=pages))
+
+
+def test_export_query(monkeypatch):
+    batches = {
+        'stream-1': [pyarrow.RecordBatch.from_pydict({'id': [1, 2], 'name': ['a', None]})],
+        'stream-2': [pyarrow.RecordBatch.from_pydict({'id': [3], 'name': ['c,d']})],
+    }
+    monkeypatch.setattr(bigquery_export, '_create_read_session', lambda read_client, table, stream_count:
+                        types.SimpleNamespace(streams=[types.SimpleNamespace(name=name) for name in batches]))
+
+    output = io.BytesIO()
+    row_count = bigquery_export.export_query(dbs.BigQueryDB('key.json'), 'SELECT ...',
+                                             pipe_format=formats.CsvFormat(header=True, null_value_string='NULL'),
+                                             output=output, client=FakeClient(), read_client=FakeReadClient(batches))
+
+    assert row_count == 3
+    lines = output.getvalue().decode().splitlines()
+    assert lines[0] == 'id,name'
+    assert sorted(lines[1:]) == ['1,a', '2,NULL', '3,"c,d"']
+
+
+def test_serialize_for_command_line():
+    db = dbs.BigQueryDB('key.json', project='project', storage_read_streams=8)
+    deserialized = bigquery_export._deserialize(bigquery_export._serialize(db), dbs, dbs.BigQueryDB)
+    assert isinstance(deserialized, dbs.BigQueryDB)
+    assert vars(deserialized) == vars(db)
@@ -0,0 +1,40 @@
+import pytest
+
+from mara_db import config, dbs
+
+
+def test_db_resolves_only_requested_alias(monkeypatch):
+    resolved = []
+
+    def factory(alias):
+        def resolve():
+            resolved.append(alias)
+            return dbs.SQLiteDB(file_name=f'{alias}.db')
+        return resolve
+
+    monkeypatch.setattr(config, 'databases', lambda: {'lazy_a': factory('lazy_a'), 'lazy_b': factory('lazy_b')})
+    dbs.invalidate()
+
+    assert dbs.aliases() == ['lazy_a', 'lazy_b']
+    assert resolved == []
+
+    db = dbs.db('lazy_a')
+    assert dbs.db('lazy_a') is db
+    assert resolved == ['lazy_a']
+
+    dbs.invalidate('lazy_a')
+    assert dbs.db('lazy_a') is not db
+    assert resolved == ['lazy_a', 'lazy_a']
+
+    with pytest.raises(KeyError):
+        dbs.db('lazy_c')
+    dbs.invalidate()
+
+
+def test_db_cache_ttl(monkeypatch):
+    monkeypatch.setattr(config, 'databases', lambda: {'ttl_a': lambda: dbs.SQLiteDB(file_name='ttl_a.db')})
+    monkeypatch.setattr(config, 'database_cache_ttl', lambda: 0)
+    dbs.invalidate()
+
+    assert dbs.db('ttl_a') is not dbs.db('ttl_a')
+    dbs.invalidate()
@@ -0,0 +1,22 @@
+from mara_db import config, dbs, fan_out
+
+
+def test_query_databases(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'databases', lambda: {
+        'fan_out_a': dbs.SQLiteDB(file_name=tmp_path / 'a.db'),
+        'fan_out_b': dbs.SQLiteDB(file_name=tmp_path / 'b.db'),
+    })
+    dbs.db.cache_clear()
+
+    slow_query = '''
+WITH RECURSIVE numbers(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM numbers)
+SELECT COUNT(*) FROM numbers'''
+    results = fan_out.query_databases({'fan_out_a': 'SELECT 1 AS one', 'fan_out_b': slow_query}, timeout=0.5)
+
+    assert results['fan_out_a'].succeeded
+    assert results['fan_out_a'].columns == ['one']
+    assert results['fan_out_a'].rows == [(1,)]
+
+    assert not results['fan_out_b'].succeeded
+    assert isinstance(results['fan_out_b'].error, TimeoutError)
+    dbs.db.cache_clear()
@@ -0,0 +1,98 @@
+import gzip
+import io
+import json
+
+import pytest
+
+from mara_db import formats
+from mara_db.format_conversion import convert
+
+pyarrow = pytest.importorskip('pyarrow')
+
+NATIVE = b'1\tfoo\t2.5\n2\tline\\nbreak\\ttab\t\\N\n3\tNULL\t-1\n'
+
+
+def _convert(data: bytes, source_format: formats.Format, target_format: formats.Format) -> bytes:
+    output = io.BytesIO()
+    convert(io.BytesIO(data), output, source_format, target_format)
+    return output.getvalue()
+
+
+def test_native_to_text_formats():
+    # NULL from MySQL is written as \N
+    assert _convert(NATIVE, formats.NativeFormat(), formats.NativeFormat()) == NATIVE.replace(b'NULL', b'\\N')
+    assert _convert(NATIVE, formats.NativeFormat(), formats.CsvFormat(header=True, quote_char='"')).decode().splitlines() \
+           == ['"f0","f1","f2"', '"1","foo","2.5"', '"2","line', 'break\ttab",', '"3",,"-1"']
+
+    rows = [json.loads(line) for line in _convert(NATIVE, formats.NativeFormat(), formats.JsonlFormat()).splitlines()]
+    assert rows == [{'f0': '1', 'f1': 'foo', 'f2': '2.5'},
+                    {'f0': '2', 'f1': 'line\nbreak\ttab', 'f2': None},
+                    {'f0': '3', 'f1': None, 'f2': '-1'}]
+
+
+def test_csv_without_quote_char():
+    native = b'1\tSmith John\n2\t\\N\n'
+    assert _convert(native, formats.NativeFormat(), formats.CsvFormat()) == b'1,Smith John\n2,\n'
+
+    # values can not be written without quotes when they contain the delimiter
+    with pytest.raises(ValueError):
+        _convert(b'1\tSmith, John\n', formats.NativeFormat(), formats.CsvFormat())
+
+
+def test_text_is_read_as_strings_across_blocks(monkeypatch):
+    from mara_db import format_conversion
+    monkeypatch.setattr(format_conversion, 'BLOCK_SIZE', 64)
+
+    native = b''.join(b'%d\t0%d\n' % (n, n) for n in range(20)) + b'abc\t00\n'
+    rows = [json.loads(line) for line in _convert(native, formats.NativeFormat(), formats.JsonlFormat()).splitlines()]
+    assert len(rows) == 21
+    assert rows[0] == {'f0': '0', 'f1': '00'} and rows[-1] == {'f0': 'abc', 'f1': '00'}
+
+
+def test_explicit_schema():
+    schema = pyarrow.schema([('id', pyarrow.int64()), ('name', pyarrow.string()), ('amount', pyarrow.float64())])
+    output = io.BytesIO()
+    convert(io.BytesIO(NATIVE), output, formats.NativeFormat(), formats.JsonlFormat(), schema=schema)
+    assert [json.loads(line) for line in output.getvalue().splitlines()] == [
+        {'id': 1, 'name': 'foo', 'amount': 2.5}, {'id': 2, 'name': 'line\nbreak\ttab', 'amount': None},
+        {'id': 3, 'name': None, 'amount': -1.0}]
+
+
+def test_csv_to_parquet_and_back():
+    import pyarrow.parquet
+
+    csv = b'id,name,tags\n1,"a, b",\n2,,"x"\n'
+    parquet = _convert(csv, formats.CsvFormat(header=True), formats.ParquetFormat())
+    table = pyarrow.parquet.read_table(pyarrow.BufferReader(parquet))
+    assert table.schema.field('id').type == pyarrow.string()
+    assert table.to_pydict() == {'id': ['1', '2'], 'name': ['a, b', None], 'tags': [None, 'x']}
+
+    assert _convert(parquet, formats.ParquetFormat(), formats.NativeFormat()) == b'1\ta, b\t\\N\n2\t\\N\tx\n'
+
+
+def test_nested_values_are_written_as_json():
+    jsonl = b'{"id": 1, "tags": ["a", "b"], "meta": {"x": 1}}\n'
+    assert _convert(jsonl, formats.JsonlFormat(), formats.NativeFormat()) == b'1\t["a", "b"]\t{"x": 1}\n'
+
+
+def test_empty_input():
+    import pyarrow.ipc
+
+    assert _convert(b'', formats.NativeFormat(), formats.CsvFormat()) == b''
+    assert pyarrow.ipc.open_stream(_convert(b'', formats.NativeFormat(), formats.ArrowFormat())).read_all().num_rows == 0
+
+
+def test_compression():
+    output = io.BytesIO()
+    output.close = lambda: None  # keep the value readable after the compressed stream is closed
+    convert(io.BytesIO(gzip.compress(NATIVE)), output, formats.NativeFormat(compression='gzip'),
+            formats.NativeFormat(compression='gzip'))
+    assert gzip.decompress(output.getvalue()) == NATIVE.replace(b'NULL', b'\\N')
+
+
+def test_avro():
+    fastavro = pytest.importorskip('fastavro')
+
+    avro = _convert(NATIVE, formats.NativeFormat(), formats.AvroFormat())
+    assert [row['f1'] for row in fastavro.reader(io.BytesIO(avro))] == ['foo', 'line\nbreak\ttab', None]
+    assert _convert(avro, formats.AvroFormat(), formats.NativeFormat()) == NATIVE.replace(b'NULL', b'\\N')
@@ -0,0 +1,36 @@
+import gzip
+import io
+import subprocess
+import sys
+
+import pytest
+
+from mara_db import gcs_upload
+
+# writes stdin to the file given as last argument
+_upload_command = [sys.executable, '-c', 'import shutil, sys; shutil.copyfileobj(sys.stdin.buffer, open(sys.argv[1], "wb"))']
+
+
+def test_upload_chunks_gzip(tmp_path):
+    input = b''.join(f'{n}\n'.encode() for n in range(1000))
+    count = gcs_upload.upload_chunks(io.BytesIO(input), prefix=f'{tmp_path}/part-', extension='.csv',
+                                     chunk_size=1000, parallelism=3, compress=True, upload_command=_upload_command)
+
+    files = sorted(tmp_path.iterdir())
+    assert count == len(files) > 1
+    assert all(file.name.endswith('.csv.gz') for file in files)
+    chunks = [gzip.decompress(file.read_bytes()) for file in files]
+    assert all(len(chunk) <= 1000 and chunk.endswith(b'\n') for chunk in chunks)
+    assert b''.join(chunks) == input
+
+
+def test_upload_chunks_empty_input(tmp_path):
+    assert gcs_upload.upload_chunks(io.BytesIO(b'header\n'), prefix=f'{tmp_path}/part-', skip_header=True,
+                                    upload_command=_upload_command) == 1
+    assert [file.read_bytes() for file in tmp_path.iterdir()] == [b'']
+
+
+def test_upload_chunks_failure(tmp_path):
+    with pytest.raises(subprocess.CalledProcessError):
+        gcs_upload.upload_chunks(io.BytesIO(b'a\nb\nc\n'), prefix=f'{tmp_path}/part-', chunk_size=1,
+                                 upload_command=['false'])
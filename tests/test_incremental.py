@@ -0,0 +1,84 @@
+import sqlite3
+
+import pytest
+
+from mara_db import config, dbs, incremental, shell
+
+
+@pytest.fixture
+def sqlite_databases(tmp_path, monkeypatch):
+    source = dbs.SQLiteDB(file_name=tmp_path / 'source.db')
+    with sqlite3.connect(str(source.file_name)) as connection:
+        connection.execute('CREATE TABLE orders (order_id INTEGER, updated_at TEXT)')
+    monkeypatch.setattr(config, 'databases', lambda: {'source': source,
+                                                      'mara': dbs.SQLiteDB(file_name=tmp_path / 'mara.db')})
+    dbs.invalidate()
+    yield source
+    dbs.invalidate()
+
+
+def _insert_orders(source, *rows):
+    with sqlite3.connect(str(source.file_name)) as connection:
+        connection.executemany('INSERT INTO orders VALUES (?, ?)', rows)
+
+
+def _copied_rows(query):
+    with dbs.cursor_context('source') as cursor:
+        cursor.execute(query)
+        return sorted(cursor.fetchall())
+
+
+def test_prepare_and_commit(sqlite_databases):
+    query = 'SELECT * FROM orders;'
+
+    # empty source
+    assert _copied_rows(incremental.prepare('source', 'dwh.orders', query, 'order_id')) == []
+    incremental.commit('source', 'dwh.orders', query)
+    assert incremental.get_watermark('source', 'dwh.orders', query) is None
+
+    _insert_orders(sqlite_databases, (1, 'a'), (2, 'b'))
+    assert _copied_rows(incremental.prepare('source', 'dwh.orders', query, 'order_id')) == [(1, 'a'), (2, 'b')]
+
+    # the copy failed, the same rows are copied again
+    _insert_orders(sqlite_databases, (3, 'c'))
+    assert _copied_rows(incremental.prepare('source', 'dwh.orders', query, 'order_id')) == [(1, 'a'), (2, 'b'), (3, 'c')]
+    incremental.commit('source', 'dwh.orders', query)
+    assert incremental.get_watermark('source', 'dwh.orders', query) == '3'
+
+    _insert_orders(sqlite_databases, (4, 'd'))
+    assert _copied_rows(incremental.prepare('source', 'dwh.orders', ' SELECT  *\nFROM orders', 'order_id')) == [(4, 'd')]
+    incremental.commit('source', 'dwh.orders', query)
+
+    # the state is kept per target table
+    assert _copied_rows(incremental.prepare('source', 'dwh.orders_copy', query, 'order_id')) == [
+        (1, 'a'), (2, 'b'), (3, 'c'), (4, 'd')]
+
+    # a trailing line comment does not comment out the rest of the wrapping query
+    assert _copied_rows(incremental.prepare('source', 'dwh.orders_commented', 'SELECT * FROM orders -- all',
+                                            'order_id')) == [(1, 'a'), (2, 'b'), (3, 'c'), (4, 'd')]
+
+    incremental.reset_watermark('source', 'dwh.orders', query)
+    assert incremental.get_watermark('source', 'dwh.orders', query) is None
+
+    with pytest.raises(ValueError):
+        incremental.commit('source', 'dwh.orders', query)
+
+
+def test_sql_literal():
+    import datetime
+    assert incremental.sql_literal(42) == '42'
+    assert incremental.sql_literal(datetime.datetime(2024, 1, 2, 3, 4, 5)) == "'2024-01-02 03:04:05'"
+    assert incremental.sql_literal("it's") == "'it''s'"
+
+
+def test_incremental_copy_command(monkeypatch):
+    monkeypatch.setattr(config, 'databases', lambda: {'source': dbs.PostgreSQLDB(database='crm')})
+    dbs.invalidate()
+    command = shell.incremental_copy_command('source', dbs.PostgreSQLDB(database='dwh'), 'dwh.orders',
+                                             'SELECT * FROM orders', watermark_column='updated_at')
+    assert 'mara_db.incremental prepare --source-db=source --target-table=dwh.orders --watermark-column=updated_at' in command
+    assert command.rstrip(' )').endswith('mara_db.incremental commit --source-db=source --target-table=dwh.orders')
+
+    with pytest.raises(ValueError):
+        shell.incremental_copy_command(dbs.PostgreSQLDB(database='crm'), 'source', 'orders', 'SELECT 1', 'id')
+    dbs.invalidate()
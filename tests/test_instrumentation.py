@@ -0,0 +1,42 @@
+from mara_db import config, dbs, instrumentation
+
+
+def test_instrumentation(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'databases', lambda: {'instrumented': dbs.SQLiteDB(file_name=tmp_path / 'test.db')})
+    dbs.db.cache_clear()
+
+    events = []
+    aggregator = instrumentation.MetricsAggregator()
+    instrumentation.add_listener(events.append)
+    instrumentation.add_listener(aggregator)
+    try:
+        with dbs.cursor_context('instrumented') as cursor:
+            cursor.execute("SELECT 'abc' UNION ALL SELECT 'de'")
+            assert cursor.fetchall() == [('abc',), ('de',)]
+            try:
+                cursor.execute('SELECT * FROM missing_table')
+            except Exception:
+                pass
+    finally:
+        instrumentation.remove_listener(events.append)
+        instrumentation.remove_listener(aggregator)
+        dbs.db.cache_clear()
+
+    assert [event.kind for event in events] == ['connect', 'execute', 'fetch', 'error']
+    assert all(event.alias == 'instrumented' for event in events)
+    assert events[2].rows == 2
+    assert events[2].bytes == 5
+
+    text = aggregator.prometheus_text()
+    assert 'mara_db_execute_duration_seconds_count{alias="instrumented"} 1' in text
+    assert 'mara_db_fetched_rows_total{alias="instrumented"} 2' in text
+    assert 'mara_db_errors_total{alias="instrumented"} 1' in text
+
+
+def test_histogram():
+    histogram = instrumentation.Histogram(buckets=[1, 10])
+    histogram.observe(0.5)
+    histogram.observe(5)
+    histogram.observe(50)
+    assert histogram.counts == [1, 2]
+    assert histogram.count == 3
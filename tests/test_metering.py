@@ -0,0 +1,34 @@
+import io
+import json
+import subprocess
+import sys
+
+from mara_db import config, dbs, metering, shell
+
+
+def test_meter_copy():
+    reports = []
+    meter = metering.Meter(label='orders', interval=60, callback=reports.append)
+    input = b''.join(f'{n},name {n}\n'.encode() for n in range(100000))
+    output = io.BytesIO()
+
+    assert meter.copy(io.BytesIO(input), output, buffer_size=4096) == len(input)
+    assert output.getvalue() == input
+
+    [report] = reports  # the final report
+    assert report['finished'] and report['label'] == 'orders'
+    assert report['bytes'] == len(input) and report['rows'] == 100000
+    assert 'orders: ' in metering.format_statistics(report)
+
+
+def test_metering_command(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'copy_metering', lambda: True)
+    monkeypatch.setattr(config, 'copy_metering_stats_file', lambda: str(tmp_path / '{target_table}.json'))
+
+    command = shell.copy_command(dbs.PostgreSQLDB(database='crm'), dbs.PostgreSQLDB(database='dwh'), 'orders')
+    stage = shell._metering_command('orders')
+    assert stage in command
+
+    subprocess.run(['bash', '-c', stage.lstrip(' \\\n|')], input=b'1\n2\n3\n', capture_output=True, check=True)
+    statistics = json.loads((tmp_path / 'orders.json').read_text())
+    assert statistics['finished'] and statistics['rows'] == 3 and statistics['bytes'] == 6
@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+from mara_db import dbs, pool
+
+
+def _sqlite_factory(file_name):
+    return lambda: sqlite3.connect(str(file_name), check_same_thread=False)
+
+
+def test_pool_reuses_connections(tmp_path):
+    connection_pool = pool.ConnectionPool(_sqlite_factory(tmp_path / 'test.db'), max_size=2)
+
+    connection = connection_pool.checkout()
+    raw_connection = connection._connection
+    connection.close()
+
+    connection = connection_pool.checkout()
+    assert connection._connection is raw_connection
+    connection.close()
+
+
+def test_pool_max_size(tmp_path):
+    connection_pool = pool.ConnectionPool(_sqlite_factory(tmp_path / 'test.db'), max_size=1, checkout_timeout=0.1)
+
+    connection = connection_pool.checkout()
+    with pytest.raises(TimeoutError):
+        connection_pool.checkout()
+    connection.close()
+
+    connection_pool.checkout().close()
+
+
+def test_pool_evicts_idle_connections(tmp_path):
+    connection_pool = pool.ConnectionPool(_sqlite_factory(tmp_path / 'test.db'), min_size=1, max_idle_time=0.01)
+
+    first, second = connection_pool.checkout(), connection_pool.checkout()
+    first.close()
+    second.close()
+    assert connection_pool._size == 2
+
+    time.sleep(0.02)
+    connection_pool.checkout().close()
+    assert connection_pool._size == 1
+
+
+def test_pool_pre_ping_replaces_dead_connections(tmp_path):
+    connection_pool = pool.ConnectionPool(_sqlite_factory(tmp_path / 'test.db'))
+
+    connection = connection_pool.checkout()
+    raw_connection = connection._connection
+    connection.close()
+    raw_connection.close()  # simulates a connection dropped by the server
+
+    connection = connection_pool.checkout()
+    assert connection._connection is not raw_connection
+    connection.close()
+
+
+class PooledSQLiteDB(dbs.SQLiteDB):
+    pass
+
+
+@dbs.connect.register(PooledSQLiteDB)
+@dbs._poolable
+def __(db, **kargs):
+    return sqlite3.connect(database=db.file_name, check_same_thread=False)
+
+
+def test_cursor_context_uses_pool(tmp_path, monkeypatch):
+    from mara_db import config
+    monkeypatch.setattr(config, 'connection_pooling', lambda: True)
+
+    db = PooledSQLiteDB(file_name=tmp_path / 'test.db')
+    try:
+        with dbs.cursor_context(db) as cursor:
+            cursor.execute('CREATE TABLE foo (a INT)')
+            cursor.execute('INSERT INTO foo VALUES (1)')
+
+        with dbs.cursor_context(db) as cursor:
+            cursor.execute('SELECT a FROM foo')
+            assert cursor.fetchall() == [(1,)]
+
+        assert pool._pools[pool._cache_key(db)]._size == 1
+        assert isinstance(dbs.connect(db), pool.PooledConnection)
+        assert not isinstance(dbs.connect(db, pooled=False), pool.PooledConnection)
+    finally:
+        pool.dispose(db)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_pool_discards_parent_connections_after_fork(tmp_path):
+    connection_pool = pool.ConnectionPool(_sqlite_factory(tmp_path / 'test.db'))
+    idle = connection_pool.checkout()
+    checked_out = connection_pool.checkout()
+    parent_connection = checked_out._connection
+    idle.close()
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            # the connection of the parent must neither be reused nor closed in the child
+            checked_out.close()
+            assert not connection_pool._idle and connection_pool._size == 0
+            connection = connection_pool.checkout()
+            assert connection._connection is not parent_connection
+            connection.close()
+            assert connection_pool._size == 1
+        except BaseException:
+            os._exit(1)
+        os._exit(0)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+
+    checked_out.close()
+    assert connection_pool._size == 2 and len(connection_pool._idle) == 2
+
+
+def test_pools_are_shared_by_equal_configurations(tmp_path):
+    first, second = dbs.SQLiteDB(file_name=tmp_path / 'test.db'), dbs.SQLiteDB(file_name=tmp_path / 'test.db')
+    factory = _sqlite_factory(tmp_path / 'test.db')
+    try:
+        assert pool.connection_pool(first, factory) is pool.connection_pool(second, factory)
+
+        # a changed configuration gets a new pool
+        second.file_name = tmp_path / 'other.db'
+        assert pool.connection_pool(first, factory) is not pool.connection_pool(second, factory)
+    finally:
+        pool.dispose(first)
+        pool.dispose(second)
@@ -0,0 +1,41 @@
+from mara_db import dbs, query_cache
+
+
+def test_query_cache(tmp_path):
+    db = dbs.SQLiteDB(file_name=tmp_path / 'test.db')
+    with dbs.cursor_context(db) as cursor:
+        cursor.execute('CREATE TABLE foo (a INT)')
+        cursor.execute('INSERT INTO foo VALUES (1)')
+
+    cache = query_cache.QueryCache()
+    assert cache.fetchall(db, 'SELECT a FROM foo') == [(1,)]
+
+    with dbs.cursor_context(db) as cursor:
+        cursor.execute('INSERT INTO foo VALUES (2)')
+
+    # differently formatted query hits the cache
+    assert cache.fetchall(db, 'SELECT a\n  FROM foo;') == [(1,)]
+    assert cache.fetchall(db, 'SELECT a FROM foo WHERE a > ?', (0,)) == [(1,), (2,)]
+    assert cache.fetchall(db, 'SELECT a FROM foo', ttl=0) == [(1,)]
+    assert cache.statistics()['hits'] == 2
+    assert cache.statistics()['misses'] == 2
+
+
+def test_normalize_query():
+    assert query_cache.normalize_query("SELECT  'a  b'\n FROM foo ;") == "SELECT 'a  b' FROM foo"
+
+
+def test_query_cache_eviction_and_spill(tmp_path):
+    cache = query_cache.QueryCache(max_bytes=100, file_name=tmp_path / 'cache.db')
+    cache.set('a', [('x' * 40,)])
+    cache.set('b', [('y' * 40,)])
+    cache.set('c', [('z' * 40,)])
+
+    assert 'a' not in cache._entries
+    assert cache.statistics()['bytes'] <= 100
+
+    assert cache.get('a') == [('x' * 40,)]
+    assert cache.disk_hits == 1
+
+    cache.set('expired', [(1,)], ttl=-1)
+    assert cache.get('expired') is None
@@ -0,0 +1,358 @@
+import gzip
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from mara_db import dbs, formats, shell
+
+
+def test_parallel_copy_command(tmp_path, monkeypatch):
+    # replaces the copy of a partition with writing the partition query to a file
+    monkeypatch.setattr(shell, 'copy_command', lambda source_db, target_db, target_table, **_:
+                        f'cat >> {tmp_path}/{target_table}.sql')
+
+    command = shell.parallel_copy_command('source', 'target', 'copied', 'SELECT * FROM foo;',
+                                          partitions=shell.modulo_partitions(dbs.SQLiteDB(file_name='test.db'), 'id', 3), parallelism=2)
+    assert subprocess.run(['bash', '-c', command]).returncode == 0
+
+    queries = sorted(line for file in tmp_path.glob('copied.sql') for line in file.read_text().splitlines())
+    assert queries == ['SELECT * FROM (SELECT * FROM foo) partition_source WHERE (ABS(id % 3) = 0 OR id IS NULL)',
+                       'SELECT * FROM (SELECT * FROM foo) partition_source WHERE ABS(id % 3) = 1',
+                       'SELECT * FROM (SELECT * FROM foo) partition_source WHERE ABS(id % 3) = 2']
+
+
+def test_parallel_copy_command_fails_when_a_partition_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(shell, 'copy_command', lambda source_db, target_db, target_table, **_:
+                        f'grep -qv fail && mktemp -p {tmp_path}')
+
+    command = shell.parallel_copy_command('source', 'target', 'copied', 'SELECT * FROM foo',
+                                          partitions=['a = 1', 'a = 2', "a = 'fail'"], parallelism=3)
+    assert subprocess.run(['bash', '-c', command]).returncode != 0
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_parallel_copy_command_continues_lane_after_failed_partition(tmp_path, monkeypatch):
+    monkeypatch.setattr(shell, 'copy_command', lambda source_db, target_db, target_table, **_:
+                        f'grep -qv fail && mktemp -p {tmp_path}')
+
+    command = shell.parallel_copy_command('source', 'target', 'copied', 'SELECT * FROM foo -- all rows',
+                                          partitions=["a = 'fail'", 'a = 1', 'a = 2'], parallelism=1)
+    assert subprocess.run(['bash', '-c', command]).returncode != 0
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_range_partitions():
+    assert shell.range_partitions('d', ['2022-01-01', "it's"]) == [
+        "(d < '2022-01-01' OR d IS NULL)", "d >= '2022-01-01' AND d < 'it''s'", "d >= 'it''s'"]
+
+
+def test_compressed_copy_to_stdout(tmp_path):
+    if not shutil.which('sqlite3'):
+        pytest.skip('sqlite3 command line client not installed')
+
+    db = dbs.SQLiteDB(file_name=tmp_path / 'test.db')
+    with dbs.cursor_context(db) as cursor:
+        cursor.execute('CREATE TABLE names (id INT, name TEXT)')
+        cursor.executemany('INSERT INTO names VALUES (?, ?)', [(1, 'Elinor'), (2, 'Marianne')])
+
+    command = shell.copy_to_stdout_command(db, pipe_format=formats.CsvFormat(compression='gzip'))
+    output = subprocess.run(['bash', '-c', command], input=b'SELECT id, name FROM names ORDER BY id',
+                            stdout=subprocess.PIPE, check=True).stdout
+    assert gzip.decompress(output) == b"1,'Elinor'\n2,'Marianne'\n"
+
+
+def test_decompressed_copy_from_stdin():
+    command = shell.copy_from_stdin_command(dbs.PostgreSQLDB(database='dwh'), 'names',
+                                            pipe_format=formats.JsonlFormat(compression='zstd'))
+    assert command.startswith('zstd -q -d -c \\\n  | ')
+
+
+def test_postgres_binary_copy_command():
+    command = shell.copy_command(dbs.PostgreSQLDB(database='source'), dbs.PostgreSQLDB(database='target'), 'names',
+                                 pipe_format=formats.PostgresBinaryFormat())
+    assert 'TO STDOUT WITH (FORMAT binary)' in command
+    assert '--command="COPY names FROM STDIN WITH (FORMAT binary)"' in command
+    assert "sed '/^$/d'" not in command
+
+
+def _fake_redshift_tools(tmp_path, psql_exit_code=0):
+    """Puts `aws` (backed by a local folder) and `psql` (snapshots the staged files) stand-ins on the PATH"""
+    bin_path = tmp_path / 'bin'
+    bin_path.mkdir()
+    (bin_path / 'aws').write_text(f'''#!/bin/bash
+# aws s3 cp - s3://<key> | aws s3 rm [--recursive] [--quiet] s3://<key>
+key="${{@: -1}}"
+file="{tmp_path}/s3/${{key#s3://}}"
+case "$2" in
+  cp) mkdir -p "$(dirname "$file")" && cat > "$file" ;;
+  rm) rm -rf "$file" ;;
+esac
+''')
+    (bin_path / 'psql').write_text(f'''#!/bin/bash
+cp -r {tmp_path}/s3 {tmp_path}/loaded
+exit {psql_exit_code}
+''')
+    for tool in ['aws', 'psql']:
+        (bin_path / tool).chmod(0o755)
+    return f'{bin_path}:' + os.environ['PATH']
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_redshift_split_copy_from_stdin(tmp_path, compression):
+    db = dbs.RedshiftDB(database='dwh', aws_s3_bucket_name='bucket', copy_file_count=3)
+    command = shell.copy_from_stdin_command(db, 'names',
+                                            pipe_format=formats.CsvFormat(header=True, compression=compression))
+    input = ''.join(f'{n},name {n}\n' for n in range(10))
+    if compression:
+        input = gzip.compress(('id,name\n' + input).encode())
+    else:
+        input = ('id,name\n' + input).encode()
+
+    result = subprocess.run(['bash', '-c', command], input=input, env={'PATH': _fake_redshift_tools(tmp_path)})
+    assert result.returncode == 0
+
+    [staging_folder] = (tmp_path / 'loaded' / 'bucket').iterdir()
+    manifest, *files = sorted(staging_folder.iterdir())
+    assert [file.name for file in files] == [f'part-0{i}{".gz" if compression else ""}' for i in range(3)]
+    assert [entry['url'].split('/')[-1] for entry in json.loads(manifest.read_text())['entries']] \
+           == [file.name for file in files]
+
+    lines = [line for file in files
+             for line in (gzip.decompress(file.read_bytes()) if compression else file.read_bytes()).decode().splitlines()]
+    assert sorted(lines) == sorted(f'{n},name {n}' for n in range(10))
+
+    # staged files are removed
+    assert not list((tmp_path / 's3' / 'bucket').iterdir())
+
+
+def test_redshift_split_copy_from_stdin_cleans_up_on_failure(tmp_path):
+    db = dbs.RedshiftDB(database='dwh', aws_s3_bucket_name='bucket', copy_file_count=2)
+    command = shell.copy_from_stdin_command(db, 'names', pipe_format=formats.CsvFormat())
+
+    result = subprocess.run(['bash', '-c', command], input=b'1,a\n2,b\n',
+                            env={'PATH': _fake_redshift_tools(tmp_path, psql_exit_code=3)})
+    assert result.returncode != 0
+    assert not list((tmp_path / 's3' / 'bucket').iterdir())
+
+
+def _fake_gcs_tools(tmp_path, bq_exit_code=0):
+    """Puts `gsutil` (backed by a local folder) and `bq` (snapshots the staged objects) stand-ins on the PATH"""
+    bin_path = tmp_path / 'bin'
+    bin_path.mkdir()
+    (bin_path / 'gsutil').write_text(f'''#!/bin/bash
+# gsutil -q cp - gs://<key> | gsutil -q -m rm -r gs://<prefix>
+key="${{@: -1}}"
+file="{tmp_path}/gcs/${{key#gs://}}"
+case " $* " in
+  *" cp "*) mkdir -p "$(dirname "$file")" && cat > "$file" ;;
+  *" rm "*) rm -r "$file" ;;
+esac
+''')
+    (bin_path / 'bq').write_text(f'''#!/bin/bash
+echo "$@" > {tmp_path}/bq_arguments
+cp -r {tmp_path}/gcs {tmp_path}/loaded
+exit {bq_exit_code}
+''')
+    for tool in ['gsutil', 'bq']:
+        (bin_path / tool).chmod(0o755)
+    return f'{bin_path}:' + os.environ['PATH']
+
+
+@pytest.fixture
+def fake_bigquery_credentials(monkeypatch):
+    import sys
+    import types
+    credentials = types.SimpleNamespace(service_account_email='loader@example.com')
+    monkeypatch.setitem(sys.modules, 'mara_db.bigquery',
+                        types.SimpleNamespace(bigquery_credentials=lambda db: credentials))
+
+
+@pytest.mark.parametrize('bq_exit_code', [0, 1])
+def test_bigquery_chunked_copy_from_stdin(tmp_path, fake_bigquery_credentials, bq_exit_code):
+    db = dbs.BigQueryDB('key.json', dataset='dwh', gcloud_gcs_bucket_name='bucket',
+                        gcs_upload_chunk_size=20, gcs_upload_parallelism=2)
+    command = shell.copy_from_stdin_command(db, 'names', skip_header=True, delimiter_char=',')
+
+    input = 'id,name\n' + ''.join(f'{n},name {n}\n' for n in range(10))
+    result = subprocess.run(['bash', '-c', command], input=input.encode(),
+                            env={'PATH': _fake_gcs_tools(tmp_path, bq_exit_code)})
+    assert (result.returncode == 0) == (bq_exit_code == 0)
+
+    [staging_folder] = (tmp_path / 'loaded' / 'bucket').iterdir()
+    files = sorted(staging_folder.iterdir())
+    assert len(files) == 5  # two lines per chunk
+    assert ''.join(file.read_text() for file in files) == input[len('id,name\n'):]
+    bq_arguments = (tmp_path / 'bq_arguments').read_text()
+    assert bq_arguments.strip().endswith(f'names gs://bucket/{staging_folder.name}/part-*')
+    assert '--skip_leading_rows' not in bq_arguments
+
+    # staged objects are removed, also when the load fails
+    assert not list((tmp_path / 'gcs' / 'bucket').iterdir())
+
+
+def _fake_bcp(tmp_path, exit_code=0):
+    """Puts a `bcp` stand-in on the PATH which copies the file it loads into a folder (or fails without reading)"""
+    bin_path = tmp_path / 'bin'
+    bin_path.mkdir()
+    (tmp_path / 'loaded').mkdir()
+    (bin_path / 'bcp').write_text(f'''#!/bin/bash
+# bcp <table> in <file> <arguments>
+[ {exit_code} = 0 ] || exit {exit_code}
+cat "$3" > "$(mktemp -p {tmp_path}/loaded)"
+echo "${{@:4}}" > {tmp_path}/bcp_arguments
+''')
+    (bin_path / 'bcp').chmod(0o755)
+    return f'{bin_path}:' + os.environ['PATH']
+
+
+@pytest.mark.parametrize('bcp_parallelism', [1, 3])
+def test_sqlcmd_streaming_copy_from_stdin(tmp_path, bcp_parallelism):
+    db = dbs.SqlcmdSQLServerDB(host='localhost', bcp_streaming=True, bcp_parallelism=bcp_parallelism,
+                               bcp_batch_size=1000, bcp_packet_size=32768)
+    command = shell.copy_from_stdin_command(db, 'names', pipe_format=formats.CsvFormat(header=True))
+
+    rows = [f'{n},name {n}\n' for n in range(10)]
+    subprocess.run(['bash', '-c', command], input=('id,name\r\n' + ''.join(rows)).encode(),
+                   env={'PATH': _fake_bcp(tmp_path)}, check=True, timeout=10)
+
+    files = list((tmp_path / 'loaded').iterdir())
+    assert len(files) == bcp_parallelism
+    loaded_rows = sorted(line for file in files for line in file.read_text().splitlines(keepends=True))
+    bcp_arguments = (tmp_path / 'bcp_arguments').read_text().split()
+    assert '-b 1000 -a 32768' in ' '.join(bcp_arguments)
+    if bcp_parallelism == 1:
+        assert loaded_rows == sorted(['id,name\n'] + rows) and '-F2' in bcp_arguments
+    else:
+        assert loaded_rows == sorted(rows) and 'TABLOCK' in bcp_arguments
+
+
+@pytest.mark.parametrize('bcp_parallelism', [1, 3])
+def test_sqlcmd_streaming_copy_from_stdin_failure(tmp_path, bcp_parallelism):
+    db = dbs.SqlcmdSQLServerDB(host='localhost', bcp_streaming=True, bcp_parallelism=bcp_parallelism)
+    command = shell.copy_from_stdin_command(db, 'names', pipe_format=formats.CsvFormat())
+
+    # a failing bcp that never opens its pipe does not block the pipeline
+    result = subprocess.run(['bash', '-c', command], input=b'1,a\n' * 100000,
+                            env={'PATH': _fake_bcp(tmp_path, exit_code=2)}, timeout=10)
+    assert result.returncode != 0
+
+
+def test_postgres_merge_from_stdin():
+    command = shell.merge_from_stdin_command(dbs.PostgreSQLDB(database='dwh'), 'crm.customer', key_columns=['id'],
+                                             columns=['id', 'name', 'email'],
+                                             pipe_format=formats.CsvFormat(header=True, compression='gzip'))
+    assert command.startswith('gzip -d -c \\\n  | ')
+    # everything runs in one psql session and transaction
+    assert command.count(' psql ') == 1
+    assert '--command="BEGIN; CREATE TEMPORARY TABLE customer_merge_staging ON COMMIT DROP' in command
+    assert "--command=\"COPY customer_merge_staging (id, name, email) FROM STDIN WITH CSV HEADER DELIMITER AS ','\"" in command
+    assert ('ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name, email = EXCLUDED.email'
+            ' WHERE ROW(t.name, t.email) IS DISTINCT FROM ROW(EXCLUDED.name, EXCLUDED.email); COMMIT"') in command
+
+    with pytest.raises(ValueError):
+        shell.merge_from_stdin_command(dbs.PostgreSQLDB(database='dwh'), 'crm.customer', key_columns=['customer_id'],
+                                       columns=['id', 'name'])
+
+
+def test_mysql_merge_from_stdin():
+    command = shell.merge_from_stdin_command(dbs.MysqlDB(database='dwh'), 'customer', key_columns=['id'],
+                                             columns=['id', 'name'], pipe_format=formats.NativeFormat())
+    assert "LOAD DATA LOCAL INFILE '\"'\"'/dev/stdin'\"'\"' INTO TABLE customer_merge_staging (id, name)" in command
+    assert 'ON DUPLICATE KEY UPDATE name = customer_merge_staging.name; COMMIT' in command
+
+
+@pytest.mark.parametrize('bcp_exit_code', [0, 1])
+def test_sqlcmd_merge_from_stdin(tmp_path, bcp_exit_code):
+    path = _fake_bcp(tmp_path, exit_code=bcp_exit_code)
+    (tmp_path / 'bin' / 'sqlcmd').write_text(f'#!/bin/bash\ncat >> {tmp_path}/statements\n')
+    (tmp_path / 'bin' / 'sqlcmd').chmod(0o755)
+
+    db = dbs.SqlcmdSQLServerDB(host='localhost', bcp_streaming=True)
+    command = shell.merge_from_stdin_command(db, 'customer', key_columns=['id'], columns=['id', 'name'],
+                                             pipe_format=formats.CsvFormat())
+    result = subprocess.run(['bash', '-c', command], input=b'1,a\n2,b\n', env={'PATH': path}, timeout=10)
+    assert (result.returncode == 0) == (bcp_exit_code == 0)
+
+    statements = (tmp_path / 'statements').read_text().splitlines()
+    assert statements[0].startswith('SELECT TOP 0 id, name INTO customer_merge_staging_')
+    if bcp_exit_code == 0:
+        assert 'MERGE INTO customer WITH (HOLDLOCK) AS t' in statements[1]
+        assert 'WHEN MATCHED AND (EXISTS (SELECT s.name EXCEPT SELECT t.name))' in statements[1]
+    # the staging table is always dropped
+    assert statements[-1].startswith('DROP TABLE IF EXISTS customer_merge_staging_')
+    assert len(statements) == (3 if bcp_exit_code == 0 else 2)
+
+
+@pytest.mark.parametrize('pipe_format', [formats.ParquetFormat(), formats.ArrowFormat()])
+def test_columnar_copy_to_stdout(tmp_path, monkeypatch, pipe_format):
+    pyarrow = pytest.importorskip('pyarrow')
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    db = dbs.SQLiteDB(file_name=tmp_path / 'test.db')
+    with dbs.cursor_context(db) as cursor:
+        cursor.execute('CREATE TABLE names (id INT, name TEXT)')
+        cursor.executemany('INSERT INTO names VALUES (?, ?)', [(n, f'name {n}' if n >= 2 else None) for n in range(5)])
+
+    monkeypatch.setattr(shell.config, 'arrow_export_batch_rows', lambda: 2)
+    command = shell.copy_to_stdout_command(db, pipe_format=pipe_format)
+    output = subprocess.run(['bash', '-c', command], input=b'SELECT id, name FROM names ORDER BY id;',
+                            stdout=subprocess.PIPE, check=True).stdout
+
+    if isinstance(pipe_format, formats.ParquetFormat):
+        parquet_file = pyarrow.parquet.ParquetFile(pyarrow.BufferReader(output))
+        assert parquet_file.metadata.num_row_groups == 3
+        table = parquet_file.read()
+    else:
+        table = pyarrow.ipc.open_stream(output).read_all()
+    assert table.column_names == ['id', 'name']
+    assert table.column('id').to_pylist() == [0, 1, 2, 3, 4]
+    # the first batch has no names, the column becomes a string column
+    assert table.column('name').to_pylist() == [None, None, 'name 2', 'name 3', 'name 4']
+
+
+def test_converting_copy_command(tmp_path, fake_bigquery_credentials):
+    pytest.importorskip('pyarrow')
+
+    sqlcmd_db = dbs.SqlcmdSQLServerDB(host='localhost', database='dwh')
+
+    # MySQL batch output is converted to CSV for SQL Server
+    command = shell.copy_command(dbs.MysqlDB(database='crm'), sqlcmd_db, 'names')
+    assert '-m mara_db.format_conversion' in command
+    assert '"class": "NativeFormat"' in command and '"class": "CsvFormat"' in command
+
+    # bcp does not know quotes, CSV from PostgreSQL is written again without quotes
+    assert '-m mara_db.format_conversion' in shell.copy_command(dbs.PostgreSQLDB(database='crm'), sqlcmd_db, 'names')
+
+    # formats that the target can read are passed on as they are, registered combinations are not changed
+    bigquery_db = dbs.BigQueryDB('key.json', dataset='dwh', gcloud_gcs_bucket_name='bucket')
+    assert 'format_conversion' not in shell.copy_command(bigquery_db, bigquery_db, 'names')
+    assert 'format_conversion' not in shell.copy_command(dbs.MysqlDB(database='crm'), bigquery_db, 'names',
+                                                          csv_format=True)
+
+    sqlite_db = dbs.SQLiteDB(file_name=tmp_path / 'test.db')
+    with dbs.cursor_context(sqlite_db) as cursor:
+        cursor.execute('CREATE TABLE names (id INT, name TEXT)')
+        cursor.executemany('INSERT INTO names VALUES (?, ?)', [(n, f'name {n}' if n else None) for n in range(3)])
+
+    # SQLite is exported as Parquet and converted to CSV
+    command = shell.copy_command(sqlite_db, sqlcmd_db, 'names')
+    subprocess.run(['bash', '-c', command], input=b'SELECT id, name FROM names ORDER BY id;',
+                   env={'PATH': _fake_bcp(tmp_path)}, check=True)
+
+    [loaded_file] = (tmp_path / 'loaded').iterdir()
+    assert loaded_file.read_text() == '0,\n1,name 1\n2,name 2\n'
+
+    with pytest.raises(ValueError):
+        shell.copy_command(sqlite_db, sqlcmd_db, 'names', pipe_format=formats.JsonlFormat())
+
+
+def test_columnar_copy_to_stdout_keeps_passwords_out_of_arguments():
+    command = shell.copy_to_stdout_command(dbs.PostgreSQLDB(database='dwh', password='secret'),
+                                           pipe_format=formats.ParquetFormat())
+    environment, arguments = command.split(' -m mara_db.arrow_export')
+    assert 'secret' in environment and 'secret' not in arguments
+    assert f'PGTZ={shell.config.default_timezone()} ' in environment
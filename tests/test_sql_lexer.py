@@ -0,0 +1,49 @@
+import subprocess
+
+import pytest
+
+from mara_db import shell, sql_lexer
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ("SELECT 'a;b' AS x; DROP TABLE y", "SELECT 'a;b' AS x"),
+    ('SELECT "a;b" FROM t -- no; end\n;', 'SELECT "a;b" FROM t -- no; end\n'),
+    ('SELECT /* ; */ $tag$ ; $$ ; $tag$ ; x', 'SELECT /* ; */ $tag$ ; $$ ; $tag$ '),
+    ("SELECT E'\\';' ; x", "SELECT E'\\';' "),
+    ("SELECT 'unterminated ;", "SELECT 'unterminated ;"),
+])
+def test_first_statement(sql, expected):
+    assert sql_lexer.first_statement(sql) == expected
+    assert ''.join(text for _, text in sql_lexer.tokenize(sql)) == sql
+
+
+def test_split_statements():
+    assert sql_lexer.split_statements("SELECT ';';\n;  -- comment\nSELECT 2") == ["SELECT ';'", '-- comment\nSELECT 2']
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ('SELECT 1 \n', 'SELECT 1;'),
+    ('SELECT 1; \n', 'SELECT 1;'),
+    ('SELECT 1; -- done', 'SELECT 1; -- done'),
+    ('SELECT 1 -- one', 'SELECT 1 -- one\n;'),
+    ("SELECT ';'", "SELECT ';';"),
+    ('  ', ''),
+])
+def test_terminate(sql, expected):
+    assert sql_lexer.terminate(sql) == expected
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ('  SELECT 1; \n', 'SELECT 1'),
+    ('SELECT 1 -- one\n;', 'SELECT 1'),
+    ('SELECT 1 -- one', 'SELECT 1'),
+    ("SELECT a -- first\n, '--' /* x */ FROM t /* y */", "SELECT a -- first\n, '--' /* x */ FROM t"),
+])
+def test_subquery(sql, expected):
+    assert sql_lexer.subquery(sql) == expected
+
+
+def test_sql_filter_command():
+    command = shell._sql_filter_command(first_statement=True, prefix='COPY (\n', suffix="\n) TO STDOUT WITH CSV  DELIMITER '\t' \n")
+    result = subprocess.run(['bash', '-c', command], input=b"SELECT ';' -- x\n; DROP TABLE y;", capture_output=True, check=True)
+    assert result.stdout == b"COPY (\nSELECT ';' -- x\n\n) TO STDOUT WITH CSV  DELIMITER '\t' \n"
@@ -0,0 +1,46 @@
+from mara_db import dbs, pool, sqlalchemy_engine
+
+
+def test_engine_is_cached(tmp_path):
+    db = dbs.SQLiteDB(file_name=tmp_path / 'test.db')
+
+    engine = sqlalchemy_engine.engine(db)
+    assert sqlalchemy_engine.engine(db) is engine
+
+    sqlalchemy_engine.invalidate(db)
+    assert sqlalchemy_engine.engine(db) is not engine
+
+    sqlalchemy_engine.invalidate()
+    assert not sqlalchemy_engine._engines
+
+
+def test_pools_are_replaced_after_fork_on_old_sqlalchemy(tmp_path, monkeypatch):
+    db = dbs.SQLiteDB(file_name=tmp_path / 'test.db')
+    engine = sqlalchemy_engine.engine(db)
+    old_pool = engine.pool
+
+    def dispose(close=None):
+        if close is not None:
+            raise TypeError("dispose() got an unexpected keyword argument 'close'")
+    monkeypatch.setattr(engine, 'dispose', dispose)
+
+    try:
+        sqlalchemy_engine._dispose_engines_after_fork()
+        assert sqlalchemy_engine.engine(db) is engine
+        assert engine.pool is not old_pool
+        assert old_pool in pool._abandoned_connections
+    finally:
+        sqlalchemy_engine.invalidate()
+
+
+def test_engines_are_shared_by_equal_configurations(tmp_path):
+    db = dbs.SQLiteDB(file_name=tmp_path / 'test.db')
+    try:
+        engine = sqlalchemy_engine.engine(db)
+        assert sqlalchemy_engine.engine(dbs.SQLiteDB(file_name=tmp_path / 'test.db')) is engine
+
+        db.file_name = tmp_path / 'other.db'
+        assert sqlalchemy_engine.engine(db) is not engine
+        assert len(sqlalchemy_engine._engines) == 2
+    finally:
+        sqlalchemy_engine.invalidate()
@@ -0,0 +1,66 @@
+import pytest
+
+from mara_db import dbs
+
+
+def test_sqlite_iter_row_batches(tmp_path):
+    db = dbs.SQLiteDB(file_name=tmp_path / 'test.db')
+    with dbs.cursor_context(db) as cursor:
+        cursor.execute('CREATE TABLE numbers (n INT)')
+        cursor.executemany('INSERT INTO numbers VALUES (?)', [(n,) for n in range(25)])
+
+    batches = list(dbs.iter_row_batches(db, 'SELECT n FROM numbers ORDER BY n', batch_rows=10))
+
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert batches[2][-1] == (24,)
+
+
+def test_sqlite_bulk_insert(tmp_path, capsys):
+    db = dbs.SQLiteDB(file_name=tmp_path / 'test.db')
+    with dbs.cursor_context(db) as cursor:
+        cursor.execute('CREATE TABLE names (id INT, name TEXT)')
+
+    row_count = dbs.bulk_insert(db, 'names', ((n, f'name {n}') for n in range(2500)), ['id', 'name'], batch_size=1000)
+
+    assert row_count == 2500
+    assert capsys.readouterr().out == ''  # the throughput goes to stderr
+    with dbs.cursor_context(db) as cursor:
+        cursor.execute('SELECT COUNT(*), MAX(name) FROM names WHERE id >= 0')
+        assert cursor.fetchone() == (2500, 'name 999')
+
+
+def test_sqlite_fetch_arrow(tmp_path):
+    pyarrow = pytest.importorskip('pyarrow')
+
+    db = dbs.SQLiteDB(file_name=tmp_path / 'test.db')
+    with dbs.cursor_context(db) as cursor:
+        cursor.execute('CREATE TABLE names (id INT, name TEXT)')
+        cursor.executemany('INSERT INTO names VALUES (?, ?)', [(1, None), (2, None), (3, 'Elinor')])
+
+    batches = list(dbs.iter_record_batches(db, 'SELECT id, name FROM names ORDER BY id', batch_rows=2))
+    assert [batch.num_rows for batch in batches] == [2, 1]
+
+    table = dbs.fetch_arrow(db, 'SELECT id, name FROM names ORDER BY id')
+    assert table.schema.field('name').type == pyarrow.string()
+    assert table.to_pydict() == {'id': [1, 2, 3], 'name': [None, None, 'Elinor']}
+
+    empty_table = dbs.fetch_arrow(db, 'SELECT id, name FROM names WHERE id > 3')
+    assert empty_table.num_rows == 0 and empty_table.column_names == ['id', 'name']
+
+
+def test_sqlite_copy_engine(tmp_path):
+    from mara_db import copy_engine
+
+    source_db, target_db = dbs.SQLiteDB(file_name=tmp_path / 'source.db'), dbs.SQLiteDB(file_name=tmp_path / 'target.db')
+    with dbs.cursor_context(source_db) as cursor:
+        cursor.execute('CREATE TABLE names (id INT, name TEXT)')
+        cursor.executemany('INSERT INTO names VALUES (?, ?)', [(n, f'name {n}') for n in range(25)])
+    with dbs.cursor_context(target_db) as cursor:
+        cursor.execute('CREATE TABLE copied_names (id INT, name TEXT)')
+
+    assert copy_engine.copy(source_db, target_db, 'copied_names', 'SELECT id, name FROM names', batch_rows=10) == 25
+    assert copy_engine.copy(source_db, target_db, 'copied_names', 'SELECT id, name FROM names WHERE id < 0') == 0
+
+    with dbs.cursor_context(target_db) as cursor:
+        cursor.execute('SELECT COUNT(*), MAX(id) FROM copied_names')
+        assert cursor.fetchone() == (25, 24)
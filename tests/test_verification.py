@@ -0,0 +1,80 @@
+import hashlib
+import sqlite3
+
+import pytest
+
+from mara_db import dbs, verification
+
+
+@pytest.fixture
+def sqlite_databases(tmp_path):
+    databases = []
+    for name in ['source', 'target']:
+        db = dbs.SQLiteDB(file_name=tmp_path / f'{name}.db')
+        with sqlite3.connect(str(db.file_name)) as connection:
+            connection.execute('CREATE TABLE customer (id INTEGER, name TEXT, email TEXT)')
+            connection.executemany('INSERT INTO customer VALUES (?, ?, ?)',
+                                   [(n, f'name {n}', f'{n}@example.com' if n % 7 else None) for n in range(1, 1001)])
+        databases.append(db)
+    return databases
+
+
+def _execute(db, statement):
+    with sqlite3.connect(str(db.file_name)) as connection:
+        connection.execute(statement)
+
+
+def _verify(source, target, **kwargs):
+    return verification.verify(source, 'SELECT * FROM customer;', target, 'SELECT * FROM customer',
+                               columns=['id', 'name', 'email'], **kwargs)
+
+
+def test_matching_copies(sqlite_databases):
+    result = _verify(*sqlite_databases, key_column='id')
+    assert result.matches and result.mismatches == []
+    assert result.source.count == 1000
+    assert result.queries == 1
+
+
+def test_changed_and_missing_rows(sqlite_databases):
+    source, target = sqlite_databases
+    _execute(target, "UPDATE customer SET email = 'changed' WHERE id = 437")
+    _execute(target, 'DELETE FROM customer WHERE id = 901')
+
+    result = _verify(source, target, key_column='id')
+    assert not result.matches
+    assert [(mismatch.low, mismatch.high) for mismatch in result.mismatches] == [(437, 437), (901, 901)]
+    assert result.mismatches[0].differing_columns == ['email']
+    assert (result.mismatches[1].source.count, result.mismatches[1].target.count) == (1, 0)
+
+
+def test_queries_with_trailing_comments(sqlite_databases):
+    result = verification.verify(sqlite_databases[0], 'SELECT * FROM customer -- all rows', sqlite_databases[1],
+                                 'SELECT * FROM customer; -- all rows', columns=['id', 'name', 'email'], key_column='id')
+    assert result.matches and result.source.count == 1000
+
+
+def test_limited_drill_down(sqlite_databases):
+    source, target = sqlite_databases
+    _execute(target, "UPDATE customer SET name = 'changed' WHERE id = 437")
+
+    mismatch, = _verify(source, target, key_column='id', buckets=10, max_depth=1).mismatches
+    assert (mismatch.low, mismatch.high) == (401, 500)
+
+
+def test_null_keys_and_no_key_column(sqlite_databases):
+    source, target = sqlite_databases
+    _execute(target, "INSERT INTO customer VALUES (NULL, 'no key', NULL)")
+
+    mismatch, = _verify(source, target, key_column='id').mismatches
+    assert (mismatch.low, mismatch.source.count, mismatch.target.count) == (None, 0, 1)
+
+    mismatch, = _verify(source, target).mismatches
+    assert (mismatch.key_column, mismatch.source.count, mismatch.target.count) == (None, 1000, 1001)
+
+
+def test_hash_sum_agrees_with_python():
+    assert verification.checksum_query(dbs.PostgreSQLDB(), 'SELECT 1 AS a', ['a']).startswith(
+        "SELECT verification_bucket, COUNT(*), SUM(('x' || SUBSTR(MD5(COALESCE(CAST(a AS TEXT), '#NULL#')), 1, 14))"
+        "::BIT(56)::BIGINT)")
+    assert verification._md5_int('a') == int(hashlib.md5(b'a').hexdigest()[:14], 16)